@@ -0,0 +1,110 @@
+"""
+Mask R-CNN
+Benchmark of the two mold_inputs() backends (config.IMAGE_RESIZE_BACKEND):
+
+skimage: utils.resize_image() + mold_image() + np.stack, as in mold_inputs().
+opencv: utils.mold_images_opencv() into a preallocated float32 batch.
+
+Also checks that both give the same windows and scales, and reports the
+largest pixel difference between the molded images.
+
+Usage (from the Mask_RCNN directory):
+
+    python benchmarks/mold_inputs_benchmark.py --height=3000 --width=4000 --batch_size=4
+"""
+
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+# Root directory of the project
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT_DIR)
+
+from mrcnn.config import Config
+from mrcnn import utils
+
+
+class BenchmarkConfig(Config):
+    NAME = "benchmark"
+
+
+def mold_skimage(images, config):
+    molded_images, windows, scales = [], [], []
+    for image in images:
+        molded_image, window, scale, padding, crop = utils.resize_image(
+            image,
+            min_dim=config.IMAGE_MIN_DIM,
+            min_scale=config.IMAGE_MIN_SCALE,
+            max_dim=config.IMAGE_MAX_DIM,
+            mode=config.IMAGE_RESIZE_MODE)
+        # Same as model.mold_image()
+        molded_images.append(molded_image.astype(np.float32) - config.MEAN_PIXEL)
+        windows.append(window)
+        scales.append(scale)
+    return np.stack(molded_images), np.array(windows), scales
+
+
+def mold_opencv(images, config, out, executor):
+    out, geometries = utils.mold_images_opencv(images, config, out=out, executor=executor)
+    windows = np.array([window for scale, resized, padding, window in geometries])
+    scales = [scale for scale, resized, padding, window in geometries]
+    return out, windows, scales
+
+
+def time_runs(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = function()
+        durations.append(time.perf_counter() - start)
+    return outputs, durations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark mold_inputs backends.")
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", default="square", help="IMAGE_RESIZE_MODE: square, pad64 or none")
+    parser.add_argument("--min_dim", type=int, default=800, help="IMAGE_MIN_DIM (a multiple of 64 for pad64)")
+    parser.add_argument("--max_dim", type=int, default=1024, help="IMAGE_MAX_DIM")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig()
+    config.IMAGE_RESIZE_MODE = args.mode
+    config.IMAGE_MIN_DIM = args.min_dim
+    config.IMAGE_MAX_DIM = args.max_dim
+
+    random_state = np.random.RandomState(0)
+    images = [random_state.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+              for _ in range(args.batch_size)]
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+    out = None
+
+    (skimage_images, skimage_windows, skimage_scales), skimage_durations = time_runs(
+        lambda: mold_skimage(images, config), args.repeat)
+
+    # The batch buffer is allocated once and reused, as it would be for a stream
+    out = np.empty(skimage_images.shape, dtype=np.float32)
+    (opencv_images, opencv_windows, opencv_scales), opencv_durations = time_runs(
+        lambda: mold_opencv(images, config, out, executor), args.repeat)
+
+    assert np.array_equal(skimage_windows, opencv_windows), "Windows differ"
+    assert skimage_scales == opencv_scales, "Scales differ"
+
+    print("Images: {} x {}x{}, mode: {}, molded shape: {}".format(
+        args.batch_size, args.height, args.width, args.mode, skimage_images.shape[1:]))
+    for name, durations in [("skimage", skimage_durations), ("opencv", opencv_durations)]:
+        print("{:8} median {:.4f}s  min {:.4f}s per batch".format(
+            name, np.median(durations), np.min(durations)))
+    print("Speed-up: {:.1f}x".format(np.median(skimage_durations) / np.median(opencv_durations)))
+    print("Windows and scales identical. Max pixel difference: {:.1f}".format(
+        np.max(np.abs(skimage_images - opencv_images))))
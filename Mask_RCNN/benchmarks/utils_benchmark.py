@@ -0,0 +1,310 @@
+"""
+Mask R-CNN
+Micro-benchmarks of the NumPy/SciPy/scikit-image hot paths of mrcnn.utils
+(and model.build_rpn_targets), on synthetic data of realistic sizes:
+261,888 anchors for a 1024x1024 input, 100 instances, 12 MP (4000x3000)
+masks. CPU only.
+
+Results are written as JSON. Given a baseline (a previous output), cases
+whose median got slower than the baseline by more than --threshold are
+reported as regressions (and the exit code is 1 with --fail_on_regression).
+
+Usage (from the Mask_RCNN directory):
+
+    # Save a baseline
+    python benchmarks/utils_benchmark.py --output=benchmarks/baseline.json
+
+    # Compare a change against it
+    python benchmarks/utils_benchmark.py --baseline=benchmarks/baseline.json
+
+    # Smaller sizes, for a quick check
+    python benchmarks/utils_benchmark.py --quick --cases=compute_overlaps,non_max_suppression
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+import numpy as np
+
+# Root directory of the project
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT_DIR)
+
+from mrcnn.config import Config
+from mrcnn import utils
+
+
+class BenchmarkConfig(Config):
+    NAME = "benchmark"
+    IMAGES_PER_GPU = 1
+
+
+############################################################
+#  Synthetic Data
+############################################################
+
+def random_boxes(random_state, count, height, width, min_size=16, max_size=512):
+    """[count, (y1, x1, y2, x2)] int32 boxes inside a height x width image."""
+    sizes = random_state.randint(min_size, max_size, (count, 2))
+    sizes = np.minimum(sizes, [height - 1, width - 1])
+    y1 = random_state.randint(0, height - sizes[:, 0])
+    x1 = random_state.randint(0, width - sizes[:, 1])
+    return np.stack([y1, x1, y1 + sizes[:, 0], x1 + sizes[:, 1]], axis=1).astype(np.int32)
+
+
+def box_masks(boxes, height, width):
+    """[height, width, N] bool masks, each filling the ellipse of its box."""
+    masks = np.zeros((height, width, len(boxes)), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(boxes):
+        yy, xx = np.ogrid[y1:y2, x1:x2]
+        cy, cx = (y1 + y2 - 1) / 2, (x1 + x2 - 1) / 2
+        ry, rx = max((y2 - y1) / 2, 1), max((x2 - x1) / 2, 1)
+        masks[y1:y2, x1:x2, i] = ((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2 <= 1
+    return masks
+
+
+def pyramid_anchors(config, image_size):
+    feature_shapes = [(int(np.ceil(image_size / stride)),) * 2 for stride in config.BACKBONE_STRIDES]
+    return utils.generate_pyramid_anchors(config.RPN_ANCHOR_SCALES,
+                                          config.RPN_ANCHOR_RATIOS,
+                                          feature_shapes,
+                                          config.BACKBONE_STRIDES,
+                                          config.RPN_ANCHOR_STRIDE)
+
+
+############################################################
+#  Cases
+############################################################
+
+# Each case: setup(sizes, random_state) returns (function, args, params)
+
+def case_compute_overlaps(sizes, random_state):
+    anchors = pyramid_anchors(BenchmarkConfig(), sizes["image_size"]).astype(np.float32)
+    gt_boxes = random_boxes(random_state, sizes["instances"], sizes["image_size"],
+                            sizes["image_size"]).astype(np.float32)
+    return utils.compute_overlaps, (anchors, gt_boxes),\
+        {"anchors": len(anchors), "boxes": len(gt_boxes)}
+
+
+def case_compute_overlaps_masks(sizes, random_state):
+    h, w = sizes["mask_shape"]
+    boxes = random_boxes(random_state, sizes["mask_instances"], h, w)
+    masks = box_masks(boxes, h, w)
+    return utils.compute_overlaps_masks, (masks, masks),\
+        {"mask_shape": [h, w], "instances": len(boxes)}
+
+
+def case_compute_overlaps_masks_packed(sizes, random_state):
+    h, w = sizes["mask_shape"]
+    boxes = random_boxes(random_state, sizes["mask_instances"], h, w)
+    masks = utils.PackedMasks.from_dense(box_masks(boxes, h, w))
+    return utils.compute_overlaps_masks, (masks, masks),\
+        {"mask_shape": [h, w], "instances": len(boxes)}
+
+
+def case_non_max_suppression(sizes, random_state):
+    config = BenchmarkConfig()
+    boxes = random_boxes(random_state, config.PRE_NMS_LIMIT, sizes["image_size"],
+                         sizes["image_size"]).astype(np.float32)
+    scores = random_state.rand(len(boxes)).astype(np.float32)
+    return utils.non_max_suppression, (boxes, scores, config.RPN_NMS_THRESHOLD),\
+        {"boxes": len(boxes), "threshold": config.RPN_NMS_THRESHOLD}
+
+
+def case_extract_bboxes(sizes, random_state):
+    h, w = sizes["mask_shape"]
+    masks = box_masks(random_boxes(random_state, sizes["mask_instances"], h, w), h, w)
+    return utils.extract_bboxes, (masks,),\
+        {"mask_shape": [h, w], "instances": masks.shape[-1]}
+
+
+def case_resize_image(sizes, random_state):
+    config = BenchmarkConfig()
+    h, w = sizes["mask_shape"]
+    image = random_state.randint(0, 256, (h, w, 3), dtype=np.uint8)
+
+    def resize_image(image):
+        return utils.resize_image(image, min_dim=config.IMAGE_MIN_DIM,
+                                  max_dim=config.IMAGE_MAX_DIM,
+                                  min_scale=config.IMAGE_MIN_SCALE,
+                                  mode=config.IMAGE_RESIZE_MODE)
+    return resize_image, (image,), {"image_shape": [h, w, 3], "max_dim": config.IMAGE_MAX_DIM}
+
+
+def case_resize_mask(sizes, random_state):
+    config = BenchmarkConfig()
+    h, w = sizes["mask_shape"]
+    masks = box_masks(random_boxes(random_state, sizes["mask_instances"], h, w), h, w)
+    scale, resized, padding, window = utils.compute_resize_geometry(
+        masks.shape, min_dim=config.IMAGE_MIN_DIM, max_dim=config.IMAGE_MAX_DIM,
+        min_scale=config.IMAGE_MIN_SCALE, mode=config.IMAGE_RESIZE_MODE)
+    return utils.resize_mask, (masks, scale, padding),\
+        {"mask_shape": [h, w], "instances": masks.shape[-1], "scale": scale}
+
+
+def case_minimize_mask(sizes, random_state):
+    config = BenchmarkConfig()
+    size = sizes["image_size"]
+    boxes = random_boxes(random_state, sizes["instances"], size, size)
+    masks = box_masks(boxes, size, size)
+    return utils.minimize_mask, (boxes, masks, config.MINI_MASK_SHAPE),\
+        {"mask_shape": [size, size], "instances": len(boxes),
+         "mini_mask_shape": list(config.MINI_MASK_SHAPE)}
+
+
+def case_expand_mask(sizes, random_state):
+    config = BenchmarkConfig()
+    size = sizes["image_size"]
+    boxes = random_boxes(random_state, sizes["instances"], size, size)
+    mini_masks = utils.minimize_mask(boxes, box_masks(boxes, size, size), config.MINI_MASK_SHAPE)
+    return utils.expand_mask, (boxes, mini_masks, (size, size, 3)),\
+        {"image_shape": [size, size], "instances": len(boxes)}
+
+
+def case_unmold_mask(sizes, random_state):
+    h, w = sizes["mask_shape"]
+    boxes = random_boxes(random_state, sizes["instances"], h, w, max_size=800)
+    masks = random_state.rand(len(boxes), 28, 28).astype(np.float32)
+
+    def unmold_masks(masks, boxes):
+        # One call per instance, as in unmold_detections()
+        for mask, box in zip(masks, boxes):
+            utils.unmold_mask(mask, box, (h, w, 3))
+    return unmold_masks, (masks, boxes), {"image_shape": [h, w], "instances": len(boxes)}
+
+
+def case_generate_pyramid_anchors(sizes, random_state):
+    config = BenchmarkConfig()
+    return pyramid_anchors, (config, sizes["image_size"]),\
+        {"image_size": sizes["image_size"],
+         "anchors": len(pyramid_anchors(config, sizes["image_size"]))}
+
+
+def case_build_rpn_targets(sizes, random_state):
+    # Needs TensorFlow and Keras (mrcnn.model)
+    from mrcnn import model as modellib
+    config = BenchmarkConfig()
+    size = sizes["image_size"]
+    anchors = pyramid_anchors(config, size)
+    gt_boxes = random_boxes(random_state, sizes["instances"], size, size)
+    gt_class_ids = np.ones(len(gt_boxes), dtype=np.int32)
+    return modellib.build_rpn_targets, ((size, size, 3), anchors, gt_class_ids, gt_boxes, config),\
+        {"anchors": len(anchors), "instances": len(gt_boxes)}
+
+
+CASES = [
+    ("compute_overlaps", case_compute_overlaps),
+    ("compute_overlaps_masks", case_compute_overlaps_masks),
+    ("compute_overlaps_masks_packed", case_compute_overlaps_masks_packed),
+    ("non_max_suppression", case_non_max_suppression),
+    ("extract_bboxes", case_extract_bboxes),
+    ("resize_image", case_resize_image),
+    ("resize_mask", case_resize_mask),
+    ("minimize_mask", case_minimize_mask),
+    ("expand_mask", case_expand_mask),
+    ("unmold_mask", case_unmold_mask),
+    ("generate_pyramid_anchors", case_generate_pyramid_anchors),
+    ("build_rpn_targets", case_build_rpn_targets),
+]
+
+# image_size: input side (anchors, mini masks). mask_shape: original image.
+# compute_overlaps_masks, extract_bboxes and resize_mask use mask_instances
+# full-size masks, 100 of them would take 1.2 GB (4.8 GB as float32).
+SIZES = {"image_size": 1024, "instances": 100, "mask_shape": (3000, 4000), "mask_instances": 10}
+QUICK_SIZES = {"image_size": 512, "instances": 20, "mask_shape": (750, 1000), "mask_instances": 5}
+
+
+############################################################
+#  Running and Comparing
+############################################################
+
+def run_case(setup, sizes, repeat, seed=0):
+    function, args, params = setup(sizes, np.random.RandomState(seed))
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return {"median": float(np.median(durations)),
+            "min": float(np.min(durations)),
+            "mean": float(np.mean(durations)),
+            "repeat": repeat,
+            "params": params}
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of (case, baseline median, median, ratio) of the cases
+    slower than the baseline by more than threshold (e.g. 0.2 = 20%).
+    """
+    regressions = []
+    for name, result in results["cases"].items():
+        if name not in baseline.get("cases", {}) or "median" not in result:
+            continue
+        before = baseline["cases"][name]["median"]
+        ratio = result["median"] / before if before > 0 else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append((name, before, result["median"], ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark mrcnn.utils hot functions.")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown of the median reported as a regression")
+    parser.add_argument("--fail_on_regression", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", default=None, help="Comma-separated case names (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes")
+    args = parser.parse_args()
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    selected = args.cases.split(",") if args.cases else [name for name, setup in CASES]
+    unknown = set(selected) - set(name for name, setup in CASES)
+    assert not unknown, "Unknown cases: {}".format(", ".join(sorted(unknown)))
+
+    results = {"environment": {"python": platform.python_version(),
+                               "numpy": np.__version__,
+                               "machine": platform.machine(),
+                               "processor": platform.processor(),
+                               "quick": args.quick},
+               "cases": {}}
+
+    for name, setup in CASES:
+        if name not in selected:
+            continue
+        try:
+            result = run_case(setup, sizes, args.repeat)
+        except ImportError as e:
+            # e.g. build_rpn_targets without TensorFlow
+            result = {"skipped": str(e)}
+            print("{:26} skipped ({})".format(name, e))
+        except Exception as e:
+            # e.g. a library version the function does not support
+            result = {"error": "{}: {}".format(type(e).__name__, e)}
+            print("{:26} error ({})".format(name, result["error"]))
+        else:
+            print("{:26} median {:9.4f}s  min {:9.4f}s".format(name, result["median"], result["min"]))
+        results["cases"][name] = result
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("quick") != args.quick:
+            print("Warning: baseline and results use different sizes (--quick)")
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print("REGRESSION {:26} {:9.4f}s -> {:9.4f}s ({:+.0%})".format(name, before, after, ratio - 1))
+        if not regressions:
+            print("No regressions above {:.0%}".format(args.threshold))
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
@@ -135,6 +135,14 @@ class Config(object):
     # Changing this requires other changes in the code. See the WIKI for more
     # details: https://github.com/matterport/Mask_RCNN/wiki
     IMAGE_CHANNEL_COUNT = 3
+    # Library used by mold_inputs() (inference only) to resize images:
+    # skimage: utils.resize_image() and mold_image(), as in training.
+    # opencv: cv2.resize straight into a preallocated float32 batch with the
+    #         mean subtracted in place. Same windows and scales, pixel values
+    #         can differ by one. "crop" mode always uses skimage.
+    IMAGE_RESIZE_BACKEND = "skimage"
+    # Threads resizing the images of a batch in the opencv backend
+    IMAGE_RESIZE_WORKERS = 4
 
     # Image mean (RGB)
     MEAN_PIXEL = np.array([123.7, 116.8, 103.9])
@@ -12,9 +12,12 @@ import random
 import datetime
 import re
 import math
+import json
 import logging
 from collections import OrderedDict
 import multiprocessing
+import threading
+import concurrent.futures
 import numpy as np
 import tensorflow as tf
 import keras
@@ -23,7 +26,7 @@ import keras.layers as KL
 import keras.engine as KE
 import keras.models as KM
 
-from mrcnn import utils
+from . import utils
 
 # Requires TensorFlow 1.3+ and Keras 2.0.8+.
 from distutils.version import LooseVersion
@@ -1835,6 +1838,16 @@ class MaskRCNN():
         self.model_dir = model_dir
         self.set_log_dir()
         self.keras_model = self.build(mode=mode, config=config)
+        # Number of real (not padding) images in the last detection batch
+        self.effective_batch_size = None
+        # Thread pool of mold_inputs_opencv(), created on first use
+        self.mold_executor = None
+        self.mold_lock = threading.Lock()
+        # Batch arrays reused by detect() from one call to the next, per
+        # thread and molded shape (see mold_buffer())
+        self.mold_buffers = threading.local()
+        # Durations of the mold, predict and unmold stages (see utils.StageTimer)
+        self.timer = utils.StageTimer(enabled=False)
 
     def build(self, mode, config):
         """Build Mask R-CNN architecture.
@@ -2058,7 +2071,7 @@ class MaskRCNN():
 
         # Add multi-GPU support.
         if config.GPU_COUNT > 1:
-            from mrcnn.parallel_model import ParallelModel
+            from .parallel_model import ParallelModel
             model = ParallelModel(model, config.GPU_COUNT)
 
         return model
@@ -2136,6 +2149,82 @@ class MaskRCNN():
         # Update the log directory
         self.set_log_dir(filepath)
 
+    @classmethod
+    def from_frozen_graph(cls, graph_path, config, model_dir):
+        """Creates an inference model from a graph written by
+        export_frozen_graph(). Skips building the Keras model and loading
+        the .h5 weights, so startup is much faster. detect() and the other
+        inference helpers work as usual.
+
+        graph_path: Path of the frozen .pb graph.
+        config: The inference config. Must match the one used for export.
+        model_dir: Directory for logs, as in the regular constructor.
+        """
+        model = cls.__new__(cls)
+        model.mode = "inference"
+        model.config = config
+        model.model_dir = model_dir
+        model.set_log_dir()
+        model.keras_model = FrozenGraphModel(graph_path)
+        model.effective_batch_size = None
+        model.mold_executor = None
+        model.mold_lock = threading.Lock()
+        model.mold_buffers = threading.local()
+        model.timer = utils.StageTimer(enabled=False)
+
+        # Check that pre and post-processing will match the graph
+        for key, value in model.keras_model.metadata["config"].items():
+            assert np.array_equal(np.asarray(getattr(config, key)), np.asarray(value)),\
+                "Config {} does not match the exported graph".format(key)
+        return model
+
+    def export_frozen_graph(self, graph_path):
+        """Writes the inference graph with the weights folded into constants,
+        so it can be loaded with from_frozen_graph() without rebuilding the
+        model in Python. Only the outputs used by detect() are kept.
+
+        A JSON file (graph_path + ".json") is written next to the graph
+        with the input and output tensor names and the config values that
+        pre-processing (mold_inputs) and post-processing (unmold_detections)
+        depend on.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        keras_model = self.keras_model
+        keras_model = keras_model.inner_model if hasattr(keras_model, "inner_model")\
+            else keras_model
+
+        inputs = [t.name for t in keras_model.inputs]
+        # detections and mrcnn_mask
+        outputs = [keras_model.outputs[0], keras_model.outputs[3]]
+        output_nodes = [t.op.name for t in outputs]
+
+        session = K.get_session()
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            session, session.graph.as_graph_def(), output_nodes)
+
+        # Fold constant sub-graphs and batch norms when the graph transform
+        # tool is available (TF 1.x builds that include it)
+        try:
+            from tensorflow.tools.graph_transforms import TransformGraph
+            graph_def = TransformGraph(
+                graph_def, [n.split(":")[0] for n in inputs], output_nodes,
+                ["fold_constants(ignore_errors=true)", "fold_batch_norms",
+                 "fold_old_batch_norms"])
+        except ImportError:
+            logging.warning("Graph transforms not available, skipping constant folding.")
+
+        tf.train.write_graph(graph_def, os.path.dirname(os.path.abspath(graph_path)),
+                             os.path.basename(graph_path), as_text=False)
+
+        metadata = {
+            "inputs": inputs,
+            "outputs": [t.name for t in outputs],
+            "config": {key: np.asarray(getattr(self.config, key)).tolist()
+                       for key in FROZEN_GRAPH_CONFIG_KEYS},
+        }
+        with open(graph_path + ".json", "w") as f:
+            json.dump(metadata, f, indent=2)
+
     def get_imagenet_weights(self):
         """Downloads ImageNet trained weights from Keras.
         Returns path to weights file.
@@ -2375,11 +2464,13 @@ class MaskRCNN():
         )
         self.epoch = max(self.epoch, epochs)
 
-    def mold_inputs(self, images):
+    def mold_inputs(self, images, out=None):
         """Takes a list of images and modifies them to the format expected
         as an input to the neural network.
         images: List of image matrices [height,width,depth]. Images can have
             different sizes.
+        out: Optional [N, h, w, 3] float32 array to write the molded images
+            into, e.g. a slice of mold_buffer().
 
         Returns 3 Numpy matrices:
         molded_images: [N, h, w, 3]. Images resized and normalized.
@@ -2387,6 +2478,45 @@ class MaskRCNN():
         windows: [N, (y1, x1, y2, x2)]. The portion of the image that has the
             original image (padding excluded).
         """
+        with self.timer.stage("mold"):
+            if self.config.IMAGE_RESIZE_BACKEND == "opencv" and \
+                    self.config.IMAGE_RESIZE_MODE != "crop":
+                return self.mold_inputs_opencv(images, out=out)
+            return self.mold_inputs_skimage(images, out=out)
+
+    def mold_buffer(self, images, buffers=None):
+        """[BATCH_SIZE, h, w, 3] float32 array to mold images into (pass a
+        slice of it as mold_inputs(out=...)), kept in the dict buffers per
+        molded shape and reused from one batch to the next. Its content is
+        overwritten by the next batch molded into it, so callers running
+        batches at the same time need their own buffers. By default, the
+        calling thread's dict in self.mold_buffers, so detect() can run on
+        several threads at once.
+
+        Returns None if the images mold to different shapes, or with
+        IMAGE_RESIZE_MODE "crop" (random crops).
+        """
+        config = self.config
+        if config.IMAGE_RESIZE_MODE == "crop":
+            return None
+        shapes = set(utils.compute_molded_shape(image.shape, config) for image in images)
+        if len(shapes) != 1:
+            return None
+        shape = (config.BATCH_SIZE,) + shapes.pop()
+        if buffers is None:
+            if not hasattr(self.mold_buffers, "buffers"):
+                self.mold_buffers.buffers = {}
+            buffers = self.mold_buffers.buffers
+        buffer = buffers.get(shape)
+        if buffer is None:
+            # setdefault, so threads molding the same batch share one array
+            buffer = buffers.setdefault(shape, np.empty(shape, dtype=np.float32))
+        return buffer
+
+    def mold_inputs_skimage(self, images, out=None):
+        """mold_inputs() with utils.resize_image() and mold_image(), the
+        same preprocessing as in training.
+        """
         molded_images = []
         image_metas = []
         windows = []
@@ -2409,13 +2539,56 @@ class MaskRCNN():
             windows.append(window)
             image_metas.append(image_meta)
         # Pack into arrays
-        molded_images = np.stack(molded_images)
+        if out is not None:
+            for i, molded_image in enumerate(molded_images):
+                out[i] = molded_image
+            molded_images = out
+        else:
+            molded_images = np.stack(molded_images)
         image_metas = np.stack(image_metas)
         windows = np.stack(windows)
         return molded_images, image_metas, windows
 
+    def mold_inputs_opencv(self, images, out=None):
+        """Same outputs as mold_inputs(), but each image is resized with
+        OpenCV straight into one float32 batch array, with the mean pixel
+        subtracted in place (see utils.mold_images_opencv()). Images are
+        processed on a thread pool of IMAGE_RESIZE_WORKERS threads.
+
+        out: Optional [N, h, w, 3] float32 array to write the molded images
+            into, e.g. reused from one batch to the next.
+        """
+        config = self.config
+        if len(images) > 1 and config.IMAGE_RESIZE_WORKERS > 1 and self.mold_executor is None:
+            with self.mold_lock:
+                if self.mold_executor is None:
+                    self.mold_executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=config.IMAGE_RESIZE_WORKERS)
+
+        molded_images, geometries = utils.mold_images_opencv(
+            images, config, out=out, executor=self.mold_executor)
+
+        image_metas = np.stack([compose_image_meta(
+            0, image.shape, molded_images.shape[1:], window, scale,
+            np.zeros([config.NUM_CLASSES], dtype=np.int32))
+            for image, (scale, resized, padding, window) in zip(images, geometries)])
+        windows = np.stack([window for scale, resized, padding, window in geometries])
+        return molded_images, image_metas, windows
+
+    def close(self):
+        """Shuts down the thread pool of mold_inputs_opencv() and drops the
+        batch arrays of mold_buffer(). The model can still be used, both are
+        made again when needed.
+        """
+        with self.mold_lock:
+            if self.mold_executor is not None:
+                self.mold_executor.shutdown(wait=True)
+                self.mold_executor = None
+        self.mold_buffers = threading.local()
+
     def unmold_detections(self, detections, mrcnn_mask, original_image_shape,
-                          image_shape, window):
+                          image_shape, window, local_masks=False, raw_masks=False,
+                          packed_masks=False):
         """Reformats the detections of one image from the format of the neural
         network output to a format suitable for use in the rest of the
         application.
@@ -2426,12 +2599,19 @@ class MaskRCNN():
         image_shape: [H, W, C] Shape of the image after resizing and padding
         window: [y1, x1, y2, x2] Pixel coordinates of box in the image where the real
                 image is excluding the padding.
+        local_masks: If True, masks are returned inside their boxes only,
+                which avoids allocating [height, width] per instance.
+        raw_masks: If True, masks are returned as the [N, height, width]
+                probabilities of mrcnn_mask, without resizing (see DetectionResult).
+        packed_masks: If True, masks are returned as utils.PackedMasks (one bit
+                per pixel), made without any full-size dense mask.
 
         Returns:
         boxes: [N, (y1, x1, y2, x2)] Bounding boxes in pixels
         class_ids: [N] Integer class IDs for each bounding box
         scores: [N] Float probability scores of the class_id
-        masks: [height, width, num_instances] Instance masks
+        masks: [height, width, num_instances] Instance masks, or if local_masks
+                is True, a list of N (box, [y2 - y1, x2 - x1] bool mask) pairs
         """
         # How many detections do we have?
         # Detections array is padded with zeros. Find the first class_id == 0.
@@ -2468,21 +2648,73 @@ class MaskRCNN():
             masks = np.delete(masks, exclude_ix, axis=0)
             N = class_ids.shape[0]
 
-        # Resize masks to original image size and set boundary threshold.
-        full_masks = []
+        if raw_masks:
+            return boxes, class_ids, scores, masks
+
+        # Resize masks to their boxes and set boundary threshold.
+        if local_masks:
+            local = [(boxes[i], utils.unmold_mask_local(masks[i], boxes[i]))
+                     for i in range(N)]
+            return boxes, class_ids, scores, local
+
+        if packed_masks:
+            packed = utils.PackedMasks.from_local(
+                original_image_shape[:2], boxes,
+                [utils.unmold_mask_local(masks[i], boxes[i]) for i in range(N)])
+            return boxes, class_ids, scores, packed
+
+        # Pasted straight into one [N, H, W] output (each instance is then a
+        # contiguous block), returned as a [H, W, N] view
+        full_masks = np.zeros((N,) + tuple(original_image_shape[:2]), dtype=np.bool_)
         for i in range(N):
-            # Convert neural network mask to full size mask
-            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape)
-            full_masks.append(full_mask)
-        full_masks = np.stack(full_masks, axis=-1)\
-            if full_masks else np.empty(original_image_shape[:2] + (0,))
+            y1, x1, y2, x2 = boxes[i]
+            utils.unmold_mask_local(masks[i], boxes[i], out=full_masks[i, y1:y2, x1:x2])
+        full_masks = np.moveaxis(full_masks, 0, -1)
 
         return boxes, class_ids, scores, full_masks
 
-    def detect(self, images, verbose=0):
+    def pad_batch(self, molded_images, image_metas):
+        """Pads molded inputs up to BATCH_SIZE with blank images, so a model
+        built for a large batch can also run the last, partial batch of a job.
+
+        molded_images: [N, h, w, 3] with N <= BATCH_SIZE
+        image_metas: [N, length of meta data]
+
+        Returns the padded molded_images and image_metas. The number of
+        real images is stored in self.effective_batch_size.
+        """
+        molded_images = np.asarray(molded_images)
+        image_metas = np.asarray(image_metas)
+        count = molded_images.shape[0]
+        assert 0 < count <= self.config.BATCH_SIZE,\
+            "Number of images must be between 1 and BATCH_SIZE"
+        self.effective_batch_size = count
+
+        pad = self.config.BATCH_SIZE - count
+        if pad:
+            # Blank images with a copy of the last meta. Their detections
+            # are never unmolded.
+            blank = np.zeros((pad,) + molded_images.shape[1:],
+                             dtype=molded_images.dtype)
+            molded_images = np.concatenate([molded_images, blank])
+            image_metas = np.concatenate(
+                [image_metas, np.repeat(image_metas[-1:], pad, axis=0)])
+        return molded_images, image_metas
+
+    def detect(self, images, verbose=0, local_masks=False, lazy=False,
+               profile=False, packed=False):
         """Runs the detection pipeline.
 
-        images: List of images, potentially of different sizes.
+        images: List of images, potentially of different sizes. Up to
+            BATCH_SIZE images; shorter lists are padded internally.
+        local_masks: If True, masks are returned as (box, local_mask) pairs
+            instead of full-size masks (see unmold_detections()).
+        lazy: If True, a DetectionResult is returned per image instead of a
+            dict. Full masks are then only built if "masks" is accessed.
+        profile: If True (or a directory), the network runs with full
+            TensorFlow tracing. See write_profile() for the outputs.
+        packed: If True, masks are returned as utils.PackedMasks, one bit
+            per pixel instead of one byte.
 
         Returns a list of dicts, one dict per image. The dict contains:
         rois: [N, (y1, x1, y2, x2)] detection bounding boxes
@@ -2491,16 +2723,80 @@ class MaskRCNN():
         masks: [H, W, N] instance binary masks
         """
         assert self.mode == "inference", "Create model in inference mode."
-        assert len(
-            images) == self.config.BATCH_SIZE, "len(images) must be equal to BATCH_SIZE"
+        assert 0 < len(images) <= self.config.BATCH_SIZE,\
+            "len(images) must be between 1 and BATCH_SIZE"
 
         if verbose:
             log("Processing {} images".format(len(images)))
             for image in images:
                 log("image", image)
 
-        # Mold inputs to format expected by the neural network
-        molded_images, image_metas, windows = self.mold_inputs(images)
+        # Mold inputs to format expected by the neural network, into the
+        # batch array of the previous calls from this thread
+        buffer = self.mold_buffer(images)
+        molded_images, image_metas, windows = self.mold_inputs(
+            images, out=None if buffer is None else buffer[:len(images)])
+
+        return self.detect_prepared(images, molded_images, image_metas, windows,
+                                    verbose=verbose, local_masks=local_masks,
+                                    lazy=lazy, profile=profile, packed=packed)
+
+    def detect_prepared(self, images, molded_images, image_metas, windows,
+                        verbose=0, local_masks=False, lazy=False, profile=False,
+                        packed=False):
+        """Runs the detection pipeline on images that were already passed
+        through mold_inputs(). Lets callers mold the next batch (e.g. on a
+        worker thread) while the current one is being predicted.
+
+        images: List of the original images, used for their shapes.
+        molded_images, image_metas, windows: Outputs of mold_inputs().
+
+        Returns a list of dicts in the same format as detect().
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        assert len(images) == len(molded_images),\
+            "Number of images and molded images must match"
+
+        detections, mrcnn_mask = self.predict_prepared(molded_images, image_metas,
+                                                       verbose=verbose,
+                                                       profile=profile)
+        # Process detections
+        results = []
+        for i, image in enumerate(images):
+            with self.timer.stage("unmold"):
+                final_rois, final_class_ids, final_scores, final_masks =\
+                    self.unmold_detections(detections[i], mrcnn_mask[i],
+                                           image.shape, molded_images[i].shape,
+                                           windows[i], local_masks=local_masks,
+                                           raw_masks=lazy, packed_masks=packed)
+            if lazy:
+                results.append(DetectionResult(final_rois, final_class_ids,
+                                               final_scores, final_masks,
+                                               image.shape))
+                continue
+            results.append({
+                "rois": final_rois,
+                "class_ids": final_class_ids,
+                "scores": final_scores,
+                "masks": final_masks,
+            })
+        return results
+
+    def predict_prepared(self, molded_images, image_metas, verbose=0, profile=False):
+        """Runs only the network on molded inputs, without unmolding.
+        Used by detect_prepared() and by pipelines that unmold on other
+        threads.
+
+        molded_images, image_metas: Outputs of mold_inputs(). Up to
+            BATCH_SIZE images.
+        profile: If True (or a directory), runs with full TensorFlow
+            tracing, see write_profile().
+
+        Returns the raw network outputs of the real (not padding) images:
+        detections: [N, DETECTION_MAX_INSTANCES, (y1, x1, y2, x2, class_id, score)]
+        mrcnn_mask: [N, DETECTION_MAX_INSTANCES, height, width, num_classes]
+        """
+        count = len(molded_images)
 
         # Validate image sizes
         # All images in a batch MUST be of the same size
@@ -2509,6 +2805,9 @@ class MaskRCNN():
             assert g.shape == image_shape,\
                 "After resizing, all images must have the same size. Check IMAGE_RESIZE_MODE and image sizes."
 
+        # Pad partial batches up to BATCH_SIZE
+        molded_images, image_metas = self.pad_batch(molded_images, image_metas)
+
         # Anchors
         anchors = self.get_anchors(image_shape)
         # Duplicate across the batch dimension because Keras requires it
@@ -2520,22 +2819,91 @@ class MaskRCNN():
             log("image_metas", image_metas)
             log("anchors", anchors)
         # Run object detection
-        detections, _, _, mrcnn_mask, _, _, _ =\
-            self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
-        # Process detections
-        results = []
-        for i, image in enumerate(images):
-            final_rois, final_class_ids, final_scores, final_masks =\
-                self.unmold_detections(detections[i], mrcnn_mask[i],
-                                       image.shape, molded_images[i].shape,
-                                       windows[i])
-            results.append({
-                "rois": final_rois,
-                "class_ids": final_class_ids,
-                "scores": final_scores,
-                "masks": final_masks,
-            })
-        return results
+        with self.timer.stage("predict"):
+            if profile:
+                detections, mrcnn_mask = self.predict_profiled(
+                    [molded_images, image_metas, anchors], profile)
+            else:
+                detections, _, _, mrcnn_mask, _, _, _ =\
+                    self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
+        return detections[:count], mrcnn_mask[:count]
+
+    def predict_profiled(self, inputs, profile):
+        """Runs the network once with full tracing and writes the profile
+        (see write_profile()). Returns detections and mrcnn_mask.
+        """
+        if isinstance(self.keras_model, FrozenGraphModel):
+            run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+            run_metadata = tf.RunMetadata()
+            outputs = self.keras_model.predict(inputs, options=run_options,
+                                               run_metadata=run_metadata)
+            detections, mrcnn_mask = outputs[0], outputs[3]
+        else:
+            model = self.keras_model
+            (detections, mrcnn_mask), run_metadata = self.run_traced(
+                [model.outputs[0], model.outputs[3]], inputs)
+        self.write_profile(run_metadata, profile)
+        return detections, mrcnn_mask
+
+    def run_traced(self, fetches, inputs):
+        """Runs fetches of the Keras model with full tracing. Goes through
+        the session, as the Keras versions allowed by Mask_RCNN/requirements.txt
+        (keras>=2.0.8) don't all pass options and run_metadata from
+        K.function on to the session.
+
+        fetches: List of tensors of the model's graph.
+        inputs: List of arrays, one per model input.
+
+        Returns the list of fetched arrays and the tf.RunMetadata.
+        """
+        model = self.keras_model
+        run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        feed_dict = dict(zip(model.inputs, inputs))
+        if model.uses_learning_phase and not isinstance(K.learning_phase(), int):
+            feed_dict[K.learning_phase()] = 0
+        outputs = K.get_session().run(fetches, feed_dict=feed_dict,
+                                      options=run_options,
+                                      run_metadata=run_metadata)
+        return outputs, run_metadata
+
+    def write_profile(self, run_metadata, profile=True):
+        """Writes the trace of a profiled run:
+
+        timeline_<time>.json: Chrome trace, open it in chrome://tracing
+        layers_<time>.txt: Time per layer and per part of the network
+            (backbone, FPN, RPN, proposals, ROIAlign, heads, detection),
+            from the sum of the op durations. Ops run in parallel, so totals
+            can exceed the wall time.
+
+        profile: Directory to write to, or True for <model_dir>/profile.
+        The summaries are also kept in self.profile_layers and
+        self.profile_groups.
+        """
+        from tensorflow.python.client import timeline
+
+        directory = profile if isinstance(profile, str) else os.path.join(self.model_dir, "profile")
+        os.makedirs(directory, exist_ok=True)
+        now = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+
+        trace = timeline.Timeline(run_metadata.step_stats)
+        timeline_path = os.path.join(directory, "timeline_{}.json".format(now))
+        with open(timeline_path, "w") as f:
+            f.write(trace.generate_chrome_trace_format())
+
+        self.profile_layers, self.profile_groups = summarize_step_stats(run_metadata.step_stats)
+
+        lines = ["{:40} {:>10} {:>6}".format("part", "ms", "ops")]
+        lines += ["{:40} {:>10.2f} {:>6}".format(*row) for row in self.profile_groups]
+        lines += ["", "{:40} {:>10} {:>6}".format("layer", "ms", "ops")]
+        lines += ["{:40} {:>10.2f} {:>6}".format(*row) for row in self.profile_layers]
+        summary_path = os.path.join(directory, "layers_{}.txt".format(now))
+        with open(summary_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+        log("Profile written to {} and {}".format(timeline_path, summary_path))
+        log("\n".join(lines[:len(self.profile_groups) + 1]))
+        return timeline_path, summary_path
 
     def detect_molded(self, molded_images, image_metas, verbose=0):
         """Runs the detection pipeline, but expect inputs that are
@@ -2552,8 +2920,8 @@ class MaskRCNN():
         masks: [H, W, N] instance binary masks
         """
         assert self.mode == "inference", "Create model in inference mode."
-        assert len(molded_images) == self.config.BATCH_SIZE,\
-            "Number of images must be equal to BATCH_SIZE"
+        assert 0 < len(molded_images) <= self.config.BATCH_SIZE,\
+            "Number of images must be between 1 and BATCH_SIZE"
 
         if verbose:
             log("Processing {} images".format(len(molded_images)))
@@ -2566,6 +2934,10 @@ class MaskRCNN():
         for g in molded_images[1:]:
             assert g.shape == image_shape, "Images must have the same size"
 
+        # Pad partial batches up to BATCH_SIZE
+        count = len(molded_images)
+        molded_images, image_metas = self.pad_batch(molded_images, image_metas)
+
         # Anchors
         anchors = self.get_anchors(image_shape)
         # Duplicate across the batch dimension because Keras requires it
@@ -2581,7 +2953,7 @@ class MaskRCNN():
             self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
         # Process detections
         results = []
-        for i, image in enumerate(molded_images):
+        for i, image in enumerate(molded_images[:count]):
             window = [0, 0, image.shape[0], image.shape[1]]
             final_rois, final_class_ids, final_scores, final_masks =\
                 self.unmold_detections(detections[i], mrcnn_mask[i],
@@ -2666,12 +3038,14 @@ class MaskRCNN():
                 layers.append(l)
         return layers
 
-    def run_graph(self, images, outputs, image_metas=None):
+    def run_graph(self, images, outputs, image_metas=None, profile=False):
         """Runs a sub-set of the computation graph that computes the given
         outputs.
 
         image_metas: If provided, the images are assumed to be already
             molded (i.e. resized, padded, and normalized)
+        profile: If True (or a directory), runs with full TensorFlow
+            tracing, see write_profile().
 
         outputs: List of tuples (name, tensor) to compute. The tensors are
             symbolic TensorFlow tensors and the names are for easy tracking.
@@ -2708,7 +3082,11 @@ class MaskRCNN():
         # Run inference
         if model.uses_learning_phase and not isinstance(K.learning_phase(), int):
             model_in.append(0.)
-        outputs_np = kf(model_in)
+        if profile:
+            outputs_np, run_metadata = self.run_traced(list(outputs.values()), model_in)
+            self.write_profile(run_metadata, profile)
+        else:
+            outputs_np = kf(model_in)
 
         # Pack the generated Numpy arrays into a a dict and log the results.
         outputs_np = OrderedDict([(k, v)
@@ -2718,6 +3096,232 @@ class MaskRCNN():
         return outputs_np
 
 
+############################################################
+#  Frozen Graph
+############################################################
+
+# Config values that the exported graph and the pre/post-processing
+# around it depend on. Stored with the graph and checked on load.
+FROZEN_GRAPH_CONFIG_KEYS = [
+    "BATCH_SIZE", "NUM_CLASSES", "IMAGE_SHAPE", "IMAGE_META_SIZE",
+    "IMAGE_RESIZE_MODE", "IMAGE_MIN_DIM", "IMAGE_MAX_DIM", "IMAGE_MIN_SCALE",
+    "MEAN_PIXEL", "BACKBONE_STRIDES", "RPN_ANCHOR_SCALES", "RPN_ANCHOR_RATIOS",
+    "RPN_ANCHOR_STRIDE", "DETECTION_MIN_CONFIDENCE", "DETECTION_MAX_INSTANCES",
+]
+
+
+class FrozenGraphModel():
+    """Runs a graph written by MaskRCNN.export_frozen_graph(). Exposes the
+    same predict() call that detect() uses on the Keras model.
+    """
+
+    def __init__(self, graph_path):
+        with open(graph_path + ".json") as f:
+            self.metadata = json.load(f)
+
+        graph_def = tf.GraphDef()
+        with open(graph_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.session = tf.Session(graph=self.graph)
+
+        self.inputs = [self.graph.get_tensor_by_name(n)
+                       for n in self.metadata["inputs"]]
+        self.outputs = [self.graph.get_tensor_by_name(n)
+                        for n in self.metadata["outputs"]]
+
+    def predict(self, inputs, verbose=0, options=None, run_metadata=None):
+        """Returns outputs in the order of the Keras inference model. Outputs
+        that are not part of the frozen graph are None.
+        options, run_metadata: Passed to Session.run(), for profiling.
+        """
+        detections, mrcnn_mask = self.session.run(
+            self.outputs, feed_dict=dict(zip(self.inputs, inputs)),
+            options=options, run_metadata=run_metadata)
+        return detections, None, None, mrcnn_mask, None, None, None
+
+
+############################################################
+#  Profiling
+############################################################
+
+# Parts of the network, by prefix of the layer names (first match wins)
+PROFILE_LAYER_GROUPS = [
+    ("proposals (ProposalLayer NMS)", ["ROI"]),
+    ("ROIAlign (PyramidROIAlign)", ["roi_align_"]),
+    ("detection (DetectionLayer NMS)", ["mrcnn_detection"]),
+    ("mask head", ["mrcnn_mask"]),
+    ("classifier head", ["mrcnn_class", "mrcnn_bbox", "pool_squeeze"]),
+    ("RPN", ["rpn_"]),
+    ("FPN", ["fpn_"]),
+    ("backbone (ResNet)", ["conv1", "bn_conv1", "res", "bn", "activation",
+                           "add", "zero_padding", "max_pooling"]),
+]
+
+
+def summarize_step_stats(step_stats):
+    """Sums the op durations of a traced run per layer (first part of the
+    op names) and per part of the network (PROFILE_LAYER_GROUPS).
+
+    Returns two lists of (name, milliseconds, op count), slowest first:
+    layers and groups.
+    """
+    layers = {}
+    for device in step_stats.dev_stats:
+        for node in device.node_stats:
+            layer = node.node_name.split("/")[0].split(":")[0]
+            # op_*_rel_micros are relative to all_start_micros, not durations
+            op_micros = node.op_end_rel_micros - node.op_start_rel_micros
+            duration, count = layers.get(layer, (0.0, 0))
+            layers[layer] = (duration + op_micros / 1000.0, count + 1)
+
+    groups = {}
+    for layer, (duration, count) in layers.items():
+        group = "other"
+        for name, prefixes in PROFILE_LAYER_GROUPS:
+            if any(layer.startswith(prefix) for prefix in prefixes):
+                group = name
+                break
+        group_duration, group_count = groups.get(group, (0.0, 0))
+        groups[group] = (group_duration + duration, group_count + count)
+
+    def rows(totals):
+        return sorted([(name, duration, count) for name, (duration, count) in totals.items()],
+                      key=lambda row: row[1], reverse=True)
+    return rows(layers), rows(groups)
+
+
+############################################################
+#  Detection Results
+############################################################
+
+class DetectionResult(object):
+    """Detections of one image, returned by detect(lazy=True). Keeps the
+    small mrcnn_mask probabilities and builds full masks, contours and crops
+    only when they are asked for (then cached).
+
+    Supports the dict access of the detect() results: r["rois"],
+    r["class_ids"], r["scores"] and r["masks"] ([H, W, N], materialized on
+    first access).
+    """
+
+    __slots__ = ("rois", "class_ids", "scores", "raw_masks", "image_shape",
+                 "_masks", "_local_masks", "_contours")
+
+    KEYS = ("rois", "class_ids", "scores", "masks")
+
+    def __init__(self, rois, class_ids, scores, raw_masks, image_shape):
+        """
+        rois: [N, (y1, x1, y2, x2)] in pixels of the original image
+        class_ids: [N]
+        scores: [N]
+        raw_masks: [N, height, width] float mask probabilities (typically
+            28x28) of each instance's class
+        image_shape: [H, W, (C)] of the original image
+        """
+        self.rois = rois
+        self.class_ids = class_ids
+        self.scores = scores
+        self.raw_masks = raw_masks
+        self.image_shape = tuple(image_shape)
+        self._masks = None
+        self._local_masks = None
+        self._contours = None
+
+    # Dict-style access, as with the dicts returned by detect()
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def keys(self):
+        return list(self.KEYS)
+
+    def items(self):
+        return [(key, self[key]) for key in self.KEYS]
+
+    def get(self, key, default=None):
+        return self[key] if key in self.KEYS else default
+
+    # Only the raw masks are pickled, the cached masks are rebuilt on demand
+
+    def __getstate__(self):
+        return (self.rois, self.class_ids, self.scores, self.raw_masks,
+                self.image_shape)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def num_instances(self):
+        return self.rois.shape[0]
+
+    @property
+    def local_masks(self):
+        """List of N (box, [y2 - y1, x2 - x1] bool mask) pairs."""
+        if self._local_masks is None:
+            self._local_masks = [
+                (self.rois[i], utils.unmold_mask_local(self.raw_masks[i], self.rois[i]))
+                for i in range(self.num_instances)]
+        return self._local_masks
+
+    @property
+    def masks(self):
+        """[H, W, N] bool masks, same as the "masks" of detect()."""
+        if self._masks is None:
+            masks = np.zeros((self.num_instances,) + self.image_shape[:2], dtype=np.bool_)
+            for i, ((y1, x1, y2, x2), local_mask) in enumerate(self.local_masks):
+                masks[i, y1:y2, x1:x2] = local_mask
+            self._masks = np.moveaxis(masks, 0, -1)
+        return self._masks
+
+    def mask(self, i):
+        """[H, W] bool mask of instance i."""
+        if self._masks is not None:
+            return self._masks[:, :, i]
+        (y1, x1, y2, x2), local_mask = self.local_masks[i]
+        mask = np.zeros(self.image_shape[:2], dtype=np.bool_)
+        mask[y1:y2, x1:x2] = local_mask
+        return mask
+
+    def contours(self, i):
+        """External contours of instance i in image coordinates, as returned
+        by cv2.findContours.
+        """
+        if self._contours is None:
+            self._contours = [None] * self.num_instances
+        if self._contours[i] is None:
+            (y1, x1, y2, x2), local_mask = self.local_masks[i]
+            found = utils.cv2.findContours(local_mask.astype(np.uint8),
+                                           utils.cv2.RETR_EXTERNAL,
+                                           utils.cv2.CHAIN_APPROX_SIMPLE,
+                                           offset=(int(x1), int(y1)))
+            # OpenCV 3 returns (image, contours, hierarchy), OpenCV 4
+            # (contours, hierarchy)
+            self._contours[i] = found[-2]
+        return self._contours[i]
+
+    def crop(self, image, i, masked=True):
+        """Box of instance i cut out of image, the original image. If masked,
+        pixels outside of the mask are set to 0.
+        """
+        (y1, x1, y2, x2), local_mask = self.local_masks[i]
+        crop = image[y1:y2, x1:x2].copy()
+        if masked:
+            crop[~local_mask] = 0
+        return crop
+
+
 ############################################################
 #  Data Formatting
 ############################################################
@@ -11,18 +11,45 @@ import sys
 import os
 import logging
 import math
+import time
+import json
 import random
+import threading
+import importlib
 import numpy as np
-import tensorflow as tf
-import scipy
-import skimage.color
-import skimage.io
-import skimage.transform
 import urllib.request
 import shutil
 import warnings
 from distutils.version import LooseVersion
 
+
+class LazyModule(object):
+    """Stands in for a module and imports it on first attribute access.
+
+    Used for TensorFlow, SciPy and scikit-image, so that importing this
+    module for the NumPy helpers (compute_overlaps, non_max_suppression,
+    box utilities, ...) doesn't load the heavy frameworks.
+    Submodules (e.g. skimage.transform) are imported on access too.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        try:
+            return getattr(self._module, attr)
+        except AttributeError:
+            return importlib.import_module(self._name + "." + attr)
+
+
+tf = LazyModule("tensorflow")
+scipy = LazyModule("scipy")
+skimage = LazyModule("skimage")
+cv2 = LazyModule("cv2")
+
 # URL from which to download the latest COCO trained weights
 COCO_MODEL_URL = "https://github.com/matterport/Mask_RCNN/releases/download/v2.0/mask_rcnn_coco.h5"
 
@@ -37,6 +64,9 @@ def extract_bboxes(mask):
 
     Returns: bbox array [num_instances, (y1, x1, y2, x2)].
     """
+    # Packed masks keep their boxes
+    if is_packed_masks(mask):
+        return mask.boxes.copy()
     boxes = np.zeros([mask.shape[-1], 4], dtype=np.int32)
     for i in range(mask.shape[-1]):
         m = mask[:, :, i]
@@ -99,8 +129,15 @@ def compute_overlaps(boxes1, boxes2):
 
 def compute_overlaps_masks(masks1, masks2):
     """Computes IoU overlaps between two sets of masks.
-    masks1, masks2: [Height, Width, instances]
+    masks1, masks2: [Height, Width, instances], or PackedMasks
     """
+    # Packed masks are compared on their packed bits (see PackedMasks.overlaps())
+    if is_packed_masks(masks1) or is_packed_masks(masks2):
+        if not is_packed_masks(masks1):
+            masks1 = PackedMasks.from_dense(masks1 > .5)
+        if not is_packed_masks(masks2):
+            masks2 = PackedMasks.from_dense(masks2 > .5)
+        return masks1.overlaps(masks2)
     
     # If either set of masks is empty return empty result
     if masks1.shape[-1] == 0 or masks2.shape[-1] == 0:
@@ -429,6 +466,37 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
     if mode == "none":
         return image, window, scale, padding, crop
 
+    scale = compute_resize_scale(h, w, min_dim, max_dim, min_scale, mode)
+
+    # Resize image using bilinear interpolation
+    if scale != 1:
+        image = resize(image, (round(h * scale), round(w * scale)),
+                       preserve_range=True)
+
+    # Need padding or cropping?
+    if mode in ["square", "pad64"]:
+        # Get new height and width
+        h, w = image.shape[:2]
+        padding, window = compute_resize_padding(h, w, min_dim, max_dim, mode)
+        image = np.pad(image, padding, mode='constant', constant_values=0)
+    elif mode == "crop":
+        # Pick a random crop
+        h, w = image.shape[:2]
+        y = random.randint(0, (h - min_dim))
+        x = random.randint(0, (w - min_dim))
+        crop = (y, x, min_dim, min_dim)
+        image = image[y:y + min_dim, x:x + min_dim]
+        window = (0, 0, min_dim, min_dim)
+    else:
+        raise Exception("Mode {} not supported".format(mode))
+    return image.astype(image_dtype), window, scale, padding, crop
+
+
+def compute_resize_scale(h, w, min_dim=None, max_dim=None, min_scale=None, mode="square"):
+    """Returns the scale resize_image() applies to an image of [h, w]."""
+    scale = 1
+    if mode == "none":
+        return scale
     # Scale?
     if min_dim:
         # Scale up but not down
@@ -441,25 +509,19 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
         image_max = max(h, w)
         if round(image_max * scale) > max_dim:
             scale = max_dim / image_max
+    return scale
 
-    # Resize image using bilinear interpolation
-    if scale != 1:
-        image = resize(image, (round(h * scale), round(w * scale)),
-                       preserve_range=True)
 
-    # Need padding or cropping?
+def compute_resize_padding(h, w, min_dim=None, max_dim=None, mode="square"):
+    """Returns the padding and window resize_image() uses for an image that
+    was already resized to [h, w], in "square" or "pad64" mode.
+    """
     if mode == "square":
-        # Get new height and width
-        h, w = image.shape[:2]
         top_pad = (max_dim - h) // 2
         bottom_pad = max_dim - h - top_pad
         left_pad = (max_dim - w) // 2
         right_pad = max_dim - w - left_pad
-        padding = [(top_pad, bottom_pad), (left_pad, right_pad), (0, 0)]
-        image = np.pad(image, padding, mode='constant', constant_values=0)
-        window = (top_pad, left_pad, h + top_pad, w + left_pad)
     elif mode == "pad64":
-        h, w = image.shape[:2]
         # Both sides must be divisible by 64
         assert min_dim % 64 == 0, "Minimum dimension must be a multiple of 64"
         # Height
@@ -476,20 +538,130 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
             right_pad = max_w - w - left_pad
         else:
             left_pad = right_pad = 0
-        padding = [(top_pad, bottom_pad), (left_pad, right_pad), (0, 0)]
-        image = np.pad(image, padding, mode='constant', constant_values=0)
-        window = (top_pad, left_pad, h + top_pad, w + left_pad)
-    elif mode == "crop":
-        # Pick a random crop
-        h, w = image.shape[:2]
-        y = random.randint(0, (h - min_dim))
-        x = random.randint(0, (w - min_dim))
-        crop = (y, x, min_dim, min_dim)
-        image = image[y:y + min_dim, x:x + min_dim]
-        window = (0, 0, min_dim, min_dim)
     else:
         raise Exception("Mode {} not supported".format(mode))
-    return image.astype(image_dtype), window, scale, padding, crop
+    padding = [(top_pad, bottom_pad), (left_pad, right_pad), (0, 0)]
+    window = (top_pad, left_pad, h + top_pad, w + left_pad)
+    return padding, window
+
+
+def compute_resize_geometry(image_shape, min_dim=None, max_dim=None, min_scale=None,
+                            mode="square"):
+    """Everything resize_image() does to an image of image_shape, without
+    touching pixels. mode: "none", "square" or "pad64".
+
+    Returns:
+    scale: The scale factor used to resize the image
+    resized_shape: (h, w) after resizing, before padding
+    padding: Padding added to the image [(top, bottom), (left, right), (0, 0)]
+    window: (y1, x1, y2, x2) of the image inside the padded image
+    """
+    h, w = image_shape[:2]
+    if mode == "none":
+        return 1, (h, w), [(0, 0), (0, 0), (0, 0)], (0, 0, h, w)
+    scale = compute_resize_scale(h, w, min_dim, max_dim, min_scale, mode)
+    if scale != 1:
+        h, w = round(h * scale), round(w * scale)
+    padding, window = compute_resize_padding(h, w, min_dim, max_dim, mode)
+    return scale, (h, w), padding, window
+
+
+def compute_molded_shape(image_shape, config):
+    """[H, W, C] shape of an image of image_shape once molded with the
+    config's IMAGE_* settings (padding included). mode "crop" is not
+    supported, see compute_resize_geometry().
+    """
+    scale, resized, padding, window = compute_resize_geometry(
+        image_shape,
+        min_dim=config.IMAGE_MIN_DIM,
+        min_scale=config.IMAGE_MIN_SCALE,
+        max_dim=config.IMAGE_MAX_DIM,
+        mode=config.IMAGE_RESIZE_MODE)
+    return (resized[0] + sum(padding[0]), resized[1] + sum(padding[1]), image_shape[2])
+
+
+def resize_image_into(image, out, scale, window, mean_pixel=0):
+    """Resizes image with OpenCV into out[window] and subtracts mean_pixel,
+    the equivalent of resize_image() followed by mold_image() but without
+    the float64 resize, np.pad and the extra copies. Pixels outside of
+    window (the padding) are set to -mean_pixel, as in the original path.
+    Pixel values may differ by one from skimage's (OpenCV rounds, the
+    original path truncates).
+
+    image: [h, w, C] uint8 image
+    out: [H, W, C] float32 array, e.g. one image of a preallocated batch
+    scale, window: from compute_resize_geometry()
+    """
+    y1, x1, y2, x2 = window
+    mean_pixel = np.asarray(mean_pixel, dtype=np.float32)
+
+    # Padding
+    out[:y1] = -mean_pixel
+    out[y2:] = -mean_pixel
+    out[y1:y2, :x1] = -mean_pixel
+    out[y1:y2, x2:] = -mean_pixel
+
+    if scale > 1:
+        # Upscaled edge pixels are blended with zeros in resize() (mode
+        # "constant"), hence the one pixel zero border
+        scale_y = image.shape[0] / (y2 - y1)
+        scale_x = image.shape[1] / (x2 - x1)
+        padded = cv2.copyMakeBorder(image, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        transform = np.array([[scale_x, 0, 0.5 * scale_x + 0.5],
+                              [0, scale_y, 0.5 * scale_y + 0.5]], dtype=np.float64)
+        image = cv2.warpAffine(padded, transform, (x2 - x1, y2 - y1),
+                               flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    elif scale != 1:
+        image = cv2.resize(image, (x2 - x1, y2 - y1), interpolation=cv2.INTER_LINEAR)
+    np.subtract(image, mean_pixel, out=out[y1:y2, x1:x2], casting="unsafe")
+    return out
+
+
+def mold_images_opencv(images, config, out=None, executor=None):
+    """Resizes and normalizes a batch of images for the network with OpenCV
+    (see resize_image_into()), writing into one float32 array.
+
+    images: List of [h, w, 3] uint8 images
+    config: The model config (IMAGE_* settings and MEAN_PIXEL)
+    out: Optional [N, H, W, 3] float32 array to write into
+    executor: Optional concurrent.futures executor to resize images in
+        parallel (OpenCV releases the GIL)
+
+    Returns:
+    out: [N, H, W, 3] molded images
+    geometries: List of (scale, resized_shape, padding, window) per image,
+        see compute_resize_geometry()
+    """
+    geometries = [compute_resize_geometry(
+        image.shape,
+        min_dim=config.IMAGE_MIN_DIM,
+        min_scale=config.IMAGE_MIN_SCALE,
+        max_dim=config.IMAGE_MAX_DIM,
+        mode=config.IMAGE_RESIZE_MODE) for image in images]
+
+    # Molded shape (padding included), the same for every image of a batch
+    molded_shapes = set(
+        (resized[0] + sum(padding[0]), resized[1] + sum(padding[1]))
+        for scale, resized, padding, window in geometries)
+    assert len(molded_shapes) == 1, "Images of a batch must mold to the same shape"
+    molded_shape = (len(images),) + molded_shapes.pop() + (images[0].shape[2],)
+
+    if out is None:
+        out = np.empty(molded_shape, dtype=np.float32)
+    assert out.shape == molded_shape, "out must be of shape {}".format(molded_shape)
+
+    def mold(i):
+        scale, resized, padding, window = geometries[i]
+        resize_image_into(images[i], out[i], scale, window,
+                          mean_pixel=config.MEAN_PIXEL)
+
+    if executor is not None and len(images) > 1:
+        list(executor.map(mold, range(len(images))))
+    else:
+        for i in range(len(images)):
+            mold(i)
+    return out, geometries
 
 
 def resize_mask(mask, scale, padding, crop=None):
@@ -576,6 +748,251 @@ def unmold_mask(mask, bbox, image_shape):
     return full_mask
 
 
+def unmold_mask_local(mask, bbox, out=None):
+    """Same as unmold_mask(), but resizes with OpenCV (same output, up to
+    rounding of values right at the threshold) and returns the mask inside
+    its box only, without allocating an image-size canvas.
+    mask: [height, width] of type float. A small, typically 28x28 mask.
+    bbox: [y1, x1, y2, x2]. The box to fit the mask in.
+    out: Optional [y2 - y1, x2 - x1] bool array to write the mask into
+        (e.g. a slice of a preallocated full-size mask).
+
+    Returns a [y2 - y1, x2 - x1] binary mask.
+    """
+    threshold = 0.5
+    y1, x1, y2, x2 = bbox
+    height, width = int(y2 - y1), int(x2 - x1)
+    # Bilinear resize with zeros outside of the mask, like resize() with
+    # mode="constant": a one pixel zero border, and the output pixel centers
+    # mapped onto the input pixel centers
+    scale_y = mask.shape[0] / height
+    scale_x = mask.shape[1] / width
+    padded = cv2.copyMakeBorder(mask.astype(np.float32), 1, 1, 1, 1,
+                                cv2.BORDER_CONSTANT, value=0)
+    transform = np.array([[scale_x, 0, 0.5 * scale_x + 0.5],
+                          [0, scale_y, 0.5 * scale_y + 0.5]], dtype=np.float64)
+    mask = cv2.warpAffine(padded, transform, (width, height),
+                          flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    if out is None:
+        return mask >= threshold
+    np.greater_equal(mask, threshold, out=out)
+    return out
+
+
+############################################################
+#  Run-Length Encoding
+############################################################
+
+def rle_encode(mask):
+    """Encodes a mask in Run Length Encoding (RLE), with the same
+    convention as samples/nucleus: column-major order, 1-based starts.
+
+    mask: [height, width] of type bool.
+
+    Returns: [N, (start, length)] int32 array.
+    """
+    assert mask.ndim == 2, "Mask must be of shape [Height, Width]"
+    # Flatten it column wise
+    m = mask.T.reshape(-1).astype(np.int8)
+    # Compute gradient. Equals 1 or -1 at transition points
+    g = np.diff(m, prepend=0, append=0)
+    # 1-based indicies of transition points (where gradient != 0)
+    rle = np.flatnonzero(g).astype(np.int32).reshape([-1, 2]) + 1
+    # Convert second index in each pair to lenth
+    rle[:, 1] -= rle[:, 0]
+    return rle
+
+
+def rle_decode(rle, shape):
+    """Decodes a mask encoded by rle_encode(), without looping over runs.
+
+    rle: [N, (start, length)] array, or a string of space-separated values
+        as produced by samples/nucleus.
+    shape: (height, width) of the mask.
+
+    Returns a [height, width] bool mask.
+    """
+    if isinstance(rle, str):
+        rle = np.array(rle.split(), dtype=np.int32)
+    rle = np.asarray(rle, dtype=np.int64).reshape([-1, 2])
+    size = shape[0] * shape[1]
+    starts = rle[:, 0] - 1
+    ends = starts + rle[:, 1]
+    assert np.all(starts >= 0) and np.all(ends <= size), "RLE runs outside of shape {}".format(shape)
+    # +1 where a run starts, -1 where it ends, then a running sum. Added
+    # with np.add.at, as a run can start where the previous one ends and
+    # zero-length runs start and end at the same index
+    changes = np.zeros([size + 1], dtype=np.int32)
+    np.add.at(changes, starts, 1)
+    np.add.at(changes, ends, -1)
+    mask = np.cumsum(changes[:-1]) > 0
+    # Reshape and transpose
+    return mask.reshape([shape[1], shape[0]]).T
+
+
+############################################################
+#  Packed Masks
+############################################################
+
+# Number of set bits of every byte value
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed):
+    """Number of set bits in a uint8 array."""
+    return int(POPCOUNT_TABLE[packed].sum(dtype=np.int64))
+
+
+def is_packed_masks(masks):
+    """True for PackedMasks. Duck-typed, as the same class can be loaded
+    twice, from "mrcnn.utils" and "Mask_RCNN.mrcnn.utils".
+    """
+    return hasattr(masks, "packed") and hasattr(masks, "unpack")
+
+
+class PackedMasks(object):
+    """Instance masks with one bit per pixel instead of one byte. Each
+    mask is kept full-size, packed along its rows with np.packbits, so any
+    two masks line up on the same bytes, plus its bounding box. Area,
+    overlaps, union and crops only read the bytes inside the boxes.
+
+    Stands in for [H, W, N] bool masks where supported (extract_bboxes(),
+    compute_overlaps_masks(), the detect() results with packed=True).
+    unpack() returns the dense masks for everything else.
+    """
+
+    def __init__(self, packed, image_shape, boxes):
+        """
+        packed: [N, H, ceil(W / 8)] uint8, np.packbits(masks, axis=-1) of
+            [N, H, W] masks.
+        image_shape: (H, W)
+        boxes: [N, (y1, x1, y2, x2)] bounding boxes of the masks, as from
+            extract_bboxes() (zeros for empty masks).
+        """
+        self.packed = packed
+        self.image_shape = tuple(image_shape[:2])
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+    @classmethod
+    def from_dense(cls, masks):
+        """masks: [H, W, N] bool (or 0/1) masks."""
+        masks = np.asarray(masks)
+        if masks.dtype != np.bool_:
+            masks = masks != 0
+        packed = np.packbits(np.moveaxis(masks, -1, 0), axis=-1)
+        return cls(packed, masks.shape[:2], extract_bboxes(masks))
+
+    @classmethod
+    def from_local(cls, image_shape, boxes, local_masks):
+        """Packs masks given inside their boxes, e.g. the outputs of
+        unmold_mask_local(), without making any full-size dense mask.
+
+        image_shape: (H, W)
+        boxes: [N, (y1, x1, y2, x2)] boxes the local masks are placed at
+        local_masks: N [y2 - y1, x2 - x1] bool masks
+        """
+        height, width = image_shape[:2]
+        packed = np.zeros((len(local_masks), height, (width + 7) // 8), dtype=np.uint8)
+        tight_boxes = np.zeros((len(local_masks), 4), dtype=np.int32)
+        for i, ((y1, x1, y2, x2), local_mask) in enumerate(zip(boxes, local_masks)):
+            rows = np.where(np.any(local_mask, axis=1))[0]
+            columns = np.where(np.any(local_mask, axis=0))[0]
+            if not rows.shape[0]:
+                continue
+            # Bounding box of the mask itself, as extract_bboxes()
+            y1, x1 = y1 + rows[0], x1 + columns[0]
+            local_mask = local_mask[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+            y2, x2 = y1 + local_mask.shape[0], x1 + local_mask.shape[1]
+            tight_boxes[i] = [y1, x1, y2, x2]
+            # Placed at its bit offset within whole bytes
+            b1, b2 = x1 // 8, (x2 + 7) // 8
+            aligned = np.zeros((y2 - y1, (b2 - b1) * 8), dtype=np.bool_)
+            aligned[:, x1 - b1 * 8:x2 - b1 * 8] = local_mask
+            packed[i, y1:y2, b1:b2] = np.packbits(aligned, axis=-1)
+        return cls(packed, image_shape, tight_boxes)
+
+    @property
+    def shape(self):
+        """(H, W, N), the shape of the dense masks."""
+        return self.image_shape + (self.packed.shape[0],)
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __len__(self):
+        return self.packed.shape[0]
+
+    def byte_window(self, i):
+        """Rows and byte columns of the packed mask i that hold its box."""
+        y1, x1, y2, x2 = self.boxes[i]
+        return slice(y1, y2), slice(x1 // 8, (x2 + 7) // 8)
+
+    def area(self):
+        """[N] number of pixels of each mask."""
+        return np.array([popcount(self.packed[i][self.byte_window(i)])
+                         for i in range(len(self))], dtype=np.int64)
+
+    def intersection(self, i, other, j):
+        """Number of pixels in both mask i and mask j of other."""
+        (ay1, ax1, ay2, ax2), (by1, bx1, by2, bx2) = self.boxes[i], other.boxes[j]
+        y1, y2 = max(ay1, by1), min(ay2, by2)
+        b1, b2 = max(ax1, bx1) // 8, (min(ax2, bx2) + 7) // 8
+        if y1 >= y2 or b1 >= b2:
+            return 0
+        return popcount(self.packed[i, y1:y2, b1:b2] & other.packed[j, y1:y2, b1:b2])
+
+    def overlaps(self, other):
+        """[N1, N2] IoU of every pair of masks, as compute_overlaps_masks().
+        Only pairs with overlapping boxes are intersected.
+        """
+        assert self.image_shape == other.image_shape, "Masks of different image sizes"
+        if len(self) == 0 or len(other) == 0:
+            return np.zeros((len(self), len(other)))
+        area1 = self.area().astype(np.float32)
+        area2 = other.area().astype(np.float32)
+        intersections = np.zeros((len(self), len(other)), dtype=np.float32)
+        candidates = compute_overlaps(self.boxes.astype(np.float32),
+                                      other.boxes.astype(np.float32)) > 0
+        for i, j in zip(*np.where(candidates)):
+            intersections[i, j] = self.intersection(i, other, j)
+        union = area1[:, None] + area2[None, :] - intersections
+        return intersections / union
+
+    def union(self, indices=None):
+        """PackedMasks with one mask: the union of the masks in indices
+        (all by default).
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        packed = np.bitwise_or.reduce(self.packed[indices], axis=0)[None]
+        boxes = self.boxes[indices]
+        boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+        if boxes.shape[0]:
+            box = [boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()]
+        else:
+            box = [0, 0, 0, 0]
+        return PackedMasks(packed, self.image_shape, [box])
+
+    def crop(self, i, box=None):
+        """[y2 - y1, x2 - x1] bool mask i inside box (its own box by
+        default), unpacked from the bytes of the box only.
+        """
+        y1, x1, y2, x2 = self.boxes[i] if box is None else box
+        b1, b2 = x1 // 8, (x2 + 7) // 8
+        bits = np.unpackbits(self.packed[i, y1:y2, b1:b2], axis=-1)
+        return bits[:, x1 - b1 * 8:x2 - b1 * 8].view(np.bool_)
+
+    def mask(self, i):
+        """[H, W] bool mask i."""
+        return np.unpackbits(self.packed[i], axis=-1)[:, :self.image_shape[1]].view(np.bool_)
+
+    def unpack(self):
+        """[H, W, N] bool masks."""
+        masks = np.unpackbits(self.packed, axis=-1)[:, :, :self.image_shape[1]].view(np.bool_)
+        return np.moveaxis(masks, 0, -1)
+
+
 ############################################################
 #  Anchors
 ############################################################
@@ -639,6 +1056,125 @@ def generate_pyramid_anchors(scales, ratios, feature_shapes, feature_strides,
     return np.concatenate(anchors, axis=0)
 
 
+############################################################
+#  Timing
+############################################################
+
+# Order in which stages are reported (others follow, sorted by name)
+TIMING_STAGES = ["decode", "mold", "predict", "unmold", "dilate", "dedup",
+                 "contours", "crop", "warp", "classify"]
+
+
+class _NullStage(object):
+    """Context manager that does nothing, returned by disabled timers."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _TimedStage(object):
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageTimer(object):
+    """Collects the durations of named stages over many runs and reports
+    percentiles per stage.
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage("mold"):
+            ...
+        print(timer.summary())
+        timer.to_csv("timing.csv")
+
+    A disabled timer (enabled=False) records nothing and its stage() is a
+    shared no-op context manager, so instrumented code costs next to nothing.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _TimedStage(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+
+    def summary(self, percentiles=(50, 90, 95, 99)):
+        """Returns a list of dicts, one per stage, with count, total, mean,
+        min, max and the given percentiles (p50, ...), in seconds.
+        """
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        names = [n for n in TIMING_STAGES if n in durations] +\
+            sorted(n for n in durations if n not in TIMING_STAGES)
+        rows = []
+        for name in names:
+            values = np.array(durations[name])
+            row = {"stage": name,
+                   "count": int(values.size),
+                   "total": float(values.sum()),
+                   "mean": float(values.mean()),
+                   "min": float(values.min()),
+                   "max": float(values.max())}
+            for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                row["p{}".format(p)] = float(value)
+            rows.append(row)
+        return rows
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_csv(self, path):
+        rows = self.summary()
+        with open(path, "w") as f:
+            if not rows:
+                return
+            f.write(",".join(rows[0].keys()) + "\n")
+            for row in rows:
+                f.write(",".join(str(value) for value in row.values()) + "\n")
+
+    def format_summary(self):
+        """Summary as a table, with durations in milliseconds."""
+        lines = ["{:10} {:>7} {:>10} {:>10} {:>10} {:>10}".format(
+            "stage", "count", "mean ms", "p50 ms", "p95 ms", "total s")]
+        for row in self.summary():
+            lines.append("{:10} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.3f}".format(
+                row["stage"], row["count"], row["mean"] * 1000, row["p50"] * 1000,
+                row["p95"] * 1000, row["total"]))
+        return "\n".join(lines)
+
+
 ############################################################
 #  Miscellaneous
 ############################################################
@@ -1,4 +1,5 @@
 # Library Imports
+import logging
 import pathlib
 
 # Third-Party Imports
@@ -22,27 +23,57 @@ maskrcnn_parameters = {"weights_path": r"C:\Users\daval\Documents\GitHub\Crossar
 					   "cropping_ratio": 0.5,
 					   "shared_mask_ratio_threshold": 30,
 					   "only_long_crossarms": True,
-					   "long_crossarm_w_h_ratio_threshold": 0.10}
+					   "long_crossarm_w_h_ratio_threshold": 0.10,
+					   "cache_dir": None, # e.g. r"detection_cache", skips Mask-RCNN for images already seen
+					   "postprocess_engine": "raster", # "polygon": works from the 28x28 masks, needs shapely
+					   "resize_backend": "skimage", # "opencv": faster, pixel values can differ by one from training
+					   "timing": False} # True: per-stage durations, see timing_output
 
 # crack_classifier Parameters
 crack_classifier_parameters = {"model_path": r"C:\Users\daval\Documents\GitHub\CrossarmMaskNN\tools\models\classification\bothmodel.h5"}
 
+# Output Parameters
+headless = False # True: no OpenCV windows, for unattended batch jobs
+output_jsonl = None # e.g. r"results.jsonl"
+output_crop_dir = None # e.g. r"crops"
+timing_output = None # e.g. r"timing.json" or r"timing.csv", needs "timing": True
+
+logging.basicConfig(level=logging.WARNING if headless else logging.INFO)
+
+#################### OUTPUT SINKS #######################
+
+sinks = [clss.ListSink()]
+
+if output_crop_dir is not None:
+	sinks.append(clss.CropDirectorySink(output_crop_dir))
+if output_jsonl is not None:
+	sinks.append(clss.JsonlSink(output_jsonl))
+if headless is False:
+	sinks.append(clss.DisplaySink())
+
 #################### LOADING MODELS #######################
 
 maskrcnn_model = clss.MaskRCNN(maskrcnn_parameters)
-crack_classifier_model = clss.CrackClassifier(crack_classifier_parameters)
+crack_classifier_model = clss.CrackClassifier(crack_classifier_parameters, timer=maskrcnn_model.timer)
 
 #################### OUTPUT #####################
 
 crossarm_images_list = maskrcnn_model.predict(maskrcnn_input)
 
-# Showing the original input for comparision
-original_image = cv2.imread(maskrcnn_input)
-cv2.imshow("Original Image", imutils.resize(original_image, height=700))
-
 # Predicting list of images
-classifications = crack_classifier_model.predict_image_list(crossarm_images_list)
-
+probabilities, classifications = crack_classifier_model.predict_batch(crossarm_images_list)
 
+# Sending results (and the original input for comparision) to the sinks
+record = clss.build_record(maskrcnn_model.result_manager, classifications, probabilities)
+clss.emit_record(sinks, record)
+clss.close_sinks(sinks)
+maskrcnn_model.close()
 
+#################### TIMING #####################
 
+if maskrcnn_model.timer.enabled:
+	logging.getLogger("main").info("Stage durations:\n" + maskrcnn_model.timer.format_summary())
+	if timing_output is not None and timing_output.endswith(".csv"):
+		maskrcnn_model.timer.to_csv(timing_output)
+	elif timing_output is not None:
+		maskrcnn_model.timer.to_json(timing_output)
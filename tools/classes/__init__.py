@@ -1,6 +1,55 @@
 # __init__.py
 
-from .instance_data import InstanceData
-from .result_manager import ResultManager
-from .maskrcnn import MaskRCNN
-from .crack_classifier import CrackClassifier
\ No newline at end of file
+# The classes are imported on first use, so "import tools.classes" does not
+# pull in keras and tensorflow until MaskRCNN or CrackClassifier is needed.
+
+import sys
+import types
+import importlib
+
+_CLASS_MODULES = {"InstanceData": "instance_data",
+                  "PolygonInstanceData": "polygon_instance_data",
+                  "ResultManager": "result_manager",
+                  "MaskRCNN": "maskrcnn",
+                  "load_image": "maskrcnn",
+                  "DetectionCache": "detection_cache",
+                  "ResultStore": "result_store",
+                  "CrackClassifier": "crack_classifier",
+                  "CrackClassifierScheduler": "crack_scheduler",
+                  "ListSink": "result_sinks",
+                  "JsonlSink": "result_sinks",
+                  "CropDirectorySink": "result_sinks",
+                  "CallbackSink": "result_sinks",
+                  "DisplaySink": "result_sinks",
+                  "build_record": "result_sinks",
+                  "emit_record": "result_sinks",
+                  "close_sinks": "result_sinks",
+                  "Stage": "pipeline",
+                  "Pipeline": "pipeline",
+                  "build_crossarm_pipeline": "pipeline"}
+
+__all__ = list(_CLASS_MODULES)
+
+class _LazyModule(types.ModuleType):
+
+    # A module-level __getattr__ (PEP 562) needs Python 3.7, swapping the
+    # class of the module works from 3.5 on
+
+    def __getattr__(self, name):
+
+        if name not in _CLASS_MODULES:
+            raise AttributeError("module {!r} has no attribute {!r}".format(self.__name__, name))
+
+        module = importlib.import_module("." + _CLASS_MODULES[name], self.__name__)
+        value = getattr(module, name)
+
+        # Cached so __getattr__ is only called once per name
+        setattr(self, name, value)
+
+        return value
+
+    def __dir__(self):
+
+        return sorted(set(list(self.__dict__) + __all__))
+
+sys.modules[__name__].__class__ = _LazyModule
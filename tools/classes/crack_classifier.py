@@ -1,18 +1,35 @@
 # Library Imports
+import os
+import sys
+import logging
 import pathlib
+import concurrent.futures
 
 # Third-Party Imports
 import cv2
-import imutils
 import numpy as np
 import keras
 
+# Local Imports
+sys.path.append(os.path.dirname(__file__)) # Appendings this file's path to PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import result_sinks
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Constants
+
+INPUT_SIZE = (128,128)
+
+logger = logging.getLogger("tools.classes.crack_classifier")
+
 #------------------------------------------------------------------
 # Class
 
 class CrackClassifier():
 
-    def __init__(self, dict_para):
+    def __init__(self, dict_para, timer=None):
 
         # Checking if model path is valid
         assert pathlib.Path(dict_para["model_path"]).is_file() is True, "CrackClassifier Model Path Invalid"
@@ -26,36 +43,79 @@ class CrackClassifier():
                            optimizer="adam",
                            metrics=["accuracy"])
 
+        # Graph of the model, needed to predict from other threads
+        self.graph = keras.backend.get_session().graph
+
+        # Probability (of "No cracked") at or below which a crop is "Cracked"
+        self.threshold = self.dict_para.get("threshold", 0.5)
+
+        # Thread pool for resizing crops, created on first use
+        self.executor = None
+
+        # Durations of the classify stage (see utils.StageTimer), e.g. shared
+        # with MaskRCNN.timer
+        self.timer = timer if timer is not None else utils.StageTimer(enabled=self.dict_para.get("timing", False))
+
         return None
 
-    def predict_image_list(self, input_images_list):
+    def preprocess_batch(self, input_images_list, out=None):
+
+        # Resizing every crop straight into one [N,128,128,3] buffer
+        number_of_images = len(input_images_list)
+
+        if out is None:
+            out = np.empty((number_of_images, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype=np.uint8)
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.dict_para.get("workers"))
+
+        def resize_into(i):
+            cv2.resize(input_images_list[i], INPUT_SIZE, dst=out[i])
+
+        list(self.executor.map(resize_into, range(number_of_images)))
+
+        return out
+
+    def predict_probabilities(self, batch):
+
+        # batch: [N,128,128,3] of resized crops. Returns [N] model outputs,
+        # the probability of class 1 ("No cracked")
+        with self.graph.as_default():
+            return self.model.predict(batch, batch_size=len(batch))[:, 0]
+
+    def probability_to_tag(self, probability, threshold=None):
+
+        if threshold is None:
+            threshold = self.threshold
+
+        if probability <= threshold:
+            return "Cracked"
+        return "No cracked"
 
-        # Feeding input and visualizing output
-        classifications = []
+    def predict_batch(self, input_images_list, threshold=None):
 
-        for counter, test_image in enumerate(input_images_list):
+        # One predict for the whole list. Returns (probabilities, tags)
+        if not input_images_list:
+            return np.empty((0,), dtype=np.float32), []
 
-            # Resizing image to (128,128) to improve performance
-            test_image_saved = test_image
-            test_image = cv2.resize(test_image,(128,128))
-            test_image = np.reshape(test_image,[1,128,128,3])
+        with self.timer.stage("classify"):
+            batch = self.preprocess_batch(input_images_list)
+            probabilities = self.predict_probabilities(batch)
+            tags = [self.probability_to_tag(probability, threshold) for probability in probabilities]
 
-            # Output classification
-            classification = self.model.predict_classes(test_image)[0][0]
+        return probabilities, tags
 
-            print(classification)
+    def predict_image_list(self, input_images_list, display=True):
 
-            if classification == 0:
-                tag = "Cracked"
-            else:
-                tag = "No cracked"
+        # Feeding input and visualizing output. For unattended runs, pass
+        # display=False or use predict_batch and the result sinks instead.
+        probabilities, classifications = self.predict_batch(input_images_list)
 
-            classifications.append(tag)
+        for counter, (probability, tag) in enumerate(zip(probabilities, classifications)):
+            logger.debug("Crop {} - {} ({})".format(counter, tag, probability))
 
-            # Visualizing Output with OpenCV
-            cv2.imshow("{} - {}".format(tag, counter), test_image_saved)
-        
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        # Visualizing Output with OpenCV
+        if display is True:
+            result_sinks.show_crops(input_images_list, classifications)
 
         return classifications
\ No newline at end of file
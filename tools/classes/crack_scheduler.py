@@ -0,0 +1,182 @@
+# Library Imports
+import time
+import threading
+import concurrent.futures
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from .crack_classifier import INPUT_SIZE
+
+#------------------------------------------------------------------
+# Class
+
+class CrackClassifierScheduler():
+
+    """
+    Collects crossarm crops from many images into fixed-shape batches for
+    the CrackClassifier, instead of one predict per crop.
+
+    A batch is classified as soon as batch_size crops are waiting, or when
+    the oldest waiting crop has waited timeout seconds (the batch is then
+    padded with blank crops, so the model always sees the same shape).
+    Tags are routed back per image, in the same order as its crops.
+
+    Usage:
+
+        scheduler = CrackClassifierScheduler(crack_classifier_model, batch_size=64)
+
+        futures = []
+        for result_manager in maskrcnn_model.predict_stream(image_paths):
+            futures.append(scheduler.submit_result_manager(result_manager))
+
+        for future in futures:
+            image_key, tags = future.result()
+
+        scheduler.close()
+    """
+
+    def __init__(self, crack_classifier, batch_size=64, timeout=0.5, threshold=None):
+
+        self.crack_classifier = crack_classifier
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.threshold = threshold
+
+        # Reused for every batch, so the model always receives the same shape
+        self.batch_buffer = np.zeros((batch_size, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype=np.uint8)
+
+        # Waiting crops: (job, instance index, crop, time submitted)
+        self.pending = []
+        self.condition = threading.Condition()
+        self.flush_requested = False
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return None
+
+    def submit(self, image_key, crops):
+
+        # Returns a future resolved with (image_key, tags)
+        job = ClassificationJob(image_key, len(crops))
+
+        if not crops:
+            job.future.set_result((image_key, []))
+            return job.future
+
+        now = time.time()
+
+        with self.condition:
+            assert self.closed is False, "CrackClassifierScheduler - Already closed"
+            for index, crop in enumerate(crops):
+                self.pending.append((job, index, crop, now))
+            self.condition.notify()
+
+        return job.future
+
+    def submit_result_manager(self, result_manager, image_key=None):
+
+        if image_key is None:
+            image_key = result_manager.image_path
+
+        return self.submit(image_key, result_manager.get_crossarm_images())
+
+    def flush(self):
+
+        # Classify whatever is waiting without waiting for the timeout
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify()
+
+        return None
+
+    def close(self):
+
+        # Classifies the remaining crops and stops the worker thread
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
+
+        return None
+
+    def run(self):
+
+        while True:
+
+            with self.condition:
+
+                # Waiting for a full batch, the timeout, a flush or close
+                while len(self.pending) < self.batch_size and not self.closed and not self.flush_requested:
+                    if self.pending:
+                        remaining = self.pending[0][3] + self.timeout - time.time()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+
+                if not self.pending:
+                    self.flush_requested = False
+                    if self.closed:
+                        return None
+                    continue
+
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+
+                if not self.pending:
+                    self.flush_requested = False
+
+            self.classify(batch)
+
+    def classify(self, batch):
+
+        try:
+            with self.crack_classifier.timer.stage("classify"):
+                # Resizing crops into the fixed-shape buffer, blank padding after them
+                crops = [crop for job, index, crop, submitted in batch]
+                self.crack_classifier.preprocess_batch(crops, out=self.batch_buffer[:len(batch)])
+                self.batch_buffer[len(batch):] = 0
+
+                probabilities = self.crack_classifier.predict_probabilities(self.batch_buffer)
+
+        except Exception as error:
+            for job, index, crop, submitted in batch:
+                if not job.future.done():
+                    job.future.set_exception(error)
+            return None
+
+        for (job, index, crop, submitted), probability in zip(batch, probabilities):
+            job.set_tag(index, self.crack_classifier.probability_to_tag(probability, self.threshold))
+
+        return None
+
+#------------------------------------------------------------------
+# Parasidic Classes (small and insignificant but needed to run CrackClassifierScheduler)
+
+class ClassificationJob():
+
+    def __init__(self, image_key, number_of_crops):
+
+        self.image_key = image_key
+        self.tags = [None] * number_of_crops
+        self.remaining = number_of_crops
+        self.future = concurrent.futures.Future()
+
+        return None
+
+    def set_tag(self, index, tag):
+
+        # Only called from the scheduler thread
+        self.tags[index] = tag
+        self.remaining -= 1
+
+        if self.remaining == 0 and not self.future.done():
+            self.future.set_result((self.image_key, self.tags))
+
+        return None
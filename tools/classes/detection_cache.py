@@ -0,0 +1,208 @@
+# Library Imports
+import os
+import pickle
+import hashlib
+import threading
+import collections
+
+# Third-Party Imports
+import numpy as np
+
+#------------------------------------------------------------------
+# Constants
+
+# Config fields that change the detections of a given image and weights
+INFERENCE_CONFIG_KEYS = [
+    "NAME", "BACKBONE", "NUM_CLASSES", "BACKBONE_STRIDES", "FPN_CLASSIF_FC_LAYERS_SIZE",
+    "TOP_DOWN_PYRAMID_SIZE", "RPN_ANCHOR_SCALES", "RPN_ANCHOR_RATIOS", "RPN_ANCHOR_STRIDE",
+    "RPN_NMS_THRESHOLD", "PRE_NMS_LIMIT", "POST_NMS_ROIS_INFERENCE", "IMAGE_RESIZE_MODE",
+    "IMAGE_MIN_DIM", "IMAGE_MAX_DIM", "IMAGE_MIN_SCALE", "IMAGE_CHANNEL_COUNT",
+    "IMAGE_RESIZE_BACKEND", "MEAN_PIXEL", "POOL_SIZE", "MASK_POOL_SIZE", "MASK_SHAPE",
+    "RPN_BBOX_STD_DEV", "BBOX_STD_DEV", "DETECTION_MAX_INSTANCES", "DETECTION_MIN_CONFIDENCE",
+    "DETECTION_NMS_THRESHOLD",
+]
+
+HASH_CHUNK_SIZE = 1 << 20
+
+DEFAULT_MAX_DISK_BYTES = 2 * 1024**3
+DEFAULT_MAX_MEMORY_ITEMS = 64
+
+#------------------------------------------------------------------
+# Class
+
+class DetectionCache():
+
+    """
+    Mask-RCNN results keyed by image content, weights file, the
+    inference-relevant config fields and the format of the results (lazy:
+    DetectionResult instead of dict, packed: utils.PackedMasks masks).
+    Two tiers:
+
+    memory: the max_memory_items most recently used results.
+    disk (if cache_dir is given): one pickle per result, least recently
+        used files removed once the directory exceeds max_disk_bytes.
+    """
+
+    def __init__(self, model_path, config, cache_dir=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES,
+                 max_memory_items=DEFAULT_MAX_MEMORY_ITEMS, lazy=False, packed=False):
+
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+        self.lock = threading.Lock()
+
+        # Everything but the image that determines the results
+        self.namespace = self.hash_model(model_path, config, lazy=lazy, packed=packed)
+
+        self.memory = collections.OrderedDict()
+
+        # Disk entries (key -> size in bytes), least recently used first
+        self.disk = collections.OrderedDict()
+        self.disk_bytes = 0
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.load_disk_index()
+
+        self.hits = 0
+        self.misses = 0
+
+        return None
+
+    def hash_model(self, model_path, config, lazy=False, packed=False):
+
+        hasher = hashlib.sha1()
+
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+
+        for key in INFERENCE_CONFIG_KEYS:
+            value = getattr(config, key, None)
+            hasher.update("{}={};".format(key, np.asarray(value).tolist()).encode("utf-8"))
+
+        # Runs asking for another result format do not share entries (e.g.
+        # the polygon engine needs the raw masks of lazy results)
+        hasher.update("lazy={};packed={};".format(bool(lazy), bool(packed)).encode("utf-8"))
+
+        return hasher.hexdigest()
+
+    def key(self, image):
+
+        hasher = hashlib.sha1(self.namespace.encode("utf-8"))
+        hasher.update("{}{}".format(image.shape, image.dtype).encode("utf-8"))
+        hasher.update(np.ascontiguousarray(image).data)
+
+        return hasher.hexdigest()
+
+    def get(self, key):
+
+        with self.lock:
+
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            if key not in self.disk:
+                self.misses += 1
+                return None
+
+            self.disk.move_to_end(key)
+
+        try:
+            with open(self.disk_path(key), "rb") as f:
+                results = pickle.load(f)
+            # Keeping the file modification time as the last use, for the
+            # order of the index when the cache is reopened
+            os.utime(self.disk_path(key), None)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self.lock:
+                self.forget_disk_entry(key)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self.add_to_memory(key, results)
+
+        return results
+
+    def put(self, key, results):
+
+        with self.lock:
+            self.add_to_memory(key, results)
+
+        if self.cache_dir is None:
+            return None
+
+        # Writing to a temporary file first, so readers never see half a file
+        path = self.disk_path(key)
+        temporary_path = "{}.{}.tmp".format(path, threading.get_ident())
+
+        with open(temporary_path, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+        with self.lock:
+            self.forget_disk_entry(key)
+            size = os.path.getsize(path)
+            self.disk[key] = size
+            self.disk_bytes += size
+            self.evict_disk()
+
+        return None
+
+    def add_to_memory(self, key, results):
+
+        self.memory[key] = results
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+        return None
+
+    def evict_disk(self):
+
+        while self.disk_bytes > self.max_disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(self.disk_path(key))
+            except OSError:
+                pass
+
+        return None
+
+    def forget_disk_entry(self, key):
+
+        size = self.disk.pop(key, None)
+        if size is not None:
+            self.disk_bytes -= size
+
+        return None
+
+    def load_disk_index(self):
+
+        entries = []
+
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".pickle"):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, filename[:-len(".pickle")], stat.st_size))
+
+        # Oldest first
+        for mtime, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+
+        self.evict_disk()
+
+        return None
+
+    def disk_path(self, key):
+
+        return os.path.join(self.cache_dir, "{}.pickle".format(key))
@@ -13,19 +13,52 @@ sys.path.append(ROOT_DIR)
 
 import global_variables as gv
 
+#-----------------------------------------------------------------------------------------
+# Constants
+
+DILATION_KERNEL_SIZE = 10
+DILATION_ITERATIONS = 4
+
+# A 10x10 kernel anchored at (5,5) grows a mask by up to 5 pixels per
+# iteration. One more pixel keeps the dilated mask off the window edges,
+# so findContours sees the same shapes as on the full frame
+WINDOW_PADDING = DILATION_ITERATIONS * (DILATION_KERNEL_SIZE // 2) + 1
+
+# Crops are scaled to 60% of the (shrunk) min area rectangle
+CROP_SCALE = 0.6
+
 #-----------------------------------------------------------------------------------------
 # Class
 
 class InstanceData():
 
-	def __init__(self, data):
+	# The dilated mask is only kept around its bounding box (local_mask,
+	# padded by WINDOW_PADDING), offset being the (x, y) position of that
+	# window in the image
+	__slots__ = ["box", "class_id", "score", "label", "unique", "shape", "offset", "local_mask",
+				 "mask_pixel_count", "cnts", "image", "crop_rect", "crop", "timer"]
+
+	def __init__(self, data, image_shape=None, offset=None):
 	
-		# Data: box, mask, class_id, score
-		self.box, self.mask, self.class_id, self.score = data
+		# Data: box, mask, class_id, score. With offset, mask is only the part
+		# at offset (x, y) of an image_shape mask (e.g. PackedMasks.crop()),
+		# and must hold all of its pixels
+		self.box, mask, self.class_id, self.score = data
 		self.label = gv.CLASS_NAMES[self.class_id]
 		self.unique = True
+
+		# Source image and rectangle of the crop, and the timer of the lazy
+		# warp ("warp" stage), set by ResultManager.crop_crossarms
+		self.image = None
+		self.crop_rect = None
+		self.crop = None
+		self.timer = None
 		
-		self.make_mask_np_friendly()
+		if offset is None:
+			self.make_mask_np_friendly(mask)
+		else:
+			self.shape = tuple(image_shape[:2])
+			self.make_local_mask_np_friendly(mask, offset)
 	
 		return None
 		
@@ -39,39 +72,240 @@ class InstanceData():
 	def __lt__(self, other):
 		assert isinstance(other, InstanceData)
 		return self.mask_pixel_count < other.mask_pixel_count
+
+	@property
+	def window(self):
+
+		# (rows, columns) slices of the window in the image
+		x, y = self.offset
+		h, w = self.local_mask.shape
+
+		return slice(y, y + h), slice(x, x + w)
+
+	@property
+	def mask(self):
+
+		# Full-frame dilated mask (255/0), built on demand
+		mask = np.zeros(self.shape, dtype=np.uint8)
+		mask[self.window] = self.local_mask
+
+		return mask
+
+	@property
+	def cropped_image(self):
+
+		# Warped on first access, so crops that are never used cost nothing
+		if self.crop is None and self.crop_rect is not None:
+			if self.timer is None:
+				self.crop = crop_min_area_rect(self.image, self.crop_rect)
+			else:
+				with self.timer.stage("warp"):
+					self.crop = crop_min_area_rect(self.image, self.crop_rect)
+
+		return self.crop
+
+	@cropped_image.setter
+	def cropped_image(self, crop):
+
+		self.crop = crop
+
+	def find_mask_bbox(self, mask):
+
+		height, width = mask.shape
+		y1, x1, y2, x2 = [int(v) for v in self.box]
+		y1, x1, y2, x2 = max(y1, 0), max(x1, 0), min(y2, height), min(x2, width)
+
+		# Masks from detect() lie inside their roi. Otherwise, the bounding
+		# box of the mask itself is used
+		inside = np.count_nonzero(mask[y1:y2, x1:x2]) if y2 > y1 and x2 > x1 else 0
+		if inside == np.count_nonzero(mask):
+			return y1, x1, max(y1, y2), max(x1, x2)
+
+		rows = np.where(np.any(mask, axis=1))[0]
+		columns = np.where(np.any(mask, axis=0))[0]
+
+		return rows[0], columns[0], rows[-1] + 1, columns[-1] + 1
 		
-	def make_mask_np_friendly(self):
+	def make_mask_np_friendly(self, mask):
+
+		mask = np.asarray(mask)
+		if mask.dtype != bool:
+			mask = mask == 1
+
+		self.shape = mask.shape
+
+		# Only the bounding box of the mask is kept
+		y1, x1, y2, x2 = self.find_mask_bbox(mask)
+		self.make_local_mask_np_friendly(mask[y1:y2, x1:x2], (x1, y1))
+
+		return None
+
+	def make_local_mask_np_friendly(self, mask, offset):
+
+		mask = np.asarray(mask)
+		if mask.dtype != bool:
+			mask = mask == 1
+
+		# Window around the mask, large enough for the dilation
+		x1, y1 = int(offset[0]), int(offset[1])
+		y2, x2 = y1 + mask.shape[0], x1 + mask.shape[1]
+		window_y1, window_x1 = max(y1 - WINDOW_PADDING, 0), max(x1 - WINDOW_PADDING, 0)
+		window_y2, window_x2 = min(y2 + WINDOW_PADDING, self.shape[0]), min(x2 + WINDOW_PADDING, self.shape[1])
+		self.offset = (window_x1, window_y1)
 		
 		# Changing True/False to 255/0
-		self.mask = np.where(self.mask == 1, 255, 0)
-		self.mask = self.mask.astype('uint8')
+		local_mask = np.zeros((window_y2 - window_y1, window_x2 - window_x1), dtype=np.uint8)
+		local_mask[y1 - window_y1:y2 - window_y1, x1 - window_x1:x2 - window_x1][mask] = 255
 		
 		# Dilating mask
-		kernel = np.ones((10,10), np.uint8)
-		self.mask = cv2.dilate(self.mask, kernel, iterations=4)
+		kernel = np.ones((DILATION_KERNEL_SIZE, DILATION_KERNEL_SIZE), np.uint8)
+		self.local_mask = cv2.dilate(local_mask, kernel, iterations=DILATION_ITERATIONS)
 		
-		self.mask_pixel_count = cv2.countNonZero(self.mask)
+		self.mask_pixel_count = cv2.countNonZero(self.local_mask)
 		
 		return None
+
+	def min_area_rect(self):
+
+		return cv2.minAreaRect(self.cnts[0])
+
+	def count_shared_pixels(self, other):
+
+		# Pixels in both dilated masks, only looking where the windows overlap
+		(ay, ax), (by, bx) = self.window, other.window
+		y1, y2 = max(ay.start, by.start), min(ay.stop, by.stop)
+		x1, x2 = max(ax.start, bx.start), min(ax.stop, bx.stop)
+
+		if y1 >= y2 or x1 >= x2:
+			return 0
+
+		own_mask = self.local_mask[y1 - ay.start:y2 - ay.start, x1 - ax.start:x2 - ax.start]
+		other_mask = other.local_mask[y1 - by.start:y2 - by.start, x1 - bx.start:x2 - bx.start]
+
+		return cv2.countNonZero(cv2.bitwise_and(own_mask, other_mask))
+
+	def find_contours(self):
+
+		# Contours in image coordinates
+		self.cnts = cv2.findContours(self.local_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=self.offset)
+		self.cnts = imutils.grab_contours(self.cnts)
+
+		return self.cnts
 		
 	def apply_mask(self, image):
 	
-		image_copy = image.copy()
+		image_copy = np.zeros_like(image)
+		rows, columns = self.window
+		inside = self.local_mask == 255
 		
-		for c in range(3):
-			image_copy[:,:,c] = np.where(self.mask == 255, image_copy[:,:,c], 0)
+		image_copy[rows, columns][inside] = image[rows, columns][inside]
 			
 		return image_copy
 
 	def apply_contour(self, image):
 	
-		image_copy = image.copy()
-		r,c,d = image_copy.shape
-		contour_mask = np.zeros( (r,c) )
-		cv2.fillPoly(contour_mask, pts=self.cnts, color=(255,255,255))
+		image_copy = np.zeros_like(image)
+		rows, columns = self.window
+		contour_mask = np.zeros(self.local_mask.shape, dtype=np.uint8)
+		cv2.fillPoly(contour_mask, pts=self.cnts, color=255, offset=(-columns.start, -rows.start))
+		inside = contour_mask == 255
 		
-		for c in range(3):
-			image_copy[:,:,c] = np.where(contour_mask == 255, image_copy[:,:,c], 0)
+		image_copy[rows, columns][inside] = image[rows, columns][inside]
 	
 		return image_copy
-		
\ No newline at end of file
+
+#-----------------------------------------------------------------------------------------
+# Functions
+
+def compute_rect_transform(rect):
+
+	# Perspective transform from the image to a [h, w] image of a min area
+	# rectangle (as given by cv2.minAreaRect), and that (w, h)
+	w,h = rect[1]
+	w = int(w)
+	h = int(h)
+
+	box = cv2.boxPoints(rect)
+	box = box.astype(np.intp)
+
+	new_pts = np.float32([[0,0],[w,0],[0,h],[w,h]])
+	old_pts = np.float32([box[1],box[2],box[0],box[3]])
+
+	return cv2.getPerspectiveTransform(old_pts, new_pts), (w, h)
+
+def compute_resized_size(w, h, scale=CROP_SCALE):
+
+	# Same sizes as imutils.resize (of the height if h > w, else of the width)
+	if h > w:
+		resized_h = int(h * scale)
+		resized_w = int(w * (resized_h / float(h)))
+	else:
+		resized_w = int(w * scale)
+		resized_h = int(h * (resized_w / float(w)))
+
+	return resized_w, resized_h
+
+def compute_crop_transform(rect, scale=CROP_SCALE):
+
+	"""
+	Geometry of the crop of a min area rectangle: a single 3x3 transform
+	from image to crop coordinates, and the (width, height) of the crop.
+	It combines the steps the crops are made with (crop_min_area_rect):
+
+	1. warpPerspective of the rectangle to a [h, w] image
+	2. imutils.resize to scale (of the height if h > w, else of the width)
+	3. imutils.rotate_bound by -90 degrees if h > w, so crops are horizontal
+
+	Only the geometry is combined, the pixels of the crops come from
+	crop_min_area_rect.
+	"""
+
+	transform, (w, h) = compute_rect_transform(rect)
+	resized_w, resized_h = compute_resized_size(w, h, scale)
+
+	# Resizing maps pixel centers: x' = (x + 0.5) * sx - 0.5
+	sx, sy = resized_w / float(w), resized_h / float(h)
+	scaling = np.array([[sx, 0, 0.5 * sx - 0.5],
+						[0, sy, 0.5 * sy - 0.5],
+						[0, 0, 1]])
+	transform = scaling.dot(transform)
+	size = (resized_w, resized_h)
+
+	if h > w:
+		# Same matrix and size as imutils.rotate_bound(angle=-90)
+		cX, cY = resized_w / 2, resized_h / 2
+		rotation = cv2.getRotationMatrix2D((cX, cY), 90, 1.0)
+		cos, sin = np.abs(rotation[0, 0]), np.abs(rotation[0, 1])
+		nW = int((resized_h * sin) + (resized_w * cos))
+		nH = int((resized_h * cos) + (resized_w * sin))
+		rotation[0, 2] += (nW / 2) - cX
+		rotation[1, 2] += (nH / 2) - cY
+		transform = np.vstack([rotation, [0, 0, 1]]).dot(transform)
+		size = (nW, nH)
+
+	return transform, size
+
+def crop_min_area_rect(image, rect, scale=CROP_SCALE):
+
+	"""
+	Crop of a min area rectangle, made like the crops the crack classifier
+	was trained on (gen_mask_data_from_json.py), with every step working
+	on the small crop only:
+
+	1. warpPerspective of the rectangle to a [h, w] image
+	2. INTER_AREA downscale to the size of imutils.resize
+	3. if h > w, a counterclockwise cv2.rotate with the rows moved down by
+	   one, the first one black, which is what imutils.rotate_bound(-90)
+	   gives, without its warpAffine
+	"""
+
+	transform, (w, h) = compute_rect_transform(rect)
+	crop = cv2.warpPerspective(image, transform, (w, h))
+	crop = cv2.resize(crop, compute_resized_size(w, h, scale), interpolation=cv2.INTER_AREA)
+
+	if h > w:
+		rotated = cv2.rotate(crop, cv2.ROTATE_90_COUNTERCLOCKWISE)
+		crop = np.zeros_like(rotated)
+		crop[1:] = rotated[:-1]
+
+	return crop
@@ -1,10 +1,13 @@
 # Common Core Library Imports
 import os
 import sys
+import time
 import pathlib
+import concurrent.futures
 
 # Third-Parthy Library Imports
 import cv2
+import numpy as np
 import keras
 
 # Local Imports
@@ -15,6 +18,7 @@ sys.path.append(os.path.dirname(__file__)) # Appendings this file's path to PATH
 # Modules written by us
 import instance_data
 import result_manager
+import detection_cache
 import global_variables as gv
 
 # Modules written by MaskRCNN Team
@@ -28,46 +32,342 @@ class MaskRCNN():
 
     def __init__(self, dict_para):
 
-        # Checking that weights_path is valid
-        assert pathlib.Path(dict_para["weights_path"]).is_file() is True, "Mask-RCNN - Invalid Weights Path"
+        start = time.time()
+
+        # If a frozen graph is given (see tools/utilities/export_frozen_graph.py),
+        # it is used instead of building the model and loading weights_path
+        frozen_graph_path = dict_para.get("frozen_graph_path")
+
+        # With dict_para["random_weights"], the model keeps its random
+        # initialization (benchmarks, see tools/utilities/pipeline_benchmark.py)
+        random_weights = dict_para.get("random_weights", False) is True
+
+        # Checking that weights_path or frozen_graph_path is valid
+        if frozen_graph_path:
+            assert pathlib.Path(frozen_graph_path).is_file() is True, "Mask-RCNN - Invalid Frozen Graph Path"
+        elif random_weights is False:
+            assert pathlib.Path(dict_para["weights_path"]).is_file() is True, "Mask-RCNN - Invalid Weights Path"
 
         # If valid parameters, store and continue
         self.dict_para = dict_para
 
         # Mask-RCNN Setup
 
-        config = InferenceConfig()
-        config.display()
+        config = InferenceConfig(images_per_gpu=dict_para.get("batch_size", 1),
+                                 overrides=dict_para.get("config_overrides"),
+                                 resize_backend=dict_para.get("resize_backend"))
+        if dict_para.get("verbose", 1):
+            config.display()
 
         # Loading Mask-RCNN Model
- 
-        self.model = modellib.MaskRCNN(mode="inference", config=config,
-                                       model_dir=gv.DEFAULT_LOGS_DIR)
-        self.model.load_weights(dict_para["weights_path"], by_name=True)
+
+        if frozen_graph_path:
+            self.model = modellib.MaskRCNN.from_frozen_graph(frozen_graph_path, config,
+                                                             model_dir=gv.DEFAULT_LOGS_DIR)
+            self.graph = self.model.keras_model.graph
+        else:
+            self.model = modellib.MaskRCNN(mode="inference", config=config,
+                                           model_dir=gv.DEFAULT_LOGS_DIR)
+            if random_weights is False:
+                self.model.load_weights(dict_para["weights_path"], by_name=True)
+            self.graph = keras.backend.get_session().graph
+
+        # The polygon post-processing engine works from the small mrcnn_mask
+        # probabilities, kept by detect(lazy=True) (see result_manager.py)
+        self.lazy = dict_para.get("postprocess_engine", "raster") == "polygon"
+
+        # With dict_para["packed_masks"], masks are kept one bit per pixel
+        # (utils.PackedMasks), in the results and in the detection cache
+        self.packed = dict_para.get("packed_masks", False) is True
+
+        # Durations of the decode, mold, predict, unmold and post-processing
+        # stages, with dict_para["timing"] (see utils.StageTimer)
+        self.timer = utils.StageTimer(enabled=dict_para.get("timing", False))
+
+        # Detection cache (see detection_cache.py). dict_para["cache"] enables
+        # the memory tier, dict_para["cache_dir"] adds the disk tier
+        self.cache = None
+        if random_weights is False and (dict_para.get("cache", False) is True or dict_para.get("cache_dir")):
+            self.cache = detection_cache.DetectionCache(frozen_graph_path or dict_para["weights_path"], config,
+                                                        cache_dir=dict_para.get("cache_dir"),
+                                                        max_disk_bytes=dict_para.get("cache_max_bytes", detection_cache.DEFAULT_MAX_DISK_BYTES),
+                                                        max_memory_items=dict_para.get("cache_memory_items", detection_cache.DEFAULT_MAX_MEMORY_ITEMS),
+                                                        lazy=self.lazy, packed=self.packed)
+
+        # Running a blank batch so the first real image does not pay for
+        # graph initialization
+        if dict_para.get("warmup", True) is True:
+            self.warmup()
+
+        # Attached after the warm-up, so its blank batch is not timed
+        self.model.timer = self.timer
+
+        # Seconds from construction until ready to predict
+        self.startup_time = time.time() - start
         
         return None
 
-    def __call__(self, image_path):
+    def warmup(self):
 
-        return self.predict(image_path)
+        config = self.model.config
+        blank_image = np.zeros(config.IMAGE_SHAPE, dtype=np.uint8)
+        self.model.detect([blank_image] * config.BATCH_SIZE)
 
-    def predict(self, image_path):
+        return None
+
+    def close(self):
+
+        # Thread pool and batch arrays of the molding (see modellib.MaskRCNN.close)
+        self.model.close()
+
+        return None
+
+    def __call__(self, image_source):
 
-        # Checking that input image is valid
-        assert pathlib.Path(image_path).is_file() is True, "Mask-RCNN - Invalid Image Path"
+        return self.predict(image_source)
 
-        # Feeding image into Mask-RCNN Model
-        image = cv2.imread(image_path)
-        self.results = self.model.detect([image], verbose=1)
+    def predict(self, image_source):
+        """
+        image_source can be an image path, a numpy array, encoded JPEG/PNG
+        bytes or a file-like object (see load_image).
+        """
+
+        # Reading image (no disk access for in-memory sources)
+        with self.timer.stage("decode"):
+            image_path, image = load_image(image_source)
+
+        # Feeding image into Mask-RCNN Model (unless already cached)
+        self.results = [self.detect_cached(image)]
 
         # Converting results into more useful data
         r = self.results[0]
-        self.result_manager = result_manager.ResultManager(self.dict_para)
+        self.result_manager = result_manager.ResultManager(self.dict_para, timer=self.timer)
         self.result_manager.input(image, r, image_path)
         crossarm_images_list = self.result_manager.get_crossarm_images()
 
         return crossarm_images_list
 
+    def detect_cached(self, image):
+
+        if self.cache is None:
+            return self.model.detect([image], verbose=self.dict_para.get("verbose", 1), lazy=self.lazy, packed=self.packed)[0]
+
+        cache_key = self.cache.key(image)
+        r = self.cache.get(cache_key)
+
+        if r is None:
+            r = self.model.detect([image], verbose=self.dict_para.get("verbose", 1), lazy=self.lazy, packed=self.packed)[0]
+            self.cache.put(cache_key, r)
+
+        return r
+
+    def predict_stream(self, inputs, batch_size=None, workers=None, executor=None):
+        """
+        Generator version of predict() for many images. inputs is an
+        iterable of any of the image sources accepted by predict().
+        While one batch runs through the network, the next batch is read
+        and molded on a thread pool. One ResultManager is yielded per input,
+        in the same order as the inputs.
+
+        batch_size cannot exceed the batch size the model was built with
+        (dict_para["batch_size"], default 1).
+
+        executor: Optional thread pool to read and mold on, kept open
+        afterwards (e.g. one for all the streams of a service). Otherwise,
+        a pool of "workers" threads is made for this stream.
+        """
+
+        model_batch_size = self.model.config.BATCH_SIZE
+        batch_size = batch_size or model_batch_size
+        assert batch_size <= model_batch_size, "Mask-RCNN - batch_size larger than model's BATCH_SIZE"
+
+        own_executor = executor is None
+        if own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        batches = self.iter_batches(inputs, batch_size)
+
+        # Batch arrays the images are molded into (see MaskRCNN.mold_buffer),
+        # reused for the whole stream: one for the batch being predicted,
+        # one for the batch being prefetched
+        mold_buffers = ({}, {})
+        batch_number = 0
+
+        try:
+            # Starting to prepare the first batch
+            pending = self.submit_batch(executor, next(batches, None), mold_buffers[0])
+
+            while pending is not None:
+
+                prepared = [future.result() for future in pending]
+
+                # Prefetching next batch while the current one is predicted
+                batch_number += 1
+                pending = self.submit_batch(executor, next(batches, None), mold_buffers[batch_number % 2])
+
+                for image_path, image, r in self.detect_batch(prepared):
+                    result_manager_object = result_manager.ResultManager(self.dict_para, timer=self.timer)
+                    result_manager_object.input(image, r, image_path)
+                    yield result_manager_object
+
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False)
+
+    def iter_batches(self, inputs, batch_size):
+
+        batch = []
+
+        for item in inputs:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def submit_batch(self, executor, batch, mold_buffers=None):
+
+        if batch is None:
+            return None
+
+        return [executor.submit(self.prepare_input, item, mold_buffers, slot) for slot, item in enumerate(batch)]
+
+    def prepare_input(self, item, mold_buffers=None, slot=0):
+
+        # Reading or decoding the image
+        with self.timer.stage("decode"):
+            image_path, image = load_image(item)
+
+        # Images already in the cache are not molded
+        cache_key, cached_results = None, None
+        if self.cache is not None:
+            cache_key = self.cache.key(image)
+            cached_results = self.cache.get(cache_key)
+            if cached_results is not None:
+                return image_path, image, cache_key, cached_results, None, None, None
+
+        # Molding image to the format expected by the network, into its slot
+        # of the batch array when mold_buffers is given
+        out = None
+        if mold_buffers is not None:
+            buffer = self.model.mold_buffer([image], mold_buffers)
+            out = None if buffer is None else buffer[slot:slot + 1]
+        molded_images, image_metas, windows = self.model.mold_inputs([image], out=out)
+
+        return image_path, image, cache_key, None, molded_images[0], image_metas[0], windows[0]
+
+    def predict_molded(self, molded_images, image_metas):
+
+        # Network only (no unmolding). Usable from worker threads
+        with self.graph.as_default():
+            return self.model.predict_prepared(molded_images, image_metas)
+
+    def detect_batch(self, prepared):
+
+        image_paths, images, cache_keys, results, molded_images, image_metas, windows = map(list, zip(*prepared))
+
+        # Only the images missing from the cache go through the network.
+        # Partial batches are padded inside detect_prepared
+        missing = [i for i, r in enumerate(results) if r is None]
+
+        if missing:
+            detected = self.model.detect_prepared([images[i] for i in missing],
+                                                  stack_molded_images([molded_images[i] for i in missing]),
+                                                  np.stack([image_metas[i] for i in missing]),
+                                                  np.stack([windows[i] for i in missing]),
+                                                  lazy=self.lazy, packed=self.packed)
+
+            for i, r in zip(missing, detected):
+                results[i] = r
+                if self.cache is not None:
+                    self.cache.put(cache_keys[i], r)
+
+        return list(zip(image_paths, images, results))
+
+#------------------------------------------------------------------
+# Functions
+
+def stack_molded_images(molded_images):
+
+    # Images molded into the first slots of one batch array (prepare_input)
+    # are already a batch, the others are copied into a new one
+    buffer = molded_images[0].base
+    if buffer is not None and buffer.ndim == 4 and all(
+            molded_image.base is buffer and np.may_share_memory(molded_image, buffer[slot])
+            for slot, molded_image in enumerate(molded_images)):
+        return buffer[:len(molded_images)]
+
+    return np.stack(molded_images)
+
+def load_image(image_source):
+    """
+    Returns (image_path, image) for any supported image source:
+
+    path (str or pathlib.Path): read with cv2.imread.
+    numpy array: used as given, without copying if it is already a
+        contiguous uint8 array with 3 channels. Grayscale ([H, W] or
+        [H, W, 1]) and BGRA arrays are converted to 3 channels. Other
+        dtypes and shapes are rejected rather than cast (e.g. 0-1 floats
+        would all become 0). No channel reordering is done, so it should
+        be in the same order cv2.imread would produce.
+    bytes, bytearray or memoryview: encoded JPEG/PNG, decoded in memory.
+    file-like object (anything with read()): its content is decoded
+        in memory.
+
+    image_path is None unless the source was a path or a named file object.
+    Invalid or unreadable sources raise ValueError.
+    """
+
+    if isinstance(image_source, np.ndarray):
+
+        image = image_source
+
+        if image.dtype != np.uint8:
+            raise ValueError("Mask-RCNN - Image Array Must Be uint8, not {}".format(image.dtype))
+
+        if image.ndim not in (2, 3) or (image.ndim == 3 and image.shape[-1] not in (1, 3, 4)):
+            raise ValueError("Mask-RCNN - Image Array Must Be [H, W] or [H, W, 1|3|4], not {}".format(image.shape))
+
+        # Grayscale ([H, W] or [H, W, 1]) and alpha channels converted for consistency
+        if image.ndim == 2 or image.shape[-1] == 1:
+            image = cv2.cvtColor(image.reshape(image.shape[:2]), cv2.COLOR_GRAY2BGR)
+        elif image.shape[-1] == 4:
+            image = image[..., :3]
+
+        # No copy if already contiguous
+        return None, np.ascontiguousarray(image)
+
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return None, decode_image(image_source)
+
+    if hasattr(image_source, "read"):
+        image_path = getattr(image_source, "name", None)
+        image_path = image_path if isinstance(image_path, str) else None
+        return image_path, decode_image(image_source.read())
+
+    # Otherwise, it must be a path
+    image_path = str(image_source)
+    if pathlib.Path(image_path).is_file() is False:
+        raise ValueError("Mask-RCNN - Invalid Image Path")
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError("Mask-RCNN - Unreadable Image File")
+
+    return image_path, image
+
+def decode_image(encoded_image):
+
+    buffer = np.frombuffer(encoded_image, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+
+    # Not an assert, so invalid data is still rejected under python -O
+    if image is None:
+        raise ValueError("Mask-RCNN - Undecodable Image Data")
+
+    return image
+
 #------------------------------------------------------------------
 # Parasidic Classes (small and insignificant but needed to run MaskRCNN)
 
@@ -100,11 +400,34 @@ class CrossarmConfig(Config):
 	VALIDATION_STEPS = 5
 
 class InferenceConfig(CrossarmConfig):
-	# Set batch size to 1 since we'll be running inference on
-	# one image at a time. Batch size = GPU_COUNT * IMAGES_PER_GPU
+	# Batch size defaults to 1 since predict() runs one image at a time.
+	# Larger batches can be used with predict_stream(); detect() pads the
+	# last partial batch. Batch size = GPU_COUNT * IMAGES_PER_GPU
 	GPU_COUNT = 1
 	IMAGES_PER_GPU = 1
 
+	# Images are resized with skimage, as in training. "opencv" is faster
+	# but pixel values can differ by one (dict_para["resize_backend"])
+	IMAGE_RESIZE_BACKEND = "skimage"
+
+	def __init__(self, images_per_gpu=None, overrides=None, resize_backend=None):
+
+		# Allowing larger batches (dict_para["batch_size"])
+		if images_per_gpu is not None:
+			self.IMAGES_PER_GPU = images_per_gpu
+
+		if resize_backend is not None:
+			assert resize_backend in ["skimage", "opencv"], "InferenceConfig - Invalid resize_backend"
+			self.IMAGE_RESIZE_BACKEND = resize_backend
+
+		# Other fields (dict_para["config_overrides"]), e.g. {"IMAGE_MAX_DIM": 768}.
+		# Set before Config.__init__ so the derived fields follow
+		for key, value in (overrides or {}).items():
+			assert hasattr(self, key), "InferenceConfig - Unknown Field {}".format(key)
+			setattr(self, key, value)
+
+		super().__init__()
+
 #------------------------------------------------------------------
 # Running Code
 
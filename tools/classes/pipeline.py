@@ -0,0 +1,397 @@
+# Library Imports
+import queue
+import threading
+import functools
+import concurrent.futures
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from . import result_manager
+from . import result_sinks
+from .maskrcnn import load_image, modellib
+
+#------------------------------------------------------------------
+# Constants
+
+# Marks the end of the input stream in the stage queues
+END = object()
+
+# Seconds between checks of the stop flag while blocked on a queue
+POLL_INTERVAL = 0.1
+
+DEFAULT_WORKERS = {"decode": 2, "mold": 2, "predict": 1, "unmold": 2,
+                   "postprocess": 2, "classify": 1, "write": 1}
+
+#------------------------------------------------------------------
+# Classes
+
+class Stage():
+
+    """
+    One step of a Pipeline.
+
+    function: called with one item (or with a list of up to batch_size
+        items, returning a list, if batch_size > 1).
+    workers: number of items processed concurrently.
+    kind: "thread" or "process". With "process", function and items must
+        be picklable (e.g. a module-level function or functools.partial).
+    queue_size: bound of the queue in front of the stage. A full queue
+        blocks the previous stage (back-pressure).
+    """
+
+    def __init__(self, name, function, workers=1, kind="thread", queue_size=8, batch_size=1):
+
+        assert kind in ["thread", "process"], "Stage - kind must be thread or process"
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.kind = kind
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+        return None
+
+class Pipeline():
+
+    """
+    Runs items through a list of Stages, each with its own worker pool,
+    connected by bounded queues. Outputs are yielded in input order.
+
+    Usage:
+
+        pipeline = Pipeline([Stage("decode", decode, workers=4), ...])
+        for output in pipeline.run(inputs):
+            print(pipeline.queue_depths())
+    """
+
+    def __init__(self, stages):
+
+        self.stages = stages
+        self.queues = []
+        self.max_queue_depths = {}
+        self.stop_event = threading.Event()
+
+        return None
+
+    def queue_depths(self):
+
+        # Current number of items waiting in front of each stage
+        return {stage.name: stage_queue.qsize() for stage, stage_queue in zip(self.stages, self.queues)}
+
+    def run(self, inputs):
+
+        # queues[i] feeds stage i, the last queue holds the outputs
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self.queues.append(queue.Queue(maxsize=self.stages[-1].queue_size))
+        self.max_queue_depths = {stage.name: 0 for stage in self.stages}
+        self.stop_event.clear()
+
+        executors = []
+        threads = [threading.Thread(target=self.feed, args=(inputs,), daemon=True)]
+
+        for index, stage in enumerate(self.stages):
+
+            executor = None
+            if stage.kind == "process":
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=stage.workers)
+                executors.append(executor)
+
+            # Workers still running in this stage, the last one forwards END
+            remaining = {"count": stage.workers, "lock": threading.Lock()}
+
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self.stage_worker,
+                                                args=(index, executor, remaining),
+                                                daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Reordering outputs by sequence number
+            next_sequence = 0
+            finished = {}
+
+            while True:
+                entry = self.get(len(self.stages))
+                if entry is END:
+                    break
+
+                sequence, value = entry
+                finished[sequence] = value
+
+                while next_sequence in finished:
+                    value = finished.pop(next_sequence)
+                    next_sequence += 1
+                    if isinstance(value, StageFailure):
+                        raise value.error
+                    yield value
+
+        finally:
+            # Also reached when the caller stops iterating early
+            self.stop_event.set()
+            for executor in executors:
+                executor.shutdown(wait=False)
+
+    def feed(self, inputs):
+
+        try:
+            sequence = 0
+            try:
+                for item in inputs:
+                    self.put(0, (sequence, item))
+                    sequence += 1
+            except PipelineStopped:
+                return None
+            except Exception as error:
+                self.put(0, (sequence, StageFailure("input", error)))
+            self.put(0, END)
+        except PipelineStopped:
+            return None
+
+    def stage_worker(self, index, executor, remaining):
+
+        stage = self.stages[index]
+
+        try:
+            while True:
+
+                entry = self.get(index)
+
+                if entry is END:
+                    # Leaving END for the other workers of this stage
+                    self.put(index, END)
+                    with remaining["lock"]:
+                        remaining["count"] -= 1
+                        last = remaining["count"] == 0
+                    if last:
+                        self.put(index + 1, END)
+                    return None
+
+                batch = [entry]
+
+                # Gathering a batch from what is already waiting
+                while len(batch) < stage.batch_size:
+                    try:
+                        entry = self.queues[index].get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is END:
+                        self.put(index, END)
+                        break
+                    batch.append(entry)
+
+                # Failures from earlier stages skip this one
+                for sequence, value in batch:
+                    if isinstance(value, StageFailure):
+                        self.put(index + 1, (sequence, value))
+                batch = [(sequence, value) for sequence, value in batch if not isinstance(value, StageFailure)]
+
+                if not batch:
+                    continue
+
+                values = [value for sequence, value in batch]
+
+                try:
+                    if stage.batch_size > 1:
+                        outputs = self.call(executor, stage.function, values)
+                    else:
+                        outputs = [self.call(executor, stage.function, values[0])]
+                except Exception as error:
+                    outputs = [StageFailure(stage.name, error)] * len(batch)
+
+                for (sequence, value), output in zip(batch, outputs):
+                    self.put(index + 1, (sequence, output))
+
+        except PipelineStopped:
+            return None
+
+    def call(self, executor, function, argument):
+
+        if executor is None:
+            return function(argument)
+
+        return executor.submit(function, argument).result()
+
+    def put(self, index, entry):
+
+        while True:
+            try:
+                self.queues[index].put(entry, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                if self.stop_event.is_set():
+                    raise PipelineStopped()
+
+        if index < len(self.stages):
+            depth = self.queues[index].qsize()
+            name = self.stages[index].name
+            if depth > self.max_queue_depths[name]:
+                self.max_queue_depths[name] = depth
+
+        return None
+
+    def get(self, index):
+
+        while True:
+            try:
+                return self.queues[index].get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    raise PipelineStopped()
+
+#------------------------------------------------------------------
+# Parasidic Classes (small and insignificant but needed to run Pipeline)
+
+class StageFailure():
+
+    def __init__(self, stage_name, error):
+
+        self.stage_name = stage_name
+        self.error = error
+
+        return None
+
+class PipelineStopped(Exception):
+    pass
+
+#------------------------------------------------------------------
+# Crossarm Pipeline
+
+def build_crossarm_pipeline(maskrcnn_model, crack_classifier=None, sinks=None,
+                            workers=None, kinds=None, queue_size=8, classify_batch_size=16):
+
+    """
+    Builds the crossarm flow as a Pipeline:
+
+    decode -> mold -> predict -> unmold -> postprocess (ResultManager)
+    -> classify (CrackClassifier) -> write (sinks)
+
+    Each run() output is the record of one image (see result_sinks.build_record).
+
+    workers: dict of workers per stage, see DEFAULT_WORKERS.
+    kinds: dict of "thread"/"process" per stage. Only decode and
+        postprocess can run in processes (the other stages use the models).
+    classify_batch_size: max number of images whose crops are classified
+        in one predict.
+    """
+
+    workers = dict(DEFAULT_WORKERS, **(workers or {}))
+    kinds = kinds or {}
+    sinks = sinks or []
+
+    model = maskrcnn_model.model
+    dict_para = maskrcnn_model.dict_para
+
+    def stage(name, function, batch_size=1):
+        return Stage(name, function, workers=workers[name], kind=kinds.get(name, "thread"),
+                     queue_size=queue_size, batch_size=batch_size)
+
+    def mold(item):
+        # Images already in the detection cache skip mold, predict and unmold
+        if maskrcnn_model.cache is not None:
+            item["cache_key"] = maskrcnn_model.cache.key(item["image"])
+            cached_results = maskrcnn_model.cache.get(item["cache_key"])
+            if cached_results is not None:
+                item["results"] = cached_results
+                return item
+
+        molded_images, image_metas, windows = model.mold_inputs([item["image"]])
+        item["molded_image"], item["image_meta"], item["window"] = molded_images[0], image_metas[0], windows[0]
+        return item
+
+    def predict(items):
+        missing = [item for item in items if "results" not in item]
+        if not missing:
+            return items
+        detections, mrcnn_mask = maskrcnn_model.predict_molded(np.stack([item["molded_image"] for item in missing]),
+                                                               np.stack([item["image_meta"] for item in missing]))
+        for i, item in enumerate(missing):
+            item["detections"], item["mrcnn_mask"] = detections[i], mrcnn_mask[i]
+        return items
+
+    def unmold(item):
+        if "results" in item:
+            return item
+
+        with model.timer.stage("unmold"):
+            rois, class_ids, scores, masks = model.unmold_detections(item["detections"], item["mrcnn_mask"],
+                                                                     item["image"].shape, item["molded_image"].shape,
+                                                                     item["window"], raw_masks=maskrcnn_model.lazy,
+                                                                     packed_masks=maskrcnn_model.packed)
+
+        # Network inputs and outputs are no longer needed
+        for key in ["molded_image", "image_meta", "window", "detections", "mrcnn_mask"]:
+            del item[key]
+
+        if maskrcnn_model.lazy:
+            item["results"] = modellib.DetectionResult(rois, class_ids, scores, masks, item["image"].shape)
+        else:
+            item["results"] = {"rois": rois, "class_ids": class_ids, "scores": scores, "masks": masks}
+
+        if maskrcnn_model.cache is not None:
+            maskrcnn_model.cache.put(item["cache_key"], item["results"])
+
+        return item
+
+    def classify(items):
+        crops = [item["result_manager"].get_crossarm_images() for item in items]
+        all_crops = [crop for image_crops in crops for crop in image_crops]
+
+        if crack_classifier is None or not all_crops:
+            for item in items:
+                item["tags"], item["probabilities"] = None, None
+            return items
+
+        probabilities, tags = crack_classifier.predict_batch(all_crops)
+
+        # Routing the tags back to each image
+        start = 0
+        for item, image_crops in zip(items, crops):
+            end = start + len(image_crops)
+            item["tags"], item["probabilities"] = tags[start:end], probabilities[start:end]
+            start = end
+
+        return items
+
+    def write(item):
+        record = result_sinks.build_record(item["result_manager"], item["tags"], item["probabilities"])
+        result_sinks.emit_record(sinks, record)
+        return record
+
+    # The timer is only shared with stages running in threads
+    def timer_for(name):
+        return maskrcnn_model.timer if kinds.get(name, "thread") == "thread" else None
+
+    stages = [stage("decode", functools.partial(decode_item, timer=timer_for("decode"))),
+              stage("mold", mold),
+              stage("predict", predict, batch_size=model.config.BATCH_SIZE),
+              stage("unmold", unmold),
+              stage("postprocess", functools.partial(postprocess_item, dict_para, timer=timer_for("postprocess"))),
+              stage("classify", classify, batch_size=classify_batch_size),
+              stage("write", write)]
+
+    for name in ["mold", "predict", "unmold", "classify", "write"]:
+        assert kinds.get(name, "thread") == "thread", "Pipeline - {} stage must use threads".format(name)
+
+    return Pipeline(stages)
+
+def decode_item(image_source, timer=None):
+
+    if timer is None:
+        image_path, image = load_image(image_source)
+    else:
+        with timer.stage("decode"):
+            image_path, image = load_image(image_source)
+
+    return {"image_path": image_path, "image": image}
+
+def postprocess_item(dict_para, item, timer=None):
+
+    result_manager_object = result_manager.ResultManager(dict_para, timer=timer)
+    result_manager_object.input(item["image"], item["results"], item["image_path"])
+
+    return {"image_path": item["image_path"], "result_manager": result_manager_object}
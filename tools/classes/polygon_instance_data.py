@@ -0,0 +1,203 @@
+# Imports
+import cv2
+import numpy as np
+import sys
+import os
+
+# Local Imports
+sys.path.append(os.path.dirname(__file__)) # Appendings this file's path to PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import instance_data
+from Mask_RCNN.mrcnn import utils
+
+# Shapely is only needed by the polygon engine (dict_para["postprocess_engine"])
+shapely = utils.LazyModule("shapely")
+
+#-----------------------------------------------------------------------------------------
+# Constants
+
+MASK_THRESHOLD = 0.5
+
+# Default simplification tolerance of the polygons, in pixels
+DEFAULT_TOLERANCE = 1.0
+
+# The 10x10 kernel anchored at (5,5), applied DILATION_ITERATIONS times,
+# grows a mask by 16 pixels up/left and 20 pixels down/right
+DILATION_LOW = -instance_data.DILATION_ITERATIONS * (instance_data.DILATION_KERNEL_SIZE - 1 - instance_data.DILATION_KERNEL_SIZE // 2)
+DILATION_HIGH = instance_data.DILATION_ITERATIONS * (instance_data.DILATION_KERNEL_SIZE // 2)
+
+# Fractional bits of the coordinates given to cv2.fillPoly
+FIXED_POINT_SHIFT = 4
+
+#-----------------------------------------------------------------------------------------
+# Class
+
+class PolygonInstanceData(instance_data.InstanceData):
+
+	"""
+	InstanceData of the polygon engine: the instance is a shapely polygon in
+	image coordinates (pixel edges, the pixel (x, y) covering [x, x+1] x
+	[y, y+1]), made from the small mrcnn_mask probabilities. Area, overlaps,
+	contours and the min area rectangle are computed on the polygon, so no
+	[H, W] array is made unless mask is accessed.
+	"""
+
+	__slots__ = ["polygon", "tolerance"]
+
+	def __init__(self, data, image_shape, tolerance=DEFAULT_TOLERANCE):
+
+		# Data: box, raw mask (e.g. 28x28 probabilities), class_id, score
+		self.shape = tuple(image_shape[:2])
+		self.tolerance = tolerance
+
+		super().__init__(data)
+
+		return None
+
+	def make_mask_np_friendly(self, raw_mask):
+
+		polygon = raw_mask_to_polygon(raw_mask, self.box, self.tolerance)
+
+		# Same growth as the cv2.dilate of the raster engine, kept in the image
+		height, width = self.shape
+		polygon = dilate_polygon(polygon).intersection(shapely.geometry.box(0, 0, width, height))
+
+		self.polygon = polygon
+		self.mask_pixel_count = polygon.area
+
+		return None
+
+	@property
+	def window(self):
+
+		if self.polygon.is_empty:
+			return slice(0, 0), slice(0, 0)
+
+		x1, y1, x2, y2 = self.polygon.bounds
+
+		return slice(int(np.floor(y1)), int(np.ceil(y2))), slice(int(np.floor(x1)), int(np.ceil(x2)))
+
+	@property
+	def mask(self):
+
+		# Full-frame 255/0 raster of the polygon, built on demand
+		mask = np.zeros(self.shape, dtype=np.uint8)
+
+		for part in polygon_parts(self.polygon):
+			cv2.fillPoly(mask, [to_fixed_point(part.exterior.coords)], 255, shift=FIXED_POINT_SHIFT)
+			for interior in part.interiors:
+				cv2.fillPoly(mask, [to_fixed_point(interior.coords)], 0, shift=FIXED_POINT_SHIFT)
+
+		return mask
+
+	def count_shared_pixels(self, other):
+
+		# Area of the intersection of both polygons
+		return self.polygon.intersection(other.polygon).area
+
+	def find_contours(self):
+
+		# Exterior of every part, largest first, in pixel-center coordinates
+		# (same as cv2.findContours)
+		parts = sorted(polygon_parts(self.polygon), key=lambda part: part.area, reverse=True)
+		self.cnts = [np.round(np.asarray(part.exterior.coords)[:-1] - 0.5).astype(np.int32).reshape(-1, 1, 2)
+					 for part in parts]
+
+		return self.cnts
+
+	def min_area_rect(self):
+
+		# Of the largest part, with sub-pixel precision
+		part = max(polygon_parts(self.polygon), key=lambda part: part.area)
+
+		return cv2.minAreaRect(np.float32(np.asarray(part.exterior.coords)[:-1] - 0.5))
+
+	def apply_mask(self, image):
+
+		image_copy = np.zeros_like(image)
+		inside = self.mask == 255
+		image_copy[inside] = image[inside]
+
+		return image_copy
+
+	def apply_contour(self, image):
+
+		image_copy = np.zeros_like(image)
+		contour_mask = np.zeros(self.shape, dtype=np.uint8)
+		cv2.fillPoly(contour_mask, pts=self.cnts, color=255)
+		inside = contour_mask == 255
+		image_copy[inside] = image[inside]
+
+		return image_copy
+
+#-----------------------------------------------------------------------------------------
+# Functions
+
+def to_fixed_point(coords):
+
+	# Pixel-edge coordinates to the pixel-center ones of OpenCV
+	return np.round((np.asarray(coords) - 0.5) * (1 << FIXED_POINT_SHIFT)).astype(np.int32)
+
+def polygon_parts(polygon):
+
+	if polygon.is_empty:
+		return []
+	if polygon.geom_type == "Polygon":
+		return [polygon]
+
+	return [part for part in polygon.geoms if part.geom_type == "Polygon"]
+
+def raw_mask_to_polygon(raw_mask, box, tolerance=DEFAULT_TOLERANCE):
+
+	"""
+	Polygon of the MASK_THRESHOLD level of raw_mask (a [h, w] float mask,
+	typically 28x28) stretched over box [y1, x1, y2, x2], found with sub-pixel
+	marching squares. Follows the geometry of utils.unmold_mask_local: the
+	mask pixel centers spread evenly over the box, zeros around the mask,
+	nothing outside of the box. Holes are filled, as with external contours.
+	"""
+
+	y1, x1, y2, x2 = [float(v) for v in box]
+	scale_y = (y2 - y1) / raw_mask.shape[0]
+	scale_x = (x2 - x1) / raw_mask.shape[1]
+
+	# One pixel of zeros so every contour is closed
+	padded = np.pad(np.asarray(raw_mask, dtype=np.float32), 1, mode="constant")
+
+	polygons = []
+	for contour in utils.skimage.measure.find_contours(padded, MASK_THRESHOLD):
+		if contour.shape[0] < 4:
+			continue
+		xs = x1 + (contour[:, 1] - 0.5) * scale_x
+		ys = y1 + (contour[:, 0] - 0.5) * scale_y
+		polygons.append(shapely.geometry.Polygon(np.column_stack([xs, ys])).buffer(0))
+
+	if not polygons:
+		return shapely.geometry.Polygon()
+
+	polygon = shapely.ops.unary_union(polygons).intersection(shapely.geometry.box(x1, y1, x2, y2))
+
+	return polygon.simplify(tolerance)
+
+def dilate_polygon(polygon, low=DILATION_LOW, high=DILATION_HIGH):
+
+	"""
+	Minkowski sum of polygon and the square [low, high] x [low, high], which
+	is what a square-kernel cv2.dilate does to a raster mask: the polygon
+	itself plus, for every edge, the convex hull of the edge swept over the
+	square.
+	"""
+
+	corners = np.array([(low, low), (high, low), (high, high), (low, high)], dtype=np.float64)
+	pieces = [polygon]
+
+	for part in polygon_parts(polygon):
+		for ring in [part.exterior] + list(part.interiors):
+			coords = np.asarray(ring.coords)
+			# [edges, 8, 2]: both ends of every edge, moved to the 4 corners
+			points = np.concatenate([coords[:-1, None] + corners, coords[1:, None] + corners], axis=1)
+			for edge_points in points.astype(np.float32):
+				pieces.append(shapely.geometry.Polygon(cv2.convexHull(edge_points)[:, 0]))
+
+	return shapely.ops.unary_union(pieces)
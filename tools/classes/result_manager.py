@@ -5,6 +5,7 @@ import imutils
 from pathlib import Path
 import sys
 import collections
+import logging
 import os
 
 # Local Imports
@@ -13,16 +14,35 @@ sys.path.append(ROOT_DIR)
 sys.path.append(os.path.dirname(__file__)) # Appendings this file's path to PATH
 
 import instance_data
+import polygon_instance_data
 import global_variables as gv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from Mask_RCNN.mrcnn import utils
+
+# Post-processing engines (dict_para["postprocess_engine"]):
+# raster: full-size masks (InstanceData)
+# polygon: polygons made from the mrcnn_mask probabilities (PolygonInstanceData),
+#	needs the raw masks of detect(lazy=True), otherwise raster is used
+ENGINES = ["raster", "polygon"]
+
+# Per-image messages. Silence with logging.getLogger("tools.classes").setLevel(...)
+logger = logging.getLogger("tools.classes.result_manager")
+
 #-----------------------------------------------------------------------------------------
 # Class
 
 class ResultManager():
 
-	def __init__(self, dict_para):
+	def __init__(self, dict_para, timer=None):
 	
 		self.dict_para = dict_para
+
+		self.engine = dict_para.get("postprocess_engine", "raster")
+		assert self.engine in ENGINES, "ResultManager - Invalid postprocess_engine"
+
+		# Durations of the dilate, dedup, contours and crop stages (see utils.StageTimer)
+		self.timer = timer if timer is not None else utils.StageTimer(enabled=False)
 		
 		return None
 
@@ -33,7 +53,6 @@ class ResultManager():
 		self.no_instance_flag = False
 		
 		boxes = results['rois']
-		masks = results['masks']
 		class_ids = results['class_ids']
 		scores = results['scores']
 	
@@ -41,20 +60,70 @@ class ResultManager():
 		self.instance_list = []
 		
 		if not number_of_instances:
-			print("NO INSTANCES TO DISPLAY")
-			image = imutils.resize(image, width=700)
-			#cv2.imshow("Input", image)
-			#cv2.waitKey(0)
+			logger.info("No instances found in {}".format(image_path))
 			self.no_instance_flag = True
 			return None
 			
-		for i in range(number_of_instances):
-			self.instance_list.append(instance_data.InstanceData((boxes[i],masks[:,:,i],class_ids[i],scores[i])))
-	
+		raw_masks = self.get_raw_masks(results) if self.engine == "polygon" else None
+
+		# InstanceData dilates each mask
+		with self.timer.stage("dilate"):
+			if raw_masks is not None:
+				tolerance = self.dict_para.get("polygon_tolerance", polygon_instance_data.DEFAULT_TOLERANCE)
+				for i in range(number_of_instances):
+					self.instance_list.append(polygon_instance_data.PolygonInstanceData((boxes[i],raw_masks[i],class_ids[i],scores[i]),
+																					   image.shape, tolerance=tolerance))
+			else:
+				masks = results['masks']
+				packed = utils.is_packed_masks(masks)
+				for i in range(number_of_instances):
+					if packed:
+						# Only the box of each packed mask is unpacked
+						y1, x1, _, _ = masks.boxes[i]
+						self.instance_list.append(instance_data.InstanceData((boxes[i],masks.crop(i),class_ids[i],scores[i]),
+																			 image_shape=image.shape, offset=(x1, y1)))
+					else:
+						self.instance_list.append(instance_data.InstanceData((boxes[i],masks[:,:,i],class_ids[i],scores[i])))
+
+		# A mask with no pixel above the threshold has no contour, hence no
+		# min area rect to crop
+		self.remove_empty_instances()
+		if not self.instance_list:
+			logger.info("No non-empty instances found in {}".format(image_path))
+			self.no_instance_flag = True
+			return None
+
 		self.sort_instances()
-		self.check_for_repeat_instances()
-		self.generate_contours()
-		self.crop_crossarms()
+
+		with self.timer.stage("dedup"):
+			self.check_for_repeat_instances()
+		with self.timer.stage("contours"):
+			self.generate_contours()
+		with self.timer.stage("crop"):
+			self.crop_crossarms()
+
+		return None
+
+	def get_raw_masks(self, results):
+
+		# [N, h, w] mrcnn_mask probabilities: from a DetectionResult, or a
+		# dict with "raw_masks"
+		raw_masks = getattr(results, "raw_masks", None)
+		if raw_masks is None and isinstance(results, dict):
+			raw_masks = results.get("raw_masks")
+
+		if raw_masks is None:
+			logger.debug("No raw masks, using the raster engine")
+
+		return raw_masks
+
+	def remove_empty_instances(self):
+
+		empty_instances = [instance for instance in self.instance_list if not instance.mask_pixel_count]
+
+		if empty_instances:
+			logger.info("Removed {} empty instances".format(len(empty_instances)))
+			self.instance_list = [instance for instance in self.instance_list if instance.mask_pixel_count]
 
 		return None
 
@@ -64,27 +133,60 @@ class ResultManager():
 		
 		return None
 		
+	def find_overlapping_pairs(self):
+
+		# Sort-and-sweep over the mask windows: instances sorted by left edge,
+		# each one only compared with the still open windows to its left.
+		# Returns, for every instance, the indexes of the instances whose
+		# windows overlap its own
+		overlapping = collections.defaultdict(list)
+		windows = [instance.window for instance in self.instance_list]
+		order = sorted(range(len(windows)), key=lambda i: windows[i][1].start)
+		active = []
+
+		for i in order:
+			rows, columns = windows[i]
+			active = [j for j in active if windows[j][1].stop > columns.start]
+
+			for j in active:
+				if windows[j][0].start < rows.stop and rows.start < windows[j][0].stop:
+					overlapping[i].append(j)
+					overlapping[j].append(i)
+
+			active.append(i)
+
+		return overlapping
+
 	def check_for_repeat_instances(self):
-	
-		checking_mask = None
+
+		# An instance is a repeat if more than shared_mask_ratio_threshold % of
+		# its (dilated) mask is shared with a larger instance that is not a
+		# repeat itself. instance_list is sorted by mask size, largest first
 		self.to_be_removed_instances = []
+		overlapping = self.find_overlapping_pairs()
 		
 		for counter, instance in enumerate(self.instance_list):
-			if type(checking_mask) == type(None):
-				checking_mask = instance.mask
-			else:
-				current_instance_nonzero = cv2.countNonZero(instance.mask)
+
+			current_instance_nonzero = instance.mask_pixel_count
+			if not current_instance_nonzero:
+				continue
+
+			for other_counter in sorted(overlapping[counter]):
+
+				other_instance = self.instance_list[other_counter]
+				if other_counter >= counter or other_instance.unique is False:
+					continue
 				
-				shared_mask = cv2.bitwise_and(checking_mask, instance.mask)
-				shared_nonzero = cv2.countNonZero(shared_mask)
+				shared_nonzero = other_instance.count_shared_pixels(instance)
 				
 				ratio = shared_nonzero/current_instance_nonzero * 100
 				
-				print("Instance {} - Ratio: {}".format(counter, ratio))
+				logger.debug("Instance {} - Instance {} - Ratio: {}".format(counter, other_counter, ratio))
 				
 				if ratio > self.dict_para["shared_mask_ratio_threshold"]: # gv.SHARED_MASK_RATIO_THRESHOLD = 30
-					print("Removed {} instance due to high sharing value".format(counter))
+					logger.info("Removed {} instance due to high sharing value".format(counter))
 					instance.unique = False
+					break
 		
 		return None
 		
@@ -92,8 +194,7 @@ class ResultManager():
 		
 		for instance in self.instance_list:
 			
-			instance.cnts = cv2.findContours(instance.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-			instance.cnts = imutils.grab_contours(instance.cnts)
+			instance.find_contours()
 	
 		return None
 	
@@ -114,26 +215,8 @@ class ResultManager():
 
 	def crop_min_area_rect(self, img, rect):
 
-		w,h = rect[1]
-		w = int(w)
-		h = int(h)
-
-		box = cv2.boxPoints(rect)
-		box = np.int0(box)
-
-		new_pts = np.float32([[0,0],[w,0],[0,h],[w,h]])
-		old_pts = np.float32([box[1],box[2],box[0],box[3]])
-
-		M = cv2.getPerspectiveTransform(old_pts, new_pts)
-		dst = cv2.warpPerspective(img, M, (w,h))
-
-		if h > w:
-			dst = imutils.resize(dst, height = int(h*0.6))
-			dst = imutils.rotate_bound(dst, angle=-90)
-		else:
-			dst = imutils.resize(dst, width = int(w*0.6))
-
-		return dst
+		# Perspective warp, INTER_AREA downscale and rotation (see instance_data.crop_min_area_rect)
+		return instance_data.crop_min_area_rect(img, rect)
 
 	def get_rect_ratio(self, rect):
 
@@ -147,27 +230,32 @@ class ResultManager():
 
 	def crop_crossarms(self):
 
+		# Short crossarms are filtered out before any crop is made. The crops
+		# of the others are only warped when first accessed (cropped_image)
 		if self.dict_para["only_long_crossarms"]:
 			
-			print("\nATTEMPTING TO REMOVE SHORT CROSSARMS")
+			logger.debug("Attempting to remove short crossarms")
 			to_be_removed = []
 
 		for instance in self.instance_list:
 
-			rect = cv2.minAreaRect(instance.cnts[0])
+			rect = instance.min_area_rect()
 			rect = self.shrink_rect(rect)
 
 			if self.dict_para["only_long_crossarms"] is True:
 
 				h_w_ratio = self.get_rect_ratio(rect)
 
-				print("HW ratio: {}".format(h_w_ratio))
+				logger.debug("HW ratio: {}".format(h_w_ratio))
 
 				if h_w_ratio > self.dict_para["long_crossarm_w_h_ratio_threshold"]:
-					print("REMOVED")
+					logger.info("Removed short crossarm (HW ratio: {})".format(h_w_ratio))
 					to_be_removed.append(instance)
+					continue
 
-			instance.cropped_image = self.crop_min_area_rect(self.image, rect) 
+			instance.image = self.image
+			instance.crop_rect = rect
+			instance.timer = self.timer
 
 		if self.dict_para["only_long_crossarms"] is True:
 			self.instance_list = [instance for instance in self.instance_list if instance not in to_be_removed]
@@ -0,0 +1,177 @@
+# Library Imports
+import os
+import json
+import pathlib
+
+# Third-Party Imports
+import cv2
+import imutils
+
+#------------------------------------------------------------------
+# Functions
+
+def build_record(result_manager, tags=None, probabilities=None):
+
+    """
+    Gathers the results of one image into a record for the sinks:
+
+    {"image_path": ..., "image": original image,
+     "instances": [{"index", "label", "score", "box", "unique",
+                    "tag", "probability", "crop"}, ...]}
+
+    tags and probabilities are the CrackClassifier outputs for the crops
+    of result_manager.get_crossarm_images(), if available.
+    """
+
+    instances = []
+
+    for counter, instance in enumerate(result_manager.instance_list):
+        instances.append({"index": counter,
+                          "label": instance.label,
+                          "score": float(instance.score),
+                          "box": [int(v) for v in instance.box],
+                          "unique": bool(instance.unique),
+                          "tag": tags[counter] if tags is not None else None,
+                          "probability": float(probabilities[counter]) if probabilities is not None else None,
+                          "crop": instance.cropped_image})
+
+    return {"image_path": result_manager.image_path,
+            "image": result_manager.image,
+            "instances": instances}
+
+def emit_record(sinks, record):
+
+    # Sinks are called in order, so e.g. a CropDirectorySink placed before
+    # a JsonlSink adds the crop paths to the JSON lines
+    for sink in sinks:
+        sink.emit(record)
+
+    return None
+
+def close_sinks(sinks):
+
+    for sink in sinks:
+        sink.close()
+
+    return None
+
+def show_crops(crops, tags=None, wait=True):
+
+    for counter, crop in enumerate(crops):
+        tag = tags[counter] if tags is not None else "Crop"
+        cv2.imshow("{} - {}".format(tag, counter), crop)
+
+    if wait is True and crops:
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+
+    return None
+
+#------------------------------------------------------------------
+# Classes
+
+class ResultSink():
+
+    # Base class: a sink receives one record per image (see build_record).
+    # Both methods do nothing here, sinks override what they need
+
+    def emit(self, record):
+        return None
+
+    def close(self):
+        return None
+
+class ListSink(ResultSink):
+
+    # Keeps every record in memory
+
+    def __init__(self):
+        self.records = []
+        return None
+
+    def emit(self, record):
+        self.records.append(record)
+        return None
+
+class CallbackSink(ResultSink):
+
+    def __init__(self, callback):
+        self.callback = callback
+        return None
+
+    def emit(self, record):
+        self.callback(record)
+        return None
+
+class JsonlSink(ResultSink):
+
+    # One JSON line per image. Images and crops are left out.
+
+    def __init__(self, path, mode="a"):
+        self.file = open(path, mode)
+        return None
+
+    def emit(self, record):
+
+        line = {"image_path": record["image_path"],
+                "instances": [{key: value for key, value in instance.items() if key != "crop"}
+                              for instance in record["instances"]]}
+
+        self.file.write(json.dumps(line) + "\n")
+        self.file.flush()
+
+        return None
+
+    def close(self):
+        self.file.close()
+        return None
+
+class CropDirectorySink(ResultSink):
+
+    # Writes every crop to <directory>/<image stem>_i<index><extension>
+    # and stores the file path in the instance as "crop_path"
+
+    def __init__(self, directory, extension=".png"):
+        self.directory = directory
+        self.extension = extension
+        self.counter = 0
+        os.makedirs(directory, exist_ok=True)
+        return None
+
+    def emit(self, record):
+
+        if record["image_path"] is not None:
+            stem = pathlib.Path(record["image_path"]).stem
+        else:
+            stem = "image_{}".format(self.counter)
+        self.counter += 1
+
+        for instance in record["instances"]:
+            crop_path = os.path.join(self.directory, "{}_i{}{}".format(stem, instance["index"], self.extension))
+            cv2.imwrite(crop_path, instance["crop"])
+            instance["crop_path"] = crop_path
+
+        return None
+
+class DisplaySink(ResultSink):
+
+    # Shows the original image and the tagged crops with OpenCV
+
+    def __init__(self, wait=True, height=700):
+        self.wait = wait
+        self.height = height
+        return None
+
+    def emit(self, record):
+
+        cv2.imshow("Original Image", imutils.resize(record["image"], height=self.height))
+
+        crops = [instance["crop"] for instance in record["instances"]]
+        tags = [instance["tag"] for instance in record["instances"]]
+        show_crops(crops, tags, wait=False)
+
+        if self.wait is True:
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+
+        return None
@@ -0,0 +1,222 @@
+# Library Imports
+import os
+import sys
+import json
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+# Modules written by MaskRCNN Team
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Constants
+
+INDEX_SUFFIX = ".index"
+
+RUN_DTYPE = np.int32
+
+#------------------------------------------------------------------
+# Class
+
+class ResultStore():
+
+    """
+    Mask-RCNN results (the dicts returned by detect) of many images, kept
+    in two files:
+
+    <path>: the RLE runs (see utils.rle_encode) of every mask, appended
+        image after image. Read through a memory map, so loading one
+        instance only touches the bytes of its runs.
+    <path>.index: one JSON line per image with its shape, rois, class_ids,
+        scores and, for every instance, the bounding box of its mask and the
+        position of its runs in <path>.
+
+    Masks are cropped to their own bounding box before encoding, so an
+    instance takes a few hundred bytes instead of a full [H, W] array.
+    Writing an image_id again replaces it (the latest entry is used).
+
+    Usage:
+
+        with ResultStore("saved_results/results.rle", mode="a") as store:
+            store.write("DJI_0027", r)
+
+        store = ResultStore("saved_results/results.rle")
+        r = store.load_results("DJI_0027")
+        box, local_mask = store.load_instance("DJI_0027", 0)
+    """
+
+    def __init__(self, path, mode="r"):
+
+        assert mode in ["r", "a", "w"], "ResultStore - mode must be r, a or w"
+
+        self.path = str(path)
+        self.index_path = self.path + INDEX_SUFFIX
+        self.mode = mode
+
+        if mode == "r":
+            assert os.path.isfile(self.path) and os.path.isfile(self.index_path), "ResultStore - Invalid Path"
+
+        self.data_file = None
+        self.index_file = None
+
+        if mode in ["a", "w"]:
+            self.data_file = open(self.path, mode + "b")
+            self.index_file = open(self.index_path, mode)
+
+        # image_id -> index entry
+        self.index = {}
+        if mode != "w":
+            self.load_index()
+
+        self.runs = None
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, image_id):
+        return image_id in self.index
+
+    def image_ids(self):
+        return list(self.index)
+
+    def load_index(self):
+
+        if not os.path.isfile(self.index_path):
+            return None
+
+        with open(self.index_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.index[entry["image_id"]] = entry
+
+        return None
+
+    def write(self, image_id, results):
+
+        assert self.data_file is not None, "ResultStore - Opened read-only"
+
+        # [H, W, N] masks or utils.PackedMasks
+        masks = results["masks"]
+        packed = utils.is_packed_masks(masks)
+        self.data_file.seek(0, os.SEEK_END)
+        offset = self.data_file.tell() // np.dtype(RUN_DTYPE).itemsize
+
+        # Bounding boxes of the masks themselves (not the rois), so nothing
+        # outside of the crop is lost
+        boxes = utils.extract_bboxes(masks)
+        instances = []
+
+        for i in range(masks.shape[-1]):
+            y1, x1, y2, x2 = boxes[i]
+            local_mask = masks.crop(i) if packed else masks[y1:y2, x1:x2, i]
+            runs = utils.rle_encode(local_mask).astype(RUN_DTYPE)
+            self.data_file.write(runs.tobytes())
+            instances.append({"box": boxes[i].tolist(), "offset": offset, "length": runs.shape[0]})
+            offset += runs.size
+
+        entry = {"image_id": image_id,
+                 "shape": list(masks.shape[:2]),
+                 "rois": np.asarray(results["rois"]).tolist(),
+                 "class_ids": np.asarray(results["class_ids"]).tolist(),
+                 "scores": np.asarray(results["scores"]).tolist(),
+                 "instances": instances}
+
+        # Runs are flushed before the index line, so the index never points
+        # past the end of the data file
+        self.data_file.flush()
+        self.index_file.write(json.dumps(entry) + "\n")
+        self.index_file.flush()
+
+        self.index[image_id] = entry
+
+        return None
+
+    def load_instance(self, image_id, instance_index, full=False):
+
+        """
+        Decodes one mask. Returns (box, mask), box being [y1, x1, y2, x2]
+        and mask the [y2 - y1, x2 - x1] bool crop, or the full [H, W] mask
+        if full is True.
+        """
+
+        entry = self.index[image_id]
+        instance = entry["instances"][instance_index]
+        y1, x1, y2, x2 = instance["box"]
+
+        if instance["length"] > 0:
+            start = instance["offset"]
+            end = start + 2 * instance["length"]
+            local_mask = utils.rle_decode(self.get_runs(end)[start:end], (y2 - y1, x2 - x1))
+        else:
+            local_mask = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+
+        if full is False:
+            return instance["box"], local_mask
+
+        mask = np.zeros(entry["shape"], dtype=bool)
+        mask[y1:y2, x1:x2] = local_mask
+
+        return instance["box"], mask
+
+    def load_masks(self, image_id, packed=False):
+
+        # Full [H, W, N] masks, as returned by detect, or utils.PackedMasks
+        # (without any dense [H, W] mask) if packed is True
+        entry = self.index[image_id]
+
+        if packed is True:
+            instances = [self.load_instance(image_id, i) for i in range(len(entry["instances"]))]
+            return utils.PackedMasks.from_local(entry["shape"], [box for box, local_mask in instances],
+                                                [local_mask for box, local_mask in instances])
+
+        masks = np.zeros(entry["shape"] + [len(entry["instances"])], dtype=bool)
+
+        for i in range(len(entry["instances"])):
+            (y1, x1, y2, x2), local_mask = self.load_instance(image_id, i)
+            masks[y1:y2, x1:x2, i] = local_mask
+
+        return masks
+
+    def load_results(self, image_id, packed=False):
+
+        entry = self.index[image_id]
+
+        return {"rois": np.array(entry["rois"], dtype=np.int32).reshape(-1, 4),
+                "class_ids": np.array(entry["class_ids"], dtype=np.int32),
+                "scores": np.array(entry["scores"], dtype=np.float32),
+                "masks": self.load_masks(image_id, packed=packed)}
+
+    def get_runs(self, end):
+
+        # Memory map of the data file, reopened if it grew since it was mapped
+        if self.runs is None or self.runs.shape[0] < end:
+            if self.data_file is not None:
+                self.data_file.flush()
+            self.runs = np.memmap(self.path, dtype=RUN_DTYPE, mode="r")
+
+        return self.runs
+
+    def close(self):
+
+        self.runs = None
+
+        if self.data_file is not None:
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = None
+            self.index_file = None
+
+        return None
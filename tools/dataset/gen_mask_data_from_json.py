@@ -11,11 +11,17 @@ high-quality mask dataset.
 
 import json
 import os
+import sys
 import cv2
 import numpy as np
-import imutils
 import tqdm
 
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(ROOT_DIR)
+
+# Same crops as ResultManager makes at inference time
+from tools.classes import instance_data
+
 #-------------------------------------------------------------------------------
 # Constants
 
@@ -51,23 +57,6 @@ def crop_min_area_rect(img, rect):
 
     return img_crop
 
-def crop_min_area_rect2(img, rect):
-
-    w,h = rect[1]
-    w = int(w)
-    h = int(h)
-
-    box = cv2.boxPoints(rect)
-    box = np.int0(box)
-
-    new_pts = np.float32([[0,0],[w,0],[0,h],[w,h]])
-    old_pts = np.float32([box[1],box[2],box[0],box[3]])
-
-    M = cv2.getPerspectiveTransform(old_pts, new_pts)
-    dst = cv2.warpPerspective(img, M, (w,h))
-
-    return dst
-
 #-------------------------------------------------------------------------------
 
 with open(json_file) as json_file:
@@ -97,26 +86,17 @@ with open(json_file) as json_file:
             rect = cv2.minAreaRect(pts)
             #print(rect)
 
-            w,h = rect[1]
-            w = int(w)
-            h = int(h)
-
-            #img_crop = crop_min_area_rect(img, rect)
-            img_crop = crop_min_area_rect2(img, rect)
-
-            if h > w:
-                img_crop = imutils.resize(img_crop, height = int(h * 0.6))
-                img_crop = imutils.rotate_bound(img_crop, angle=-90)
-            else:
-                img_crop = imutils.resize(img_crop, width = int(w * 0.6))
-            
-            h,w,d = img_crop.shape
+            # Size of the final crop, known before warping
+            transform, (w, h) = instance_data.compute_crop_transform(rect)
             size = h*w
             #print("size: {}".format(size))
 
             if size < 10000:
                 continue
 
+            #img_crop = crop_min_area_rect(img, rect)
+            img_crop = instance_data.crop_min_area_rect(img, rect)
+
             #cv2.imshow("output", img_crop)
             #cv2.waitKey(0)
             #cv2.destroyAllWindows()
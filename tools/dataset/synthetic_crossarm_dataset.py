@@ -0,0 +1,156 @@
+"""
+Generates a synthetic crossarm dataset for load and performance testing:
+utility-pole scenes with elongated, rotated crossarm polygons, written in
+the layout CrossarmDataset.load_crossarm expects:
+
+    <output_dir>/train/*.jpg + via_region_data.json
+    <output_dir>/val/*.jpg + via_region_data.json
+
+The annotations use the VIA 1.x format (regions as a dict of polygons).
+Each image is rendered from its own seed (seed + index), so the output
+does not depend on --workers.
+
+Usage (from the root of the repository):
+
+    python tools/dataset/synthetic_crossarm_dataset.py --output_dir=synthetic_crossarm --images=1000 --height=3000 --width=4000
+"""
+
+# Common Core Library Imports
+import os
+import json
+import argparse
+import concurrent.futures
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+#------------------------------------------------------------------
+# Constants
+
+ANNOTATION_FILENAME = "via_region_data.json"
+
+#------------------------------------------------------------------
+# Functions
+
+def render_scene(random_state, height, width, instances=(1, 4), aspect_ratios=(8, 20), max_angle=10):
+    """
+    Renders one pole scene. Returns (image, polygons), image being a
+    [height, width, 3] uint8 BGR array and polygons one (all_points_x,
+    all_points_y) pair of lists per crossarm.
+
+    instances: (min, max) number of crossarms.
+    aspect_ratios: (min, max) length / thickness of a crossarm.
+    max_angle: largest rotation of a crossarm from horizontal, in degrees.
+    """
+
+    # Sky gradient with some noise
+    sky = np.linspace(random_state.randint(150, 220), random_state.randint(200, 255), height, dtype=np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:] = sky[:, None, None]
+    image += random_state.normal(0, 8, (height, width, 3)).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    # Ground band
+    ground_y = random_state.randint(4 * height // 5, height)
+    cv2.rectangle(image, (0, ground_y), (width, height), [int(c) for c in random_state.randint(40, 110, 3)], -1)
+
+    # Pole
+    pole_x = random_state.randint(width // 4, 3 * width // 4)
+    pole_width = max(4, width // 60)
+    pole_top = random_state.randint(height // 10, height // 4)
+    cv2.rectangle(image, (pole_x - pole_width // 2, pole_top), (pole_x + pole_width // 2, height),
+                  (60, 50, 45), -1)
+
+    # Wires, as distractors
+    for _ in range(random_state.randint(1, 4)):
+        y1, y2 = random_state.randint(0, height // 2, 2)
+        cv2.line(image, (0, int(y1)), (width, int(y2)), (40, 40, 40), max(1, height // 500))
+
+    polygons = []
+    number_of_instances = random_state.randint(instances[0], instances[1] + 1)
+    spacing = max(1, (ground_y - pole_top) // (2 * number_of_instances + 1))
+
+    for i in range(number_of_instances):
+
+        # Crossarms stacked down the pole, centered on it give or take
+        center = (pole_x + random_state.randint(-pole_width, pole_width + 1),
+                  pole_top + (2 * i + 1) * spacing + random_state.randint(0, spacing // 2 + 1))
+        length = random_state.randint(width // 8, width // 3)
+        thickness = max(3, int(length / random_state.uniform(*aspect_ratios)))
+        angle = random_state.uniform(-max_angle, max_angle)
+
+        corners = cv2.boxPoints((center, (length, thickness), angle))
+        corners[:, 0] = np.clip(corners[:, 0], 0, width - 1)
+        corners[:, 1] = np.clip(corners[:, 1], 0, height - 1)
+        corners = np.round(corners).astype(np.int32)
+
+        cv2.fillPoly(image, [corners], [int(c) for c in random_state.randint(30, 100, 3)])
+
+        # Insulators on top of the crossarm
+        for t in random_state.uniform(0.1, 0.9, random_state.randint(0, 4)):
+            x = int(corners[0, 0] + t * (corners[2, 0] - corners[0, 0]))
+            y = int(min(corners[:, 1])) - thickness // 2
+            cv2.circle(image, (x, max(0, y)), max(2, thickness // 2), (200, 200, 190), -1)
+
+        polygons.append((corners[:, 0].tolist(), corners[:, 1].tolist()))
+
+    return image, polygons
+
+def generate_image(index, args):
+
+    random_state = np.random.RandomState(args.seed + index)
+    image, polygons = render_scene(random_state, args.height, args.width,
+                                   instances=(args.min_instances, args.max_instances),
+                                   aspect_ratios=(args.min_aspect_ratio, args.max_aspect_ratio),
+                                   max_angle=args.max_angle)
+
+    subset = "val" if random_state.uniform() < args.val_fraction else "train"
+    filename = "synthetic_{:06d}.jpg".format(index)
+    image_path = os.path.join(args.output_dir, subset, filename)
+    cv2.imwrite(image_path, image)
+
+    # VIA 1.x annotation, keyed by filename + file size
+    size = os.path.getsize(image_path)
+    regions = {str(i): {"region_attributes": {},
+                        "shape_attributes": {"name": "polygon", "all_points_x": xs, "all_points_y": ys}}
+               for i, (xs, ys) in enumerate(polygons)}
+
+    return subset, filename + str(size), {"filename": filename, "size": size, "regions": regions,
+                                          "file_attributes": {}}
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--images", required=False, default=100, type=int)
+    parser.add_argument("--val_fraction", required=False, default=0.2, type=float)
+    parser.add_argument("--height", required=False, default=3000, type=int)
+    parser.add_argument("--width", required=False, default=4000, type=int)
+    parser.add_argument("--min_instances", required=False, default=1, type=int)
+    parser.add_argument("--max_instances", required=False, default=4, type=int)
+    parser.add_argument("--min_aspect_ratio", required=False, default=8, type=float)
+    parser.add_argument("--max_aspect_ratio", required=False, default=20, type=float)
+    parser.add_argument("--max_angle", required=False, default=10, type=float)
+    parser.add_argument("--seed", required=False, default=0, type=int)
+    parser.add_argument("--workers", required=False, default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+
+    assert 1 <= args.min_instances <= args.max_instances, "Invalid instance counts"
+
+    annotations = {"train": {}, "val": {}}
+    for subset in annotations:
+        os.makedirs(os.path.join(args.output_dir, subset), exist_ok=True)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for subset, key, annotation in executor.map(generate_image, range(args.images),
+                                                    [args] * args.images, chunksize=8):
+            annotations[subset][key] = annotation
+
+    for subset, subset_annotations in annotations.items():
+        with open(os.path.join(args.output_dir, subset, ANNOTATION_FILENAME), "w") as f:
+            json.dump(subset_annotations, f)
+        print("{}: {} images".format(subset, len(subset_annotations)))
@@ -0,0 +1,304 @@
+"""
+Long-lived HTTP inference service for the crossarm pipeline.
+
+Concurrent requests are collected into micro-batches (bounded by
+--max_batch_size and --max_wait) and run through Mask-RCNN and the
+CrackClassifier on a single dedicated executor thread, so the asyncio
+event loop never blocks on TensorFlow.
+
+Usage (from the root of the repository):
+
+    python tools/service/inference_server.py --weights=path/to/maskrcnn.h5 --classifier=path/to/classifier.h5 --port=8080
+
+    curl --data-binary @DJI_0027.JPG http://127.0.0.1:8080/predict
+    curl -o crop.png http://127.0.0.1:8080/crops/<crop reference>
+    curl http://127.0.0.1:8080/health
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+
+# Third-Parthy Library Imports
+import cv2
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+
+import tools.classes as clss
+
+#------------------------------------------------------------------
+# Constants
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 500: "Internal Server Error"}
+
+#------------------------------------------------------------------
+# Class
+
+class InferenceService():
+
+    def __init__(self, maskrcnn_parameters, crack_classifier_parameters,
+                 max_batch_size=None, max_wait=0.05, max_stored_crops=1000, prepare_workers=None):
+
+        self.maskrcnn_parameters = maskrcnn_parameters
+        self.crack_classifier_parameters = crack_classifier_parameters
+        self.max_batch_size = max_batch_size or maskrcnn_parameters.get("batch_size", 1)
+        self.max_wait = max_wait
+        self.max_stored_crops = max_stored_crops
+
+        # All TensorFlow work happens on this single thread
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        # Reading and molding of the micro-batches (MaskRCNN.predict_stream),
+        # one pool for the lifetime of the service
+        self.prepare_executor = concurrent.futures.ThreadPoolExecutor(max_workers=prepare_workers)
+
+        # Crops served by GET /crops/<reference>, oldest dropped first
+        self.crops = collections.OrderedDict()
+
+        self.queue = None
+        self.batch_task = None
+
+        return None
+
+    async def start(self):
+
+        loop = asyncio.get_event_loop()
+
+        # Loading the models on the executor thread that will use them
+        await loop.run_in_executor(self.executor, self.load_models)
+
+        self.queue = asyncio.Queue()
+        self.batch_task = loop.create_task(self.batch_worker())
+
+        return None
+
+    def load_models(self):
+
+        self.maskrcnn_model = clss.MaskRCNN(self.maskrcnn_parameters)
+        self.crack_classifier_model = clss.CrackClassifier(self.crack_classifier_parameters)
+
+        # The model cannot run batches larger than it was built for
+        self.max_batch_size = min(self.max_batch_size,
+                                  self.maskrcnn_model.model.config.BATCH_SIZE)
+
+        return None
+
+    async def predict(self, image):
+
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((image, future))
+
+        return await future
+
+    async def batch_worker(self):
+
+        loop = asyncio.get_event_loop()
+
+        while True:
+
+            # Waiting for the first request, then gathering more until the
+            # batch is full or max_wait has passed
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            images = [image for image, future in batch]
+
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.run_batch, images)
+            except Exception as error:
+                for image, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            for (image, future), output in zip(batch, outputs):
+
+                # Crops are stored from the event loop thread only
+                for instance in output["instances"]:
+                    instance["crop"] = self.store_crop(instance["crop"])
+
+                if not future.done():
+                    future.set_result(output)
+
+    def run_batch(self, images):
+
+        result_managers = list(self.maskrcnn_model.predict_stream(images, batch_size=len(images),
+                                                                  executor=self.prepare_executor))
+
+        # The crops of every image of the micro-batch in one classifier call
+        crops = [result_manager.get_crossarm_images() for result_manager in result_managers]
+        probabilities, tags = self.crack_classifier_model.predict_batch([crop for image_crops in crops for crop in image_crops])
+
+        outputs = []
+        start = 0
+
+        for result_manager, image_crops in zip(result_managers, crops):
+
+            instances = []
+
+            for offset, instance in enumerate(result_manager.instance_list):
+                instances.append({"label": instance.label,
+                                  "box": [int(v) for v in instance.box],
+                                  "score": float(instance.score),
+                                  "unique": bool(instance.unique),
+                                  "crop": instance.cropped_image,
+                                  "tag": tags[start + offset],
+                                  "probability": float(probabilities[start + offset])})
+
+            start += len(image_crops)
+            outputs.append({"instances": instances})
+
+        return outputs
+
+    def store_crop(self, crop):
+
+        reference = uuid.uuid4().hex
+        self.crops[reference] = crop
+
+        while len(self.crops) > self.max_stored_crops:
+            self.crops.popitem(last=False)
+
+        return "/crops/{}".format(reference)
+
+    #--------------------------------------------------------------
+    # HTTP handling
+
+    async def handle_connection(self, reader, writer):
+
+        try:
+            status, content_type, body = await self.handle_request(reader)
+        except Exception as error:
+            status, content_type, body = self.json_response(500, {"error": str(error)})
+
+        header = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+            status, HTTP_REASONS[status], content_type, len(body))
+
+        writer.write(header.encode("latin-1") + body)
+
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader):
+
+        request_line = await reader.readline()
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            return self.json_response(400, {"error": "Malformed request line"})
+
+        # Reading headers
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        content_length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(content_length) if content_length else b""
+
+        if path == "/health":
+            return self.json_response(200, {"status": "ok"})
+
+        if path == "/predict":
+            if method != "POST":
+                return self.json_response(405, {"error": "Use POST with the encoded image as body"})
+
+            # Decoding in memory, off the event loop
+            try:
+                image_path, image = await asyncio.get_event_loop().run_in_executor(
+                    None, clss.load_image, body)
+            except ValueError:
+                return self.json_response(400, {"error": "Body is not a decodable image"})
+
+            return self.json_response(200, await self.predict(image))
+
+        if path.startswith("/crops/"):
+            crop = self.crops.get(path[len("/crops/"):])
+            if crop is None:
+                return self.json_response(404, {"error": "Unknown crop reference"})
+            # Encoding off the event loop, large crops take a while
+            encoded = await asyncio.get_event_loop().run_in_executor(None, encode_png, crop)
+            return 200, "image/png", encoded
+
+        return self.json_response(404, {"error": "Unknown path {}".format(path)})
+
+    def json_response(self, status, data):
+
+        return status, "application/json", json.dumps(data).encode("utf-8")
+
+#------------------------------------------------------------------
+# Functions
+
+def encode_png(image):
+
+    return cv2.imencode(".png", image)[1].tobytes()
+
+def serve(service, host, port):
+
+    # Event loop API of Python 3.6 (no asyncio.run or Server.serve_forever)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(service.start())
+    server = loop.run_until_complete(asyncio.start_server(service.handle_connection, host, port))
+
+    print("Serving crossarm inference on http://{}:{}".format(host, port))
+
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", required=True)
+    parser.add_argument("--classifier", required=True)
+    parser.add_argument("--host", required=False, default="127.0.0.1")
+    parser.add_argument("--port", required=False, default=8080, type=int)
+    parser.add_argument("--max_batch_size", required=False, default=4, type=int)
+    parser.add_argument("--max_wait", required=False, default=0.05, type=float)
+    args = parser.parse_args()
+
+    # MaskRCNN Parameters
+    maskrcnn_parameters = {"weights_path": args.weights,
+                           "batch_size": args.max_batch_size,
+                           "cropping_ratio": 0.5,
+                           "shared_mask_ratio_threshold": 30,
+                           "only_long_crossarms": True,
+                           "long_crossarm_w_h_ratio_threshold": 0.10}
+
+    # crack_classifier Parameters
+    crack_classifier_parameters = {"model_path": args.classifier}
+
+    service = InferenceService(maskrcnn_parameters, crack_classifier_parameters,
+                               max_batch_size=args.max_batch_size,
+                               max_wait=args.max_wait)
+
+    serve(service, args.host, args.port)
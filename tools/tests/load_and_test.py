@@ -8,7 +8,6 @@ import os
 import sys
 import imutils
 import time
-import pickle
 from pathlib import Path
 import tqdm
 
@@ -51,13 +50,14 @@ if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
 	parser.add_argument("--image", required=True)
 	parser.add_argument("--weights", required=True)
-	parser.add_argument("--save_pickle", required=False, default=False)
+	parser.add_argument("--save_results", required=False, default=False) # Saved to saved_results/results.rle (see classes.ResultStore)
 	parser.add_argument("--save_output_image", required=False, default=False)
 	parser.add_argument("--display", required=False, default=False)
+	parser.add_argument("--timing_output", required=False, default=None) # Per-stage durations, .json or .csv
 	args = parser.parse_args()
 
 	path_object = Path(args.image)
-	args.save_pickle = (args.save_pickle == "True" or args.save_pickle == True)
+	args.save_results = (args.save_results == "True" or args.save_results == True)
 	args.save_output_image = (args.save_output_image == "True" or args.save_output_image == True)
 	args.display = (args.display == "True" or args.display == True)
 
@@ -75,6 +75,7 @@ if __name__ == '__main__':
 	model = modellib.MaskRCNN(mode="inference", config=config,
 							  model_dir=glo_var.DEFAULT_LOGS_DIR)				  
 	model.load_weights(weights_path, by_name=True)
+	model.timer = utils.StageTimer(enabled=args.timing_output is not None)
 
 	# Handling path_object
 	if path_object.is_file(): # Single image
@@ -84,6 +85,11 @@ if __name__ == '__main__':
 		#print(directory_list)
 		image_path_list = [str(path) for path in directory_list if str(path).endswith(".JPG")]
 
+	# Compact result store (bbox-cropped RLE masks) instead of pickles
+	if args.save_results is True:
+		os.makedirs("saved_results", exist_ok=True)
+		result_store = classes.ResultStore(os.path.join("saved_results", "results.rle"), mode="a")
+
 	for image_path in tqdm.tqdm(image_path_list):
 		
 		# Loading image
@@ -101,11 +107,8 @@ if __name__ == '__main__':
 		# Visualizing predictions
 		r = results[0]
 		
-		if args.save_pickle is True:
-			if sys.platform.startswith("win32"):
-				pickle.dump(r, open("saved_pickles\{}.pickle".format(Path(image_path).stem), "ab"))
-			elif sys.platform.startswith("linux"):
-				pickle.dump(r, open("saved_pickles/{}.pickle".format(Path(image_path).stem), "ab"))
+		if args.save_results is True:
+			result_store.write(Path(image_path).stem, r)
 		
 		result_manager = classes.ResultManager(image, r, image_path)
 		
@@ -117,5 +120,9 @@ if __name__ == '__main__':
 		if args.save_output_image is True:
 			result_manager.save_output_image()
 
-						  
-						  
\ No newline at end of file
+	if args.timing_output is not None:
+		print(model.timer.format_summary())
+		if args.timing_output.endswith(".csv"):
+			model.timer.to_csv(args.timing_output)
+		else:
+			model.timer.to_json(args.timing_output)
@@ -0,0 +1,99 @@
+"""
+Crops of instance_data.crop_min_area_rect against the three steps the
+crack classifier's training crops were made with
+(gen_mask_data_from_json.py): warpPerspective, imutils.resize and
+imutils.rotate_bound.
+
+    python -m pytest tools/tests
+"""
+
+# Common Core Library Imports
+import os
+import sys
+
+# Third-Party Imports
+import cv2
+import imutils
+import numpy as np
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "tools", "classes"))
+
+import instance_data
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Constants
+
+# Largest difference allowed with the training crops, in gray levels
+CROP_TOLERANCE = 0
+
+#------------------------------------------------------------------
+# Functions
+
+def three_step_crop(image, rect, scale=instance_data.CROP_SCALE):
+
+    # As in gen_mask_data_from_json.py before the crops were reworked
+    w, h = rect[1]
+    w, h = int(w), int(h)
+
+    box = cv2.boxPoints(rect).astype(np.intp)
+    new_pts = np.float32([[0, 0], [w, 0], [0, h], [w, h]])
+    old_pts = np.float32([box[1], box[2], box[0], box[3]])
+    crop = cv2.warpPerspective(image, cv2.getPerspectiveTransform(old_pts, new_pts), (w, h))
+
+    if h > w:
+        crop = imutils.resize(crop, height=int(h * scale))
+        crop = imutils.rotate_bound(crop, angle=-90)
+    else:
+        crop = imutils.resize(crop, width=int(w * scale))
+
+    return crop
+
+def random_rects(random_state, count, height, width):
+
+    for _ in range(count):
+        center = (random_state.uniform(100, width - 100), random_state.uniform(100, height - 100))
+        size = (random_state.uniform(20, 400), random_state.uniform(5, 60))
+        if random_state.uniform() < 0.5:
+            size = size[::-1]
+        yield (center, size, random_state.uniform(-90, 0))
+
+#------------------------------------------------------------------
+# Tests
+
+def test_crop_matches_training_crops():
+
+    random_state = np.random.RandomState(0)
+    image = cv2.GaussianBlur(random_state.randint(0, 256, (600, 800, 3), dtype=np.uint8), (5, 5), 0)
+
+    for rect in random_rects(random_state, 200, *image.shape[:2]):
+        expected = three_step_crop(image, rect)
+        crop = instance_data.crop_min_area_rect(image, rect)
+
+        assert crop.shape == expected.shape
+        assert np.abs(crop.astype(np.int16) - expected).max() <= CROP_TOLERANCE
+
+def test_crop_transform_size_matches_crop():
+
+    random_state = np.random.RandomState(1)
+    image = np.zeros((600, 800, 3), dtype=np.uint8)
+
+    for rect in random_rects(random_state, 50, *image.shape[:2]):
+        transform, (w, h) = instance_data.compute_crop_transform(rect)
+        assert instance_data.crop_min_area_rect(image, rect).shape[:2] == (h, w)
+
+def test_lazy_crop_is_timed():
+
+    mask = np.zeros((200, 300), dtype=bool)
+    mask[90:100, 50:250] = True
+    instance = instance_data.InstanceData((np.array([90, 50, 100, 250]), mask, 1, 0.99))
+
+    instance.image = np.zeros((200, 300, 3), dtype=np.uint8)
+    instance.crop_rect = ((150, 95), (200, 10), 0)
+    instance.timer = utils.StageTimer()
+
+    assert instance.cropped_image is not None
+    assert len(instance.timer.durations["warp"]) == 1
@@ -0,0 +1,130 @@
+"""
+Packed masks (utils.PackedMasks) through the post-processing: ResultManager
+must give the same instances as with dense [H, W, N] masks, whichever path
+the mrcnn package was imported from.
+
+    python -m pytest tools/tests
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import importlib
+
+# Third-Party Imports
+import cv2
+import numpy as np
+import pytest
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "Mask_RCNN"))
+sys.path.append(os.path.join(ROOT_DIR, "tools", "classes"))
+
+import result_manager
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Constants
+
+HEIGHT, WIDTH = 600, 800
+
+DICT_PARA = {"cropping_ratio": 0.5,
+             "shared_mask_ratio_threshold": 30,
+             "only_long_crossarms": True,
+             "long_crossarm_w_h_ratio_threshold": 0.10}
+
+#------------------------------------------------------------------
+# Functions
+
+def make_detections(random_state, count=4):
+
+    rois, masks = [], np.zeros((HEIGHT, WIDTH, count), dtype=bool)
+
+    for i in range(count):
+        y1, x1 = random_state.randint(0, HEIGHT - 40), random_state.randint(0, WIDTH - 200)
+        y2, x2 = y1 + random_state.randint(10, 40), x1 + random_state.randint(100, 200)
+        mask = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        cv2.ellipse(mask, ((x1 + x2) // 2, (y1 + y2) // 2), ((x2 - x1) // 2, (y2 - y1) // 2), 0, 0, 360, 1, -1)
+        masks[y1:y2, x1:x2, i] = mask[y1:y2, x1:x2] > 0
+        rois.append((y1, x1, y2, x2))
+
+    return {"rois": np.array(rois, dtype=np.int32),
+            "class_ids": np.ones(count, dtype=np.int32),
+            "scores": np.linspace(0.99, 0.9, count).astype(np.float32),
+            "masks": masks}
+
+def run_result_manager(image, results):
+
+    result_manager_object = result_manager.ResultManager(DICT_PARA)
+    result_manager_object.input(image, results, None)
+
+    return result_manager_object, result_manager_object.get_crossarm_images()
+
+def assert_same_results(dense, packed):
+
+    (dense_manager, dense_crops), (packed_manager, packed_crops) = dense, packed
+
+    assert len(dense_manager.instance_list) == len(packed_manager.instance_list)
+    for dense_instance, packed_instance in zip(dense_manager.instance_list, packed_manager.instance_list):
+        assert dense_instance.score == packed_instance.score
+        assert dense_instance.unique == packed_instance.unique
+        assert dense_instance.mask_pixel_count == packed_instance.mask_pixel_count
+        assert np.array_equal(dense_instance.mask, packed_instance.mask)
+
+    assert len(dense_crops) == len(packed_crops)
+    for dense_crop, packed_crop in zip(dense_crops, packed_crops):
+        assert np.array_equal(dense_crop, packed_crop)
+
+#------------------------------------------------------------------
+# Tests
+
+@pytest.mark.parametrize("module_name", ["Mask_RCNN.mrcnn.utils", "mrcnn.utils"])
+def test_result_manager_packed_matches_dense(module_name):
+
+    # PackedMasks made by either copy of utils (the model imports it as
+    # "mrcnn.utils" when Mask_RCNN is on the path)
+    packed_masks_class = importlib.import_module(module_name).PackedMasks
+
+    random_state = np.random.RandomState(0)
+    image = random_state.randint(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    results = make_detections(random_state)
+
+    dense = run_result_manager(image, results)
+    packed = run_result_manager(image, dict(results, masks=packed_masks_class.from_dense(results["masks"])))
+
+    assert_same_results(dense, packed)
+
+def test_unmold_detections_packed_into_result_manager():
+
+    pytest.importorskip("tensorflow")
+    pytest.importorskip("keras")
+    from Mask_RCNN.mrcnn import model as modellib
+
+    # unmold_detections does not use the network, nor the model's state
+    model = modellib.MaskRCNN.__new__(modellib.MaskRCNN)
+
+    random_state = np.random.RandomState(1)
+    image = random_state.randint(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    # Network outputs for a [1024, 1024] molded image holding the whole
+    # image in its window
+    count, mask_shape = 3, (28, 28)
+    window = np.array([0, 0, 768, 1024])
+    detections = np.zeros((10, 6), dtype=np.float32)
+    for i in range(count):
+        y1, x1 = random_state.uniform(0.05, 0.6), random_state.uniform(0.05, 0.6)
+        detections[i] = [y1 * 0.75, x1, (y1 + 0.03) * 0.75, x1 + 0.2, 1, 0.99 - i / 100]
+    mrcnn_mask = random_state.uniform(0.3, 1, (10,) + mask_shape + (2,)).astype(np.float32)
+
+    results = {}
+    for packed_masks in [False, True]:
+        rois, class_ids, scores, masks = model.unmold_detections(detections, mrcnn_mask, image.shape,
+                                                                 (1024, 1024, 3), window, packed_masks=packed_masks)
+        results[packed_masks] = {"rois": rois, "class_ids": class_ids, "scores": scores, "masks": masks}
+
+    assert utils.is_packed_masks(results[True]["masks"])
+    assert np.array_equal(results[True]["masks"].unpack(), results[False]["masks"])
+
+    assert_same_results(run_result_manager(image, results[False]), run_result_manager(image, results[True]))
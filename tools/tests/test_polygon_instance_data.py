@@ -0,0 +1,85 @@
+"""
+ResultManager with the polygon engine (PolygonInstanceData): a raw mask
+with no probability above the threshold gives an empty polygon, which must
+be dropped rather than cropped.
+
+    python -m pytest tools/tests
+"""
+
+# Common Core Library Imports
+import os
+import sys
+
+# Third-Party Imports
+import numpy as np
+import pytest
+
+pytest.importorskip("shapely")
+pytest.importorskip("skimage")
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "tools", "classes"))
+
+import polygon_instance_data
+import result_manager
+
+#------------------------------------------------------------------
+# Constants
+
+HEIGHT, WIDTH = 600, 800
+
+DICT_PARA = {"postprocess_engine": "polygon",
+             "cropping_ratio": 0.5,
+             "shared_mask_ratio_threshold": 30,
+             "only_long_crossarms": True,
+             "long_crossarm_w_h_ratio_threshold": 0.10}
+
+#------------------------------------------------------------------
+# Functions
+
+def make_results(raw_masks):
+
+    count = len(raw_masks)
+    rois = [(100 + 100 * i, 100, 130 + 100 * i, 500) for i in range(count)]
+
+    return {"rois": np.array(rois, dtype=np.int32),
+            "class_ids": np.ones(count, dtype=np.int32),
+            "scores": np.linspace(0.99, 0.9, count).astype(np.float32),
+            "raw_masks": np.array(raw_masks, dtype=np.float32)}
+
+#------------------------------------------------------------------
+# Tests
+
+def test_raw_mask_below_threshold_is_empty():
+
+    raw_mask = np.full((28, 28), polygon_instance_data.MASK_THRESHOLD / 2, dtype=np.float32)
+    instance = polygon_instance_data.PolygonInstanceData((np.array([100, 100, 130, 500]), raw_mask, 1, 0.99),
+                                                         (HEIGHT, WIDTH))
+
+    assert instance.polygon.is_empty
+    assert instance.mask_pixel_count == 0
+
+def test_empty_instances_are_dropped():
+
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    below = np.full((28, 28), 0.2, dtype=np.float32)
+    above = np.full((28, 28), 0.9, dtype=np.float32)
+
+    result_manager_object = result_manager.ResultManager(DICT_PARA)
+    result_manager_object.input(image, make_results([below, above, below]), None)
+
+    assert len(result_manager_object.instance_list) == 1
+    assert result_manager_object.instance_list[0].mask_pixel_count > 0
+    assert len(result_manager_object.get_crossarm_images()) == 1
+
+def test_only_empty_instances():
+
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    result_manager_object = result_manager.ResultManager(DICT_PARA)
+    result_manager_object.input(image, make_results([np.zeros((28, 28), dtype=np.float32)]), None)
+
+    assert result_manager_object.no_instance_flag
+    assert result_manager_object.get_crossarm_images() == []
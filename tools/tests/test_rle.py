@@ -0,0 +1,63 @@
+"""
+utils.rle_encode / utils.rle_decode, including runs that touch and
+zero-length runs, which other encoders than rle_encode can produce.
+
+    python -m pytest tools/tests
+"""
+
+# Common Core Library Imports
+import os
+import sys
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Functions
+
+def decode_by_loop(rle, shape):
+
+    # Reference: one run at a time, column-major, 1-based starts
+    mask = np.zeros(shape[0] * shape[1], dtype=bool)
+    for start, length in np.asarray(rle).reshape(-1, 2):
+        mask[start - 1:start - 1 + length] = True
+
+    return mask.reshape(shape[1], shape[0]).T
+
+#------------------------------------------------------------------
+# Tests
+
+def test_roundtrip():
+
+    random_state = np.random.RandomState(0)
+
+    for _ in range(20):
+        mask = random_state.uniform(size=(37, 23)) < 0.3
+        assert np.array_equal(utils.rle_decode(utils.rle_encode(mask), mask.shape), mask)
+
+def test_adjacent_runs():
+
+    # The second run starts where the first one ends
+    rle = [[1, 3], [4, 2], [10, 1], [11, 4]]
+    mask = utils.rle_decode(rle, (5, 4))
+
+    assert np.array_equal(mask, decode_by_loop(rle, (5, 4)))
+    assert np.count_nonzero(mask) == 10
+
+def test_zero_length_runs():
+
+    rle = [[2, 0], [2, 3], [5, 0], [9, 0], [12, 2], [14, 0]]
+    mask = utils.rle_decode(rle, (4, 4))
+
+    assert np.array_equal(mask, decode_by_loop(rle, (4, 4)))
+    assert np.count_nonzero(mask) == 5
+
+def test_string_rle():
+
+    assert np.array_equal(utils.rle_decode("1 3 4 2", (3, 2)), decode_by_loop([[1, 3], [4, 2]], (3, 2)))
@@ -0,0 +1,79 @@
+"""
+Exports the crossarm Mask-RCNN as a frozen inference graph, so that
+tools.classes.MaskRCNN can load it with {"frozen_graph_path": ...}
+instead of rebuilding the Keras model and reading the .h5 weights.
+
+Usage (from the root of the repository):
+
+    python tools/utilities/export_frozen_graph.py --weights=path/to/maskrcnn.h5 --output=path/to/maskrcnn.pb
+
+    # Also compare the startup time (until ready to predict) of both modes
+    python tools/utilities/export_frozen_graph.py --weights=path/to/maskrcnn.h5 --output=path/to/maskrcnn.pb --compare_startup=True
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+
+#------------------------------------------------------------------
+# Functions
+
+def export(weights_path, output_path, batch_size):
+
+    import tools.classes as clss
+
+    maskrcnn_model = clss.MaskRCNN({"weights_path": weights_path,
+                                    "batch_size": batch_size,
+                                    "warmup": False})
+    maskrcnn_model.model.export_frozen_graph(output_path)
+
+    print("Frozen graph written to {}".format(output_path))
+
+    return None
+
+def measure_startup(dict_para):
+
+    # Run in a fresh process so that nothing is already imported or built
+    code = ("import sys, json; sys.path.append({!r}); import tools.classes as clss; "
+            "m = clss.MaskRCNN(json.loads({!r})); print('STARTUP', m.startup_time)").format(
+                ROOT_DIR, json.dumps(dict_para))
+    output = subprocess.check_output([sys.executable, "-c", code], universal_newlines=True)
+
+    for line in output.splitlines():
+        if line.startswith("STARTUP"):
+            return float(line.split()[1])
+
+    return None
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--batch_size", required=False, default=1, type=int)
+    parser.add_argument("--compare_startup", required=False, default=False)
+    args = parser.parse_args()
+
+    args.compare_startup = (args.compare_startup == "True" or args.compare_startup == True)
+
+    export(args.weights, args.output, args.batch_size)
+
+    if args.compare_startup is True:
+
+        h5_time = measure_startup({"weights_path": args.weights,
+                                   "batch_size": args.batch_size})
+        frozen_time = measure_startup({"frozen_graph_path": args.output,
+                                       "batch_size": args.batch_size})
+
+        print("Startup (build + load_weights + warm-up): {:.2f} s".format(h5_time))
+        print("Startup (frozen graph + warm-up):         {:.2f} s".format(frozen_time))
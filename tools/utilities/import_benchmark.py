@@ -0,0 +1,95 @@
+"""
+Measures the import time and memory of tools.classes and mrcnn.utils.
+
+Each case runs in a fresh Python process. "lazy" is a plain import, as
+done by dataset scripts and post-processing workers. "eager" also touches
+the symbols that need the heavy frameworks, which is what every import
+paid before the lazy loading.
+
+Usage (from the root of the repository):
+
+    python tools/utilities/import_benchmark.py --repeat=5
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+#------------------------------------------------------------------
+# Constants
+
+HEAVY_MODULES = ["tensorflow", "keras", "scipy", "skimage"]
+
+CASES = [("tools.classes", "lazy", "import tools.classes"),
+         ("tools.classes", "eager", "import tools.classes; tools.classes.MaskRCNN; tools.classes.CrackClassifier"),
+         ("mrcnn.utils", "lazy", "import mrcnn.utils"),
+         ("mrcnn.utils", "eager", "import mrcnn.utils as u; u.tf.Tensor; u.scipy.ndimage; u.skimage.transform")]
+
+# Runs inside the child process
+CHILD_CODE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {mrcnn_root!r})
+try:
+    import resource
+except ImportError:
+    resource = None
+
+start = time.perf_counter()
+{statement}
+duration = time.perf_counter() - start
+
+# ru_maxrss is in KB on Linux and in bytes on macOS
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+if rss is not None and sys.platform == "darwin":
+    rss = rss // 1024
+
+print(json.dumps({{"seconds": duration, "max_rss_kb": rss,
+                   "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+#------------------------------------------------------------------
+# Functions
+
+def run_case(statement):
+
+    code = CHILD_CODE.format(root=ROOT_DIR,
+                             mrcnn_root=os.path.join(ROOT_DIR, "Mask_RCNN"),
+                             statement=statement,
+                             heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", code], universal_newlines=True)
+
+    return json.loads(output.strip().splitlines()[-1])
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", required=False, default=3, type=int)
+    parser.add_argument("--json", required=False, default=None)
+    args = parser.parse_args()
+
+    results = []
+
+    for module, mode, statement in CASES:
+
+        runs = [run_case(statement) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["seconds"])
+
+        results.append({"module": module, "mode": mode, "seconds": best["seconds"],
+                        "max_rss_kb": best["max_rss_kb"], "loaded": best["loaded"]})
+
+        print("{:15} {:6} {:8.3f} s {:>10} KB   heavy modules: {}".format(
+            module, mode, best["seconds"], best["max_rss_kb"], ", ".join(best["loaded"]) or "none"))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
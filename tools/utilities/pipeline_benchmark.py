@@ -0,0 +1,235 @@
+"""
+End-to-end CPU throughput of the crossarm pipeline:
+MaskRCNN.predict_stream -> ResultManager -> CrackClassifier.predict_batch.
+
+Mask-RCNN is built from CrossarmConfig (the InferenceConfig of
+tools/classes/maskrcnn.py) with random weights, and the crack classifier
+is a small random CNN with the classifier's input size, so no checkpoint
+is needed. The images are synthetic pole scenes from
+tools/dataset/synthetic_crossarm_dataset.py, generated from a fixed seed.
+
+Every combination of --batch_sizes, --max_dims and --threads runs in a
+fresh Python process, so the peak RSS of each case is its own. Reported
+per case: images/s, p50/p95/p99 batch latency and peak RSS.
+
+With random weights the detections are meaningless, but their number
+(DETECTION_MIN_CONFIDENCE is set by --min_confidence) is what drives the
+post-processing cost. The mean number of instances per image is reported
+so runs can be compared.
+
+Usage (from the root of the repository):
+
+    python tools/utilities/pipeline_benchmark.py --batch_sizes=1,2 --max_dims=512,1024 --threads=1,4
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import subprocess
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+#------------------------------------------------------------------
+# Constants
+
+PERCENTILES = (50, 95, 99)
+
+#------------------------------------------------------------------
+# Functions
+
+def generate_images(number_of_images, height, width, seed=0):
+
+    sys.path.insert(0, os.path.join(ROOT_DIR, "tools", "dataset"))
+    import synthetic_crossarm_dataset
+
+    random_state = np.random.RandomState(seed)
+
+    return [synthetic_crossarm_dataset.render_scene(random_state, height, width)[0]
+            for _ in range(number_of_images)]
+
+def save_random_classifier(path, input_size):
+
+    import keras
+
+    # Stand-in for the crack classifier: same input and output format
+    model = keras.models.Sequential([
+        keras.layers.Conv2D(16, 3, activation="relu", input_shape=(input_size[1], input_size[0], 3)),
+        keras.layers.MaxPooling2D(),
+        keras.layers.Conv2D(32, 3, activation="relu"),
+        keras.layers.MaxPooling2D(),
+        keras.layers.Flatten(),
+        keras.layers.Dense(64, activation="relu"),
+        keras.layers.Dense(1, activation="sigmoid")])
+    model.save(path)
+
+    return path
+
+def peak_rss_kb():
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss = rss // 1024
+
+    return rss
+
+def run_case(case):
+
+    """
+    Runs one case in this process and returns its measurements. Called in
+    the child process (--case).
+    """
+
+    # CPU only, whatever is installed
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+
+    sys.path.insert(0, ROOT_DIR)
+
+    import cv2
+    import keras
+    import tensorflow as tf
+
+    threads = case["threads"]
+    cv2.setNumThreads(threads)
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                    inter_op_parallelism_threads=threads)
+    keras.backend.set_session(tf.Session(config=session_config))
+
+    import tools.classes as clss
+    from tools.classes import crack_classifier
+
+    images = generate_images(case["images"], case["height"], case["width"], seed=case["seed"])
+
+    start = time.perf_counter()
+
+    maskrcnn_model = clss.MaskRCNN({"random_weights": True,
+                                    "weights_path": None,
+                                    "batch_size": case["batch_size"],
+                                    "config_overrides": {"IMAGE_MAX_DIM": case["max_dim"],
+                                                         "IMAGE_MIN_DIM": min(800, case["max_dim"]),
+                                                         "DETECTION_MIN_CONFIDENCE": case["min_confidence"]},
+                                    "verbose": 0,
+                                    "cropping_ratio": 0.5,
+                                    "shared_mask_ratio_threshold": 30,
+                                    "only_long_crossarms": True,
+                                    "long_crossarm_w_h_ratio_threshold": 0.10})
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        model_path = save_random_classifier(os.path.join(temporary_dir, "classifier.h5"),
+                                            crack_classifier.INPUT_SIZE)
+        crack_classifier_model = clss.CrackClassifier({"model_path": model_path, "workers": threads})
+
+    startup_seconds = time.perf_counter() - start
+
+    # Warming up the classifier too (Mask-RCNN warms up in its constructor)
+    crack_classifier_model.predict_batch(generate_images(1, *crack_classifier.INPUT_SIZE[::-1]))
+
+    latencies = []
+    instances = []
+    batch_size = case["batch_size"]
+
+    # One stream over all the images, so the next batch is read and molded
+    # while the current one is predicted. The crops of each batch go to the
+    # classifier together, and the latency of a batch is the time since the
+    # previous one was done
+    start = time.perf_counter()
+    batch_start = start
+    crops = []
+
+    for i, result_manager_object in enumerate(maskrcnn_model.predict_stream(images, workers=threads)):
+
+        crops.extend(result_manager_object.get_crossarm_images())
+        instances.append(len(result_manager_object.instance_list))
+
+        if (i + 1) % batch_size == 0 or i + 1 == len(images):
+            crack_classifier_model.predict_batch(crops)
+            crops = []
+            batch_end = time.perf_counter()
+            latencies.append(batch_end - batch_start)
+            batch_start = batch_end
+
+    total_seconds = time.perf_counter() - start
+
+    results = dict(case)
+    results.update({"images_per_second": len(images) / total_seconds,
+                    "startup_seconds": startup_seconds,
+                    "mean_instances": float(np.mean(instances)),
+                    "peak_rss_kb": peak_rss_kb()})
+    for percentile in PERCENTILES:
+        results["p{}_seconds".format(percentile)] = float(np.percentile(latencies, percentile))
+
+    return results
+
+def spawn_case(case):
+
+    # Fresh process, for an independent peak RSS and TensorFlow session
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+                                     universal_newlines=True)
+
+    return json.loads(output.strip().splitlines()[-1])
+
+def parse_list(text):
+
+    return [int(value) for value in text.split(",") if value]
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_sizes", required=False, default="1,2")
+    parser.add_argument("--max_dims", required=False, default="512,1024", help="IMAGE_MAX_DIM values (multiples of 64)")
+    parser.add_argument("--threads", required=False, default="1,{}".format(os.cpu_count() or 1))
+    parser.add_argument("--images", required=False, default=8, type=int)
+    parser.add_argument("--height", required=False, default=1080, type=int)
+    parser.add_argument("--width", required=False, default=1920, type=int)
+    parser.add_argument("--min_confidence", required=False, default=0.5, type=float,
+                        help="DETECTION_MIN_CONFIDENCE, controls the number of (random) detections")
+    parser.add_argument("--seed", required=False, default=0, type=int)
+    parser.add_argument("--json", required=False, default=None)
+    parser.add_argument("--case", required=False, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: one case, printed as JSON
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case))))
+        sys.exit(0)
+
+    results = []
+
+    for batch_size, max_dim, threads in itertools.product(parse_list(args.batch_sizes),
+                                                          parse_list(args.max_dims),
+                                                          parse_list(args.threads)):
+
+        assert max_dim % 64 == 0, "IMAGE_MAX_DIM must be a multiple of 64"
+
+        case = {"batch_size": batch_size, "max_dim": max_dim, "threads": threads,
+                "images": args.images, "height": args.height, "width": args.width,
+                "min_confidence": args.min_confidence, "seed": args.seed}
+        result = spawn_case(case)
+        results.append(result)
+
+        print("batch {:2} max_dim {:5} threads {:2}   {:6.2f} img/s   p50 {:.3f} s  p95 {:.3f} s  p99 {:.3f} s"
+              "   peak RSS {:>9} KB   instances/img {:.1f}".format(
+            batch_size, max_dim, threads, result["images_per_second"], result["p50_seconds"],
+            result["p95_seconds"], result["p99_seconds"], result["peak_rss_kb"], result["mean_instances"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,5 +1,4 @@
 import cv2
-import pickle
 import numpy as np
 import imutils
 from pathlib import Path
@@ -17,6 +16,8 @@ import classes
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--image", required=True)
+parser.add_argument("--results", required=False, default=os.path.join("saved_results", "results.rle")) # see classes.ResultStore
+parser.add_argument("--instance", required=False, default=None, type=int) # Only shows this instance's mask
 args = parser.parse_args()
 
 path_object = Path(args.image)
@@ -38,16 +39,24 @@ elif path_object.is_dir(): # Directory
 	#print(directory_list)
 	image_path_list = [str(path) for path in directory_list if str(path).endswith(".JPG")]
 
+result_store = classes.ResultStore(args.results)
+
 for image_path in tqdm.tqdm(image_path_list):
 
 	image = cv2.imread(image_path)
-	
-	if sys.platform.startswith("win32"):
-		with open('saved_pickles\{}.pickle'.format(Path(image_path).stem), 'rb') as handle:
-			r = pickle.load(handle)
-	elif sys.platform.startswith("linux"):
-		with open('saved_pickles/{}.pickle'.format(Path(image_path).stem), 'rb') as handle:
-			r = pickle.load(handle)
+	image_id = Path(image_path).stem
+
+	# Decoding a single instance only
+	if args.instance is not None:
+		(y1, x1, y2, x2), mask = result_store.load_instance(image_id, args.instance)
+		crop = image[y1:y2, x1:x2].copy()
+		crop[~mask] = 0
+		cv2.imshow("Instance {}".format(args.instance), crop)
+		cv2.waitKey(0)
+		cv2.destroyAllWindows()
+		continue
+
+	r = result_store.load_results(image_id)
 		
 	result_manager = classes.ResultManager(image, r, image_path)
 	result_manager.display()
@@ -0,0 +1,211 @@
+"""
+Compares the polygon post-processing engine of ResultManager
+(dict_para["postprocess_engine"] = "polygon") with the raster one.
+
+Detections are simulated from synthetic scenes
+(tools/dataset/synthetic_crossarm_dataset.py): for every crossarm, its
+bounding box is the roi and its mask, blurred and shrunk to 28x28, plays
+the mrcnn_mask probabilities. A jittered copy of some instances is added
+to exercise the repeat check. The raster engine gets full-size masks
+unmolded with utils.unmold_mask_local, as detect() makes them (included
+in its time), and the polygon engine the 28x28 probabilities.
+
+Reported: agreement of the kept instances and repeat flags, relative
+error of the areas, differences of the min area rectangles and of the
+crops, and the time of each engine.
+
+Usage (from the root of the repository):
+
+    python tools/utilities/validate_polygon_engine.py --images=50 --height=3000 --width=4000
+"""
+
+# Common Core Library Imports
+import os
+import sys
+import json
+import time
+import argparse
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Local Imports
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "tools", "classes"))
+sys.path.append(os.path.join(ROOT_DIR, "tools", "dataset"))
+
+import result_manager
+import synthetic_crossarm_dataset
+from Mask_RCNN.mrcnn import utils
+
+#------------------------------------------------------------------
+# Constants
+
+MASK_SHAPE = (28, 28)
+
+DICT_PARA = {"cropping_ratio": 0.5,
+             "shared_mask_ratio_threshold": 30,
+             "only_long_crossarms": True,
+             "long_crossarm_w_h_ratio_threshold": 0.10}
+
+#------------------------------------------------------------------
+# Functions
+
+def simulate_detections(random_state, height, width, duplicate_fraction):
+
+    image, polygons = synthetic_crossarm_dataset.render_scene(random_state, height, width, instances=(1, 6))
+
+    rois, raw_masks = [], []
+
+    for xs, ys in polygons:
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.int32(np.column_stack([xs, ys]))], 1)
+        y1, x1, y2, x2 = utils.extract_bboxes(mask[:, :, None])[0]
+        if y2 - y1 < 2 or x2 - x1 < 2:
+            continue
+
+        copies = [(y1, x1, y2, x2)]
+        if random_state.uniform() < duplicate_fraction:
+            jitter = random_state.randint(-3, 4, 4)
+            copies.append(tuple(np.clip(np.array([y1, x1, y2, x2]) + jitter, 0, [height, width, height, width])))
+
+        for box in copies:
+            box_y1, box_x1, box_y2, box_x2 = box
+            crop = mask[box_y1:box_y2, box_x1:box_x2].astype(np.float32)
+            raw_mask = cv2.resize(crop, MASK_SHAPE[::-1], interpolation=cv2.INTER_AREA)
+            raw_masks.append(np.clip(cv2.GaussianBlur(raw_mask, (3, 3), 0), 0, 1))
+            rois.append(box)
+
+    rois = np.array(rois, dtype=np.int32).reshape(-1, 4)
+    raw_masks = np.array(raw_masks, dtype=np.float32).reshape((-1,) + MASK_SHAPE)
+
+    # Unique scores, used to match the instances of both engines
+    scores = np.linspace(0.99, 0.9, rois.shape[0]).astype(np.float32)
+    class_ids = np.ones(rois.shape[0], dtype=np.int32)
+
+    return image, {"rois": rois, "class_ids": class_ids, "scores": scores, "raw_masks": raw_masks}
+
+def unmold_masks(results, image_shape):
+
+    # Full-size masks, as made by detect() for the raster engine
+    rois = results["rois"]
+    masks = np.zeros((rois.shape[0],) + tuple(image_shape[:2]), dtype=bool)
+    for i, (y1, x1, y2, x2) in enumerate(rois):
+        utils.unmold_mask_local(results["raw_masks"][i], rois[i], out=masks[i, y1:y2, x1:x2])
+
+    return {"rois": rois, "class_ids": results["class_ids"], "scores": results["scores"],
+            "masks": np.moveaxis(masks, 0, -1)}
+
+def run_engine(engine, image, results):
+
+    dict_para = dict(DICT_PARA, postprocess_engine=engine)
+    result_manager_object = result_manager.ResultManager(dict_para)
+
+    # The time of the raster engine includes unmolding the full-size masks,
+    # which the polygon engine does not need
+    start = time.perf_counter()
+    if engine == "raster":
+        results = unmold_masks(results, image.shape)
+    result_manager_object.input(image, results, None)
+    crops = result_manager_object.get_crossarm_images()
+    duration = time.perf_counter() - start
+
+    return result_manager_object, crops, duration
+
+def compare_rects(raster_rect, polygon_rect):
+
+    # Angles of cv2.minAreaRect are only defined up to 90 degrees, with
+    # width and height swapped
+    (raster_center, raster_size, raster_angle) = raster_rect
+    (polygon_center, polygon_size, polygon_angle) = polygon_rect
+
+    angle = abs(raster_angle - polygon_angle) % 90
+    if angle > 45:
+        angle = 90 - angle
+        polygon_size = polygon_size[::-1]
+
+    return (float(np.hypot(*np.subtract(raster_center, polygon_center))),
+            float(np.max(np.abs(np.subtract(raster_size, polygon_size)))),
+            float(angle))
+
+def summarize(values):
+
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return {}
+
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+
+#------------------------------------------------------------------
+# Main Code
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", required=False, default=20, type=int)
+    parser.add_argument("--height", required=False, default=1500, type=int)
+    parser.add_argument("--width", required=False, default=2000, type=int)
+    parser.add_argument("--duplicate_fraction", required=False, default=0.3, type=float)
+    parser.add_argument("--seed", required=False, default=0, type=int)
+    parser.add_argument("--json", required=False, default=None)
+    args = parser.parse_args()
+
+    random_state = np.random.RandomState(args.seed)
+
+    detections = 0
+    kept_mismatches = 0
+    unique_mismatches = 0
+    area_errors, center_errors, size_errors, angle_errors, crop_differences = [], [], [], [], []
+    durations = {"raster": [], "polygon": []}
+
+    for _ in range(args.images):
+
+        image, results = simulate_detections(random_state, args.height, args.width, args.duplicate_fraction)
+        detections += results["rois"].shape[0]
+
+        raster, raster_crops, raster_duration = run_engine("raster", image, results)
+        polygon, polygon_crops, polygon_duration = run_engine("polygon", image, results)
+        durations["raster"].append(raster_duration)
+        durations["polygon"].append(polygon_duration)
+
+        raster_instances = {float(instance.score): instance for instance in raster.instance_list}
+        polygon_instances = {float(instance.score): instance for instance in polygon.instance_list}
+        kept_mismatches += len(set(raster_instances) ^ set(polygon_instances))
+
+        for score in set(raster_instances) & set(polygon_instances):
+
+            raster_instance, polygon_instance = raster_instances[score], polygon_instances[score]
+            unique_mismatches += raster_instance.unique != polygon_instance.unique
+
+            area_errors.append(abs(polygon_instance.mask_pixel_count - raster_instance.mask_pixel_count)
+                               / max(raster_instance.mask_pixel_count, 1))
+
+            center, size, angle = compare_rects(raster_instance.min_area_rect(), polygon_instance.min_area_rect())
+            center_errors.append(center)
+            size_errors.append(size)
+            angle_errors.append(angle)
+
+            raster_crop, polygon_crop = raster_instance.cropped_image, polygon_instance.cropped_image
+            if raster_crop.shape == polygon_crop.shape:
+                crop_differences.append(np.abs(raster_crop.astype(np.int16) - polygon_crop).mean())
+
+    report = {"images": args.images,
+              "detections": detections,
+              "kept_mismatches": kept_mismatches,
+              "unique_mismatches": unique_mismatches,
+              "crops_compared": len(crop_differences),
+              "relative_area_error": summarize(area_errors),
+              "rect_center_error_px": summarize(center_errors),
+              "rect_size_error_px": summarize(size_errors),
+              "rect_angle_error_degrees": summarize(angle_errors),
+              "crop_mean_abs_difference": summarize(crop_differences),
+              "seconds_per_image": {engine: float(np.mean(values)) for engine, values in durations.items()}}
+
+    print(json.dumps(report, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)